@@ -0,0 +1,86 @@
+"""
+Measures how long it takes to import the headless hs-fileinfo modules.
+
+Each module is imported in a fresh interpreter without Gemini credentials, and
+the benchmark fails if an import is slower than the budget or pulls in one of
+the heavy dependencies that should only load on first use.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--budget 1.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+MODULES = ['hs', 'gemini_api', 'file_report', 'job_spool', 'fileinfo_cli']
+
+HEAVY_MODULES = ['google.generativeai', 'fpdf', 'tkinter', 'pkg_resources']
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'heavy': heavy}}))
+"""
+
+
+def time_import(module, env):
+    """
+    Imports a module in a fresh interpreter.
+
+    Args:
+        module (str): The module name to import.
+        env (dict): The environment for the child process.
+
+    Returns:
+        tuple: Wall-clock seconds for the whole process, and the probe result.
+    """
+    import time
+
+    code = PROBE.format(src=SRC_DIR, module=module, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    wall = time.perf_counter() - start
+    return wall, json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Interpreter launches per module.')
+    parser.add_argument('--budget', type=float, default=1.0, help='Maximum median wall time in seconds.')
+    args = parser.parse_args()
+
+    env = {k: v for k, v in os.environ.items() if k not in ('GEMINI_API_KEY', 'GEMINI_PROJECT_ID')}
+
+    failed = False
+    for module in MODULES:
+        walls, imports, heavy = [], [], set()
+        for _ in range(args.runs):
+            wall, probe = time_import(module, env)
+            walls.append(wall)
+            imports.append(probe['elapsed'])
+            heavy.update(probe['heavy'])
+
+        wall_median = statistics.median(walls)
+        import_median = statistics.median(imports)
+        status = 'ok'
+        if wall_median > args.budget or heavy:
+            status = 'FAIL'
+            failed = True
+        print(f"{module:<14} process {wall_median * 1000:8.1f} ms  import {import_median * 1000:8.1f} ms  "
+              f"heavy={sorted(heavy) or '-'}  {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
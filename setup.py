@@ -148,6 +148,7 @@ setup(
     entry_points={
         'console_scripts': [
             'hs_fileinfo=src.fileinfo_gui:main',  # Assuming main is the function you want to execute
+            'hs_fileinfo_cli=src.fileinfo_cli:main',
         ],
     },
     classifiers=[
@@ -0,0 +1,377 @@
+import logging
+import wave
+
+# Audio frames read per chunk
+AUDIO_CHUNK_FRAMES = 65536
+
+# Pixels an image is reduced to before its statistics are computed
+IMAGE_MAX_PIXELS = 1000000
+
+# Bits kept per colour channel when finding dominant colours
+COLOR_BITS = 4
+
+# Rows profiled per chunk of a table
+ROW_CHUNK_SIZE = 4096
+
+# Distinct values tracked per column before the count is reported as a lower bound
+MAX_DISTINCT_VALUES = 1000
+
+# Amplitude below which an audio chunk counts as silent, relative to full scale
+SILENCE_THRESHOLD = 0.001
+
+
+class RunningStats:
+    """
+    Count, minimum, maximum, mean, standard deviation and RMS of numbers that
+    arrive in chunks, so large inputs never need to be held in memory at once.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def update(self, values):
+        """
+        Adds a chunk of values: a NumPy array or any sequence of numbers. NaNs are skipped.
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return
+        self.count += values.size
+        self.total += float(values.sum())
+        self.total_squares += float(np.dot(values, values))
+        low, high = float(values.min()), float(values.max())
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def result(self):
+        """
+        Returns the statistics as a dict. Values are None when no number was seen.
+        """
+        if not self.count:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None, 'rms': None}
+        mean = self.total / self.count
+        variance = max(self.total_squares / self.count - mean * mean, 0.0)
+        return {'count': self.count, 'min': self.minimum, 'max': self.maximum, 'mean': mean,
+                'std': variance ** 0.5, 'rms': (self.total_squares / self.count) ** 0.5}
+
+
+def array_stats(chunks):
+    """
+    Computes count, min, max, mean, std and RMS over an array or an iterable of chunks.
+
+    Args:
+        chunks: A NumPy array, a sequence of numbers, or an iterable of such chunks.
+
+    Returns:
+        dict: The statistics from RunningStats.result.
+    """
+    import numpy as np
+
+    stats = RunningStats()
+    if isinstance(chunks, np.ndarray) or (isinstance(chunks, (list, tuple)) and
+                                          all(isinstance(value, (int, float)) for value in chunks)):
+        stats.update(chunks)
+    else:
+        for chunk in chunks:
+            stats.update(chunk)
+    return stats.result()
+
+
+def histogram(chunks, bins=16, value_range=None):
+    """
+    Counts values in equal-width bins over an array or an iterable of chunks.
+
+    Args:
+        chunks: A NumPy array, a sequence of numbers, or an iterable of such chunks.
+        bins (int): Number of bins.
+        value_range (tuple): ``(low, high)`` of the bins. Taken from the data when
+            omitted, which needs a second pass and so is only possible for values
+            held in memory; required for a one-pass iterator such as a generator.
+
+    Returns:
+        dict: 'edges' (bins + 1 floats) and 'counts' (bins ints).
+    """
+    import numpy as np
+
+    if isinstance(chunks, np.ndarray) or (isinstance(chunks, (list, tuple)) and
+                                          all(isinstance(value, (int, float)) for value in chunks)):
+        chunks = [np.asarray(chunks, dtype=np.float64)]
+    if value_range is None:
+        if iter(chunks) is chunks:
+            raise ValueError("value_range is required when values come from a one-pass iterator")
+        stats = RunningStats()
+        for chunk in chunks:
+            stats.update(chunk)
+        value_range = (stats.minimum, stats.maximum) if stats.count else (0.0, 1.0)
+    counts = np.zeros(bins, dtype=np.int64)
+    edges = np.linspace(value_range[0], value_range[1], bins + 1)
+    for chunk in chunks:
+        chunk_counts, _ = np.histogram(np.asarray(chunk, dtype=np.float64), bins=edges)
+        counts += chunk_counts
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+
+def wave_chunks(file_path, chunk_frames):
+    """
+    Yields (frames, channels) float32 arrays scaled to [-1, 1] from a PCM WAV file.
+    """
+    import numpy as np
+
+    with wave.open(file_path, 'rb') as stream:
+        channels, width = stream.getnchannels(), stream.getsampwidth()
+        while True:
+            data = stream.readframes(chunk_frames)
+            if not data:
+                return
+            if width == 1:
+                samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+            elif width == 3:
+                raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+                samples = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)).astype(np.int32)
+                samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples).astype(np.float32) / (1 << 23)
+            else:
+                dtype = {2: np.int16, 4: np.int32}[width]
+                samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+            yield samples.reshape(-1, channels)
+
+
+def audio_stats(file_path, chunk_frames=AUDIO_CHUNK_FRAMES):
+    """
+    Computes the duration and loudness of an audio file, reading it in chunks.
+
+    WAV files are read with the standard library; other formats need the
+    soundfile library.
+
+    Args:
+        file_path (str): The audio file.
+        chunk_frames (int): Frames read per chunk.
+
+    Returns:
+        dict: 'duration_seconds', 'sample_rate', 'channels', 'frames', 'rms', 'peak',
+        'rms_dbfs', 'peak_dbfs' and 'silent_ratio' (share of chunks below SILENCE_THRESHOLD).
+    """
+    import numpy as np
+
+    try:
+        with wave.open(file_path, 'rb') as stream:
+            sample_rate, channels = stream.getframerate(), stream.getnchannels()
+        chunks = wave_chunks(file_path, chunk_frames)
+    except (wave.Error, EOFError):
+        try:
+            import soundfile
+        except ImportError:
+            raise ValueError(f"Reading {file_path} needs the soundfile library") from None
+        info = soundfile.info(file_path)
+        sample_rate, channels = info.samplerate, info.channels
+        chunks = soundfile.blocks(file_path, blocksize=chunk_frames, dtype='float32', always_2d=True)
+
+    frames = 0
+    total_squares = 0.0
+    peak = 0.0
+    silent = 0
+    chunk_count = 0
+    for chunk in chunks:
+        frames += len(chunk)
+        chunk_count += 1
+        squares = float(np.einsum('ij,ij->', chunk, chunk, dtype=np.float64))
+        total_squares += squares
+        chunk_peak = float(np.abs(chunk).max()) if chunk.size else 0.0
+        peak = max(peak, chunk_peak)
+        if chunk.size and (squares / chunk.size) ** 0.5 < SILENCE_THRESHOLD:
+            silent += 1
+
+    rms = (total_squares / (frames * channels)) ** 0.5 if frames else 0.0
+    return {
+        'duration_seconds': frames / sample_rate if sample_rate else None,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'frames': frames,
+        'rms': rms,
+        'peak': peak,
+        'rms_dbfs': 20 * np.log10(rms) if rms > 0 else None,
+        'peak_dbfs': 20 * np.log10(peak) if peak > 0 else None,
+        'silent_ratio': silent / chunk_count if chunk_count else None,
+    }
+
+
+def image_stats(file_path, colors=5, max_pixels=IMAGE_MAX_PIXELS):
+    """
+    Computes colour statistics and the dominant colours of an image. Large images
+    are reduced to about max_pixels first, so memory use stays bounded.
+
+    Args:
+        file_path (str): The image file.
+        colors (int): Number of dominant colours returned.
+        max_pixels (int): Pixels the image is reduced to before analysis.
+
+    Returns:
+        dict: 'width', 'height', 'mode', per-channel 'channel_means' and
+        'channel_stds' (R, G, B), 'brightness' (0-255 mean luminance), a 16-bin
+        'luminance_histogram' and 'dominant_colors', a list of ``{'color': '#rrggbb',
+        'share': float}`` sorted by share.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        width, height, mode = image.width, image.height, image.mode
+        if width * height > max_pixels:
+            scale = (max_pixels / (width * height)) ** 0.5
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            # draft lets JPEG decoding skip detail it would throw away
+            image.draft('RGB', size)
+            image = image.resize(size)
+        pixels = np.asarray(image.convert('RGB'), dtype=np.uint8).reshape(-1, 3)
+
+    values = pixels.astype(np.float32)
+    luminance = values @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    counts, _ = np.histogram(luminance, bins=16, range=(0, 256))
+
+    # Colours are binned to COLOR_BITS per channel and reported at the centre of their bin
+    shift = 8 - COLOR_BITS
+    quantized = (pixels >> shift).astype(np.int32)
+    codes = (quantized[:, 0] << (2 * COLOR_BITS)) | (quantized[:, 1] << COLOR_BITS) | quantized[:, 2]
+    code_counts = np.bincount(codes, minlength=1 << (3 * COLOR_BITS))
+    top = np.argsort(code_counts)[::-1][:colors]
+    mask = (1 << COLOR_BITS) - 1
+    dominant = []
+    for code in top:
+        if not code_counts[code]:
+            break
+        channels = [(((int(code) >> bits) & mask) << shift) + (1 << shift) // 2 for bits in (2 * COLOR_BITS, COLOR_BITS, 0)]
+        dominant.append({'color': '#{:02x}{:02x}{:02x}'.format(*channels),
+                         'share': float(code_counts[code] / len(codes))})
+
+    return {
+        'width': width,
+        'height': height,
+        'mode': mode,
+        'channel_means': values.mean(axis=0).tolist(),
+        'channel_stds': values.std(axis=0).tolist(),
+        'brightness': float(luminance.mean()) if luminance.size else None,
+        'luminance_histogram': counts.tolist(),
+        'dominant_colors': dominant,
+    }
+
+
+def as_number(value):
+    """
+    Returns a table value as a finite float, parsing numeric strings such as those
+    from csv.reader, or None if it is not a number.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+    elif not isinstance(value, (int, float)):
+        return None
+    value = float(value)
+    return value if value - value == 0 else None
+
+
+class ColumnProfile:
+    """
+    Profile of one table column, built from chunks of its values.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.empty = 0
+        self.numbers = RunningStats()
+        self.text_lengths = RunningStats()
+        self.distinct = set()
+        self.distinct_capped = False
+
+    def update(self, values):
+        import numpy as np
+
+        self.count += len(values)
+        present = [value for value in values if value is not None and value != '']
+        self.empty += len(values) - len(present)
+        numeric = np.fromiter((number for number in map(as_number, present) if number is not None), dtype=np.float64)
+        self.numbers.update(numeric)
+        texts = [value for value in present if isinstance(value, str)]
+        if texts:
+            self.text_lengths.update(np.fromiter(map(len, texts), dtype=np.float64, count=len(texts)))
+        if not self.distinct_capped:
+            self.distinct.update(value if isinstance(value, (int, float, str, bool)) else str(value)
+                                 for value in present)
+            if len(self.distinct) > MAX_DISTINCT_VALUES:
+                self.distinct_capped = True
+                self.distinct = set()
+
+    def result(self):
+        numbers = self.numbers.result()
+        return {
+            'name': self.name,
+            'count': self.count,
+            'empty': self.empty,
+            'numeric': numbers['count'],
+            'numeric_stats': numbers if numbers['count'] else None,
+            'mean_text_length': self.text_lengths.result()['mean'],
+            'distinct': f'>{MAX_DISTINCT_VALUES}' if self.distinct_capped else len(self.distinct),
+        }
+
+
+def column_profiles(rows, header=True, max_rows=None, chunk_size=ROW_CHUNK_SIZE):
+    """
+    Profiles the columns of a table given as rows, in chunks.
+
+    Works with any iterable of rows, such as ``csv.reader(file)`` or an openpyxl
+    sheet's ``iter_rows(values_only=True)``.
+
+    Args:
+        rows: An iterable of row sequences.
+        header (bool): True if the first row holds the column names.
+        max_rows (int): Optional number of data rows after which profiling stops.
+        chunk_size (int): Rows profiled per chunk.
+
+    Returns:
+        dict: 'rows' (data rows read), 'truncated' (True if max_rows stopped it) and
+        'columns', one profile per column with 'count', 'empty', 'numeric',
+        'numeric_stats', 'mean_text_length' and 'distinct'.
+    """
+    rows = iter(rows)
+    names = None
+    if header:
+        first = next(rows, None)
+        names = [str(name) if name is not None else f'column_{i + 1}' for i, name in enumerate(first or [])]
+    profiles = []
+    read = 0
+    truncated = False
+    chunk = []
+
+    def flush():
+        width = max(len(row) for row in chunk)
+        while len(profiles) < width:
+            index = len(profiles)
+            profiles.append(ColumnProfile(names[index] if names and index < len(names) else f'column_{index + 1}'))
+        for index, profile in enumerate(profiles):
+            profile.update([row[index] if index < len(row) else None for row in chunk])
+        chunk.clear()
+
+    for row in rows:
+        if max_rows is not None and read >= max_rows:
+            truncated = True
+            break
+        chunk.append(tuple(row))
+        read += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    if names and not profiles:
+        profiles = [ColumnProfile(name) for name in names]
+    logging.debug(f"Profiled {read} rows in {len(profiles)} columns")
+    return {'rows': read, 'truncated': truncated, 'columns': [profile.result() for profile in profiles]}
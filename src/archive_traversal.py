@@ -0,0 +1,398 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Nesting levels of archives inside archives that are opened
+MAX_DEPTH = 3
+
+# Members analyzed per file, across all nesting levels
+MAX_MEMBERS = 2000
+
+# Uncompressed to compressed size ratio above which a member is treated as a decompression bomb
+MAX_COMPRESSION_RATIO = 100
+
+# Uncompressed bytes read per file, across all members
+MAX_TOTAL_BYTES = 1024 * 2 ** 20
+
+# Largest nested ZIP opened; ZIP needs random access, so it is copied out first, while TAR is streamed
+MAX_NESTED_ZIP_BYTES = 64 * 2 ** 20
+
+# Bytes of a nested ZIP copy kept in memory before it moves to a temporary file
+NESTED_ZIP_MEMORY_BYTES = 2 ** 20
+
+# Text kept per member and in the merged record
+MEMBER_TEXT_LENGTH = 1000
+TEXT_SAMPLE_LENGTH = 4000
+
+# Members listed by name in the merged record
+LISTED_MEMBERS = 50
+
+READ_SIZE = 64 * 1024
+
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Leading bytes of common formats, for members whose name has no usable extension
+MAGIC_NUMBERS = [
+    (b'%PDF', '.pdf'), (b'\x89PNG', '.png'), (b'\xff\xd8\xff', '.jpg'), (b'GIF8', '.gif'),
+    (b'PK\x03\x04', '.zip'), (b'\x1f\x8b', '.gz'), (b'BZh', '.bz2'), (b'\xfd7zXZ', '.xz'),
+    (b'<?xml', '.xml'), (b'{', '.json'),
+]
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.tsv', '.json', '.xml', '.html', '.htm', '.yaml', '.yml',
+                   '.ini', '.cfg', '.py', '.js', '.rels', '.log'}
+
+XML_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def is_tar_name(name):
+    return name.lower().endswith(TAR_EXTENSIONS)
+
+
+def is_archive(file_path):
+    """
+    Returns True if the file is a ZIP container (including DOCX, XLSX and JAR) or a TAR archive.
+    """
+    try:
+        return zipfile.is_zipfile(file_path) or (is_tar_name(file_path) and tarfile.is_tarfile(file_path))
+    except OSError:
+        return False
+
+
+def detect_member_type(name, head):
+    """
+    Returns the type of an archive member as an extension, from its name or its
+    first bytes.
+
+    Args:
+        name (str): The member name.
+        head (bytes): The first bytes of the member.
+    """
+    if is_tar_name(name):
+        return '.tar'
+    extension = os.path.splitext(name)[1].lower()
+    if extension:
+        return extension
+    for magic, magic_extension in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return magic_extension
+    return 'unknown'
+
+
+def member_text(member_type, data):
+    """
+    Returns a text sample of a text or XML member, or None for binary members.
+    """
+    if member_type not in TEXT_EXTENSIONS and not (mimetypes.guess_type(f'file{member_type}')[0] or '').startswith('text/'):
+        return None
+    if b'\x00' in data[:1024]:
+        return None
+    text = data.decode('utf-8', errors='replace')
+    if member_type in ('.xml', '.html', '.htm', '.rels'):
+        text = XML_TAG_PATTERN.sub(' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text[:MEMBER_TEXT_LENGTH] or None
+
+
+class ArchiveTraversal:
+    """
+    Walks a ZIP or TAR file and the archives nested in it, streaming each member
+    without writing it to disk.
+
+    Members are type-detected, hashed and sampled for text in parallel. Traversal
+    stops at max_depth nested levels and max_members members, and members whose
+    decompression ratio exceeds max_ratio are skipped.
+
+    Attributes:
+        skipped (list): ``(name, reason)`` pairs of members that were not analyzed.
+    """
+
+    def __init__(self, max_depth=MAX_DEPTH, max_members=MAX_MEMBERS, max_ratio=MAX_COMPRESSION_RATIO,
+                 max_total_bytes=MAX_TOTAL_BYTES, max_workers=None, cancel_event=None):
+        """
+        Initializes the traversal.
+
+        Args:
+            max_depth (int): Nesting levels of archives that are opened.
+            max_members (int): Members analyzed in total.
+            max_ratio (float): Largest allowed uncompressed to compressed size ratio.
+            max_total_bytes (int): Uncompressed bytes read in total.
+            max_workers (int): Threads analyzing ZIP members. Defaults to min(8, CPU count).
+            cancel_event (threading.Event): Optional event that stops the traversal.
+        """
+        self.max_depth = max_depth
+        self.max_members = max_members
+        self.max_ratio = max_ratio
+        self.max_total_bytes = max_total_bytes
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.cancel_event = cancel_event
+        self.lock = threading.Lock()
+        self.member_count = 0
+        self.total_bytes = 0
+        self.skipped = []
+
+    def run(self, file_path):
+        """
+        Analyzes every member of an archive.
+
+        Args:
+            file_path (str): The archive.
+
+        Returns:
+            list: One dict per member with 'name', 'type', 'size', 'sha256' and,
+            for text members, 'text'. Names of nested members are prefixed with
+            the path of their archive.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='archive') as executor:
+            if zipfile.is_zipfile(file_path):
+                with zipfile.ZipFile(file_path) as archive:
+                    return self.walk_zip(archive, '', 1, executor)
+            with open(file_path, 'rb') as file:
+                return self.walk_tar(file, '', 1, os.path.getsize(file_path))
+
+    def stopped(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def reserve_member(self, name):
+        with self.lock:
+            if self.member_count >= self.max_members:
+                if not any(reason == 'member limit' for _, reason in self.skipped):
+                    self.skipped.append((name, 'member limit'))
+                return False
+            self.member_count += 1
+            return True
+
+    def skip(self, name, reason):
+        with self.lock:
+            self.skipped.append((name, reason))
+
+    def walk_zip(self, archive, prefix, depth, executor=None):
+        """
+        Analyzes the members of an open ZIP file, in parallel if an executor is given.
+        """
+        entries = []
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            name = prefix + info.filename
+            if self.stopped() or not self.reserve_member(name):
+                break
+            if info.file_size > self.max_ratio * max(info.compress_size, 1) and info.file_size > READ_SIZE:
+                self.skip(name, f"compression ratio {info.file_size / max(info.compress_size, 1):.0f}")
+                continue
+            entries.append((info, name))
+
+        def analyze_entry(entry):
+            info, name = entry
+            try:
+                with archive.open(info) as stream:
+                    return self.analyze(name, stream, max(info.compress_size, 1), depth)
+            except (RuntimeError, NotImplementedError, OSError, zipfile.BadZipFile, zlib.error) as e:
+                # Encrypted members and unsupported compression methods
+                return [{'name': name, 'type': detect_member_type(name, b''), 'size': info.file_size,
+                         'sha256': None, 'error': str(e)}]
+
+        if executor is not None:
+            results = list(executor.map(analyze_entry, entries))
+        else:
+            results = [analyze_entry(entry) for entry in entries]
+        return [member for members in results for member in members]
+
+    def walk_tar(self, fileobj, prefix, depth, compressed_size):
+        """
+        Analyzes the members of a TAR stream in order. Compressed TAR files cannot
+        be read at random, so their members are analyzed one after another.
+        """
+        members = []
+        start_bytes = self.total_bytes
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                name = prefix + info.name
+                if self.stopped() or not self.reserve_member(name):
+                    break
+                if self.total_bytes - start_bytes + info.size > self.max_ratio * max(compressed_size, 1) + READ_SIZE:
+                    self.skip(name, "compression ratio of the archive")
+                    break
+                stream = archive.extractfile(info)
+                if stream is not None:
+                    members.extend(self.analyze(name, stream, max(info.size, 1), depth))
+        return members
+
+    def read_limited(self, name, stream, compressed_size, copy_zip=True):
+        """
+        Reads a member in chunks, hashing it. The start of the member is kept for
+        type detection and text. Nested ZIP files up to MAX_NESTED_ZIP_BYTES are
+        copied whole to a spooled temporary file, which holds at most
+        NESTED_ZIP_MEMORY_BYTES in memory, so parallel members do not each buffer
+        a whole archive.
+
+        Args:
+            copy_zip (bool): False to skip the copy, for ZIP files past the depth limit.
+
+        Returns:
+            tuple: The SHA-256 digest, the bytes kept, the size read, whether
+            reading stopped at a limit, and the copy of a nested ZIP (or None),
+            which the caller must close.
+        """
+        digest = hashlib.sha256()
+        kept = bytearray()
+        keep_limit = MEMBER_TEXT_LENGTH * 4
+        copy = None
+        size = 0
+        try:
+            while True:
+                chunk = stream.read(READ_SIZE)
+                if not chunk:
+                    return digest.hexdigest(), bytes(kept), size, False, copy
+                if size == 0 and copy_zip and chunk.startswith(b'PK\x03\x04'):
+                    copy = tempfile.SpooledTemporaryFile(max_size=NESTED_ZIP_MEMORY_BYTES)
+                size += len(chunk)
+                digest.update(chunk)
+                if len(kept) < keep_limit:
+                    kept.extend(chunk[:keep_limit - len(kept)])
+                if copy is not None and size > MAX_NESTED_ZIP_BYTES:
+                    copy.close()
+                    copy = None
+                if copy is not None:
+                    copy.write(chunk)
+                with self.lock:
+                    self.total_bytes += len(chunk)
+                    over_total = self.total_bytes > self.max_total_bytes
+                if size > self.max_ratio * compressed_size + READ_SIZE:
+                    self.skip(name, "decompressed size exceeds the ratio limit")
+                    return digest.hexdigest(), bytes(kept), size, True, copy
+                if over_total:
+                    self.skip(name, "total size limit")
+                    return digest.hexdigest(), bytes(kept), size, True, copy
+        except BaseException:
+            if copy is not None:
+                copy.close()
+            raise
+
+    def analyze(self, name, stream, compressed_size, depth):
+        """
+        Analyzes one member and, for nested archives within the depth limit, its members.
+
+        Returns:
+            list: The member's dict followed by those of its nested members.
+        """
+        if self.stopped():
+            return []
+        member_type = detect_member_type(name, b'')
+        if member_type == '.tar' and depth < self.max_depth:
+            member = {'name': name, 'type': member_type, 'size': None, 'sha256': None}
+            try:
+                nested = self.walk_tar(stream, f'{name}/', depth + 1, compressed_size)
+            except (tarfile.TarError, OSError, EOFError) as e:
+                member['error'] = str(e)
+                nested = []
+            member['members'] = len(nested)
+            return [member] + nested
+        if member_type == '.tar':
+            self.skip(name, "depth limit")
+
+        try:
+            digest, data, size, truncated, copy = self.read_limited(name, stream, compressed_size,
+                                                                    copy_zip=depth < self.max_depth)
+        except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, zlib.error) as e:
+            return [{'name': name, 'type': member_type, 'size': None, 'sha256': None, 'error': str(e)}]
+        if copy is not None and truncated:
+            copy.close()
+            copy = None
+
+        if member_type == 'unknown':
+            member_type = detect_member_type(name, data[:512])
+        member = {'name': name, 'type': member_type, 'size': size, 'sha256': None if truncated else digest}
+        text = member_text(member_type, data[:MEMBER_TEXT_LENGTH * 4])
+        if text:
+            member['text'] = text
+
+        nested = []
+        if copy is not None:
+            with copy:
+                try:
+                    with zipfile.ZipFile(copy) as archive:
+                        nested = self.walk_zip(archive, f'{name}/', depth + 1)
+                except zipfile.BadZipFile as e:
+                    member['error'] = str(e)
+            member['members'] = len(nested)
+        elif not truncated and data.startswith(b'PK\x03\x04') and depth >= self.max_depth:
+            self.skip(name, "depth limit")
+        return [member] + nested
+
+
+def summarize_archive(members, skipped):
+    """
+    Combines member results into entries for the parent record.
+
+    Args:
+        members (list): Member dicts from ArchiveTraversal.run.
+        skipped (list): ``(name, reason)`` pairs from the traversal.
+
+    Returns:
+        dict: Keys prefixed with 'archive_' to merge into the extractor result.
+    """
+    types = {}
+    for member in members:
+        types[member['type']] = types.get(member['type'], 0) + 1
+    listed = [f"{member['name']} ({member['type']}, {member['size'] if member['size'] is not None else '?'} bytes)"
+              for member in members[:LISTED_MEMBERS]]
+    if len(members) > LISTED_MEMBERS:
+        listed.append(f"... {len(members) - LISTED_MEMBERS} more")
+
+    text_parts = []
+    length = 0
+    for member in members:
+        if 'text' in member and length < TEXT_SAMPLE_LENGTH:
+            part = f"[{member['name']}] {member['text']}"
+            text_parts.append(part[:TEXT_SAMPLE_LENGTH - length])
+            length += len(text_parts[-1])
+
+    summary = {
+        'archive_member_count': len(members),
+        'archive_uncompressed_size': sum(member['size'] or 0 for member in members if 'members' not in member),
+        'archive_member_types': ', '.join(f'{member_type}: {count}' for member_type, count in
+                                          sorted(types.items(), key=lambda item: -item[1])),
+        'archive_members': listed,
+        'archive_nested_archives': sum(1 for member in members if 'members' in member),
+    }
+    if text_parts:
+        summary['archive_text_sample'] = "\n".join(text_parts)
+    if skipped:
+        summary['archive_skipped'] = [f"{name}: {reason}" for name, reason in skipped[:LISTED_MEMBERS]]
+    errors = [f"{member['name']}: {member['error']}" for member in members if 'error' in member]
+    if errors:
+        summary['archive_member_errors'] = errors[:LISTED_MEMBERS]
+    return summary
+
+
+def archive_info(file_path, cancel_event=None):
+    """
+    Traverses an archive and returns the entries to merge into its extractor result.
+
+    Args:
+        file_path (str): The archive.
+        cancel_event (threading.Event): Optional event that stops the traversal.
+
+    Returns:
+        dict: The summary from summarize_archive, or {'archive_error': ...} if the
+        archive cannot be read.
+    """
+    traversal = ArchiveTraversal(cancel_event=cancel_event)
+    try:
+        members = traversal.run(file_path)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, RuntimeError) as e:
+        logging.warning(f"Could not traverse archive {file_path}: {e}")
+        return {'archive_error': str(e)}
+    logging.info(f"Traversed {len(members)} archive members of {file_path} "
+                 f"({len(traversal.skipped)} skipped)")
+    return summarize_archive(members, traversal.skipped)
@@ -0,0 +1,26 @@
+import os
+import threading
+
+
+def default_cache_dir():
+    """
+    Returns the directory for persistent hs-fileinfo caches.
+
+    Uses HS_FILEINFO_CACHE_DIR if set, else ~/.cache/hs_fileinfo.
+    """
+    return os.getenv('HS_FILEINFO_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'hs_fileinfo')
+
+
+def write_atomic(path, data):
+    """
+    Writes bytes to a file through a temporary file and a rename, so readers
+    never see a partial file.
+
+    Args:
+        path (str): The destination path.
+        data (bytes): The content to write.
+    """
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
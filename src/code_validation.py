@@ -0,0 +1,400 @@
+import ast
+import codeop
+import re
+import textwrap
+import warnings
+
+METHOD_NAME = 'read_file_info'
+
+# Matches a Markdown code fence with an optional language tag
+FENCE_PATTERN = re.compile(r'^[ \t]*```[ \t]*([\w+-]*)[ \t]*\n(.*?)^[ \t]*```[ \t]*$', re.DOTALL | re.MULTILINE)
+
+# Lines that can start a module of method logic
+CODE_START_PATTERN = re.compile(r'^(def |async def |import |from |@|class )')
+
+# Top-level lines that continue a compound statement and do not compile on their own
+CONTINUATION_PATTERN = re.compile(r'^(except\b|else\s*:|elif\b|finally\s*:|case\b)')
+
+# Calls that run shells, evaluate code, delete files, read stdin or stop the process
+FORBIDDEN_CALLS = {
+    'eval', 'exec', 'compile', 'input', 'exit', 'quit', 'breakpoint',
+    'os.system', 'os.popen', 'os.remove', 'os.unlink', 'os.rmdir', 'os.removedirs',
+    'os.kill', 'os.fork', 'os._exit', 'os.execv', 'os.execve', 'os.spawnl',
+    'shutil.rmtree', 'shutil.move', 'sys.exit',
+    'subprocess.run', 'subprocess.call', 'subprocess.check_call', 'subprocess.check_output', 'subprocess.Popen',
+}
+
+# Modules whose import means the extractor reaches outside the file it reads
+FORBIDDEN_IMPORTS = {'subprocess', 'socket', 'requests', 'urllib.request', 'http.client', 'selenium', 'ctypes'}
+
+# Calls that only slow down extraction
+SLOW_CALLS = {'time.sleep'}
+
+
+class CodeValidationError(ValueError):
+    """Raised when generated method code cannot be used, with the list of problems found."""
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        super().__init__("; ".join(self.problems))
+
+
+def strip_markdown_fences(text):
+    """
+    Extracts the code from a model answer that may wrap it in Markdown fences.
+
+    If the answer holds several fenced blocks, the one defining read_file_info
+    is used, or else the longest.
+
+    Args:
+        text (str): The raw model answer.
+
+    Returns:
+        str: The code without fences.
+    """
+    blocks = [match.group(2) for match in FENCE_PATTERN.finditer(text)]
+    if blocks:
+        with_method = [block for block in blocks if f'def {METHOD_NAME}' in block]
+        return max(with_method or blocks, key=len)
+
+    # Unterminated or stray fences, and a bare language tag on the first line
+    lines = [line for line in text.splitlines() if not line.strip().startswith('```')]
+    if lines and lines[0].strip().lower() in ('python', 'py', 'python3'):
+        lines = lines[1:]
+    return "\n".join(lines)
+
+
+def trim_prose(code):
+    """
+    Drops explanation lines before the first line of code and after the last
+    indented line of the method.
+
+    Args:
+        code (str): Dedented code that may be surrounded by prose.
+
+    Returns:
+        str: The trimmed code.
+    """
+    lines = code.splitlines()
+    start = next((i for i, line in enumerate(lines) if CODE_START_PATTERN.match(line)), 0)
+    lines = lines[start:]
+
+    end = len(lines)
+    while end > 0:
+        line = lines[end - 1]
+        if not line.strip() or line[0] in ' \t' or line.startswith(')') or CODE_START_PATTERN.match(line):
+            break
+        end -= 1
+    return "\n".join(lines[:end])
+
+
+def call_name(node):
+    """
+    Returns the dotted name of a call target, such as ``os.system``, or None.
+
+    Args:
+        node (ast.AST): The ``func`` of an ast.Call.
+    """
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return ".".join(reversed(parts))
+    return None
+
+
+def has_break(loop):
+    """
+    Returns True if a loop body can leave the loop through break, return or raise.
+
+    Args:
+        loop (ast.While): The loop to check.
+    """
+    for node in ast.walk(loop):
+        if node is loop:
+            continue
+        if isinstance(node, (ast.Break, ast.Return, ast.Raise)):
+            return True
+    return False
+
+
+def is_installed(module):
+    """
+    Returns True if the top-level package of a module can be imported here, so
+    code importing a missing library is rejected before it runs.
+    """
+    from extractor_libraries import is_importable
+
+    return is_importable(module.split('.')[0])
+
+
+def guarded_imports(tree):
+    """
+    Returns the import nodes inside try blocks that handle ImportError, which
+    extractors use for optional libraries.
+    """
+    guarded = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Try):
+            continue
+        caught = set()
+        for handler in node.handlers:
+            types = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+            caught.update(call_name(item) if item is not None else 'Exception' for item in types)
+        if caught & {'ImportError', 'ModuleNotFoundError', 'Exception', 'BaseException'}:
+            for statement in node.body:
+                guarded.update(id(child) for child in ast.walk(statement)
+                               if isinstance(child, (ast.Import, ast.ImportFrom)))
+    return guarded
+
+
+def find_problems(tree):
+    """
+    Checks a parsed module of method logic.
+
+    Args:
+        tree (ast.Module): The parsed code.
+
+    Returns:
+        list: Problems that make the code unusable. Empty if the code is acceptable.
+    """
+    problems = []
+
+    methods = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == METHOD_NAME]
+    if not methods:
+        problems.append(f"No top-level function named '{METHOD_NAME}' is defined.")
+    else:
+        arguments = methods[-1].args
+        positional = arguments.posonlyargs + arguments.args
+        required = len(positional) - len(arguments.defaults)
+        if required != 1 or arguments.kwonlyargs and len(arguments.kw_defaults) != len(arguments.kwonlyargs):
+            problems.append(f"'{METHOD_NAME}' must take exactly one required argument (the instance).")
+
+    guarded = guarded_imports(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            name = call_name(node.func)
+            if name in FORBIDDEN_CALLS:
+                problems.append(f"Forbidden call to {name}() on line {node.lineno}.")
+            elif name in SLOW_CALLS:
+                problems.append(f"Call to {name}() on line {node.lineno} only slows down extraction.")
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name in FORBIDDEN_IMPORTS or alias.name.split('.')[0] in FORBIDDEN_IMPORTS:
+                    problems.append(f"Forbidden import of {alias.name} on line {node.lineno}.")
+                elif id(node) not in guarded and not is_installed(alias.name):
+                    problems.append(f"Module {alias.name} on line {node.lineno} is not installed.")
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            if module in FORBIDDEN_IMPORTS or module.split('.')[0] in FORBIDDEN_IMPORTS:
+                problems.append(f"Forbidden import from {module} on line {node.lineno}.")
+            elif module and not node.level and id(node) not in guarded and not is_installed(module):
+                problems.append(f"Module {module} on line {node.lineno} is not installed.")
+        elif isinstance(node, ast.While):
+            if isinstance(node.test, ast.Constant) and node.test.value and not has_break(node):
+                problems.append(f"Unbounded 'while' loop without break on line {node.lineno}.")
+
+    return problems
+
+
+def drop_top_level_statements(code, tree):
+    """
+    Removes top-level statements other than imports, definitions, assignments,
+    docstrings and try blocks around imports, such as example calls the model
+    appended after the method.
+
+    Args:
+        code (str): The code that was parsed.
+        tree (ast.Module): The parsed code. Modified in place.
+
+    Returns:
+        str: The code without the removed statements.
+    """
+    allowed = (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Assign,
+               ast.AnnAssign)
+    removed_lines = set()
+    kept = []
+    for node in tree.body:
+        is_docstring = isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+        is_import_guard = isinstance(node, ast.Try) and any(isinstance(child, (ast.Import, ast.ImportFrom))
+                                                             for child in ast.walk(node))
+        if isinstance(node, allowed) or is_docstring or is_import_guard:
+            kept.append(node)
+        else:
+            removed_lines.update(range(node.lineno, node.end_lineno + 1))
+
+    if not removed_lines:
+        return code
+    tree.body = kept
+    lines = code.splitlines()
+    return "\n".join(line for number, line in enumerate(lines, start=1) if number not in removed_lines).strip()
+
+
+def prepare_method_code(raw_code):
+    """
+    Cleans, checks and if possible repairs generated method code before it is
+    written to disk and imported.
+
+    Markdown fences, surrounding prose and stray top-level statements are removed.
+    The result must parse, define ``read_file_info(instance)``, and avoid shell,
+    eval, delete, network and unbounded-loop constructs.
+
+    Args:
+        raw_code (str): The method code returned by the model.
+
+    Returns:
+        str: The code to write to the method logic module.
+
+    Raises:
+        CodeValidationError: If the code cannot be used.
+    """
+    if not raw_code or not raw_code.strip():
+        raise CodeValidationError(["The model returned no code."])
+
+    code = textwrap.dedent(strip_markdown_fences(raw_code)).strip()
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        code = trim_prose(code)
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            raise CodeValidationError([f"Syntax error on line {e.lineno}: {e.msg}."])
+
+    code = drop_top_level_statements(code, tree)
+
+    problems = find_problems(tree)
+    if problems:
+        raise CodeValidationError(problems)
+
+    return code + "\n"
+
+
+class StreamAborted(CodeValidationError):
+    """Raised while streaming when the answer is clearly not usable Python code."""
+
+
+def is_prose(line):
+    """
+    Returns True if a top-level line of an unfenced answer cannot be Python:
+    it neither compiles on its own, nor opens a block, nor continues one.
+
+    Args:
+        line (str): A line that starts at column 0.
+    """
+    if CODE_START_PATTERN.match(line) or CONTINUATION_PATTERN.match(line):
+        return False
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            codeop.compile_command(line, '<answer>', 'exec')
+        except (SyntaxError, ValueError, OverflowError):
+            return True
+    return False
+
+
+class CodeStreamParser:
+    """
+    Parses a streamed model answer line by line to find out as early as possible
+    whether it holds usable method code.
+
+    The parser reports the answer as complete once a fenced code block closes or
+    unfenced code is followed by prose, so the rest of the stream can be dropped.
+    It raises StreamAborted when too many lines of prose arrive before any code,
+    or when a finished top-level block of code does not parse.
+
+    Attributes:
+        text (str): Everything received so far.
+        complete (bool): True once the code part of the answer has ended.
+    """
+
+    def __init__(self, max_prose_lines=6):
+        """
+        Initializes the parser.
+
+        Args:
+            max_prose_lines (int): Lines of prose allowed before the code starts.
+        """
+        self.max_prose_lines = max_prose_lines
+        self.text = ""
+        self.complete = False
+        self.state = 'preamble'
+        self.prose_lines = 0
+        self.code_lines = []
+        self.pending = ""
+        self.in_decorator = False
+
+    def feed(self, chunk):
+        """
+        Adds a streamed chunk and checks the lines it completes.
+
+        Args:
+            chunk (str): The next piece of the answer.
+
+        Returns:
+            bool: True if the code part of the answer is complete.
+
+        Raises:
+            StreamAborted: If the answer is clearly not usable Python code.
+        """
+        if self.complete:
+            return True
+        self.text += chunk
+        self.pending += chunk
+        *lines, self.pending = self.pending.split("\n")
+        for line in lines:
+            self.feed_line(line)
+            if self.complete:
+                break
+        return self.complete
+
+    def feed_line(self, line):
+        stripped = line.strip()
+        if self.state == 'preamble':
+            if stripped.startswith('```'):
+                self.state = 'fenced'
+            elif CODE_START_PATTERN.match(line) or stripped.lower() in ('python', 'py', 'python3'):
+                self.state = 'code'
+                self.add_code_line(line)
+            elif stripped:
+                self.prose_lines += 1
+                if self.prose_lines > self.max_prose_lines:
+                    raise StreamAborted([f"No code found in the first {self.prose_lines} lines of the answer."])
+            return
+
+        if stripped.startswith('```'):
+            if self.state == 'fenced':
+                self.check_code(self.code_lines)
+                self.complete = True
+            return
+
+        is_top_level = bool(stripped) and line[0] not in ' \t#)]}'
+        if self.state == 'code' and is_top_level and is_prose(line):
+            # Prose after unfenced code ends the answer
+            self.check_code(self.code_lines)
+            self.complete = True
+            return
+
+        self.add_code_line(line)
+
+    def add_code_line(self, line):
+        if CODE_START_PATTERN.match(line):
+            if self.code_lines and not self.in_decorator:
+                # A new top-level statement means the previous block is finished,
+                # unless it is the definition a decorator above it applies to
+                self.check_code(self.code_lines)
+            self.in_decorator = line.startswith('@')
+        if line.strip().lower() not in ('python', 'py', 'python3') or self.code_lines:
+            self.code_lines.append(line)
+
+    @staticmethod
+    def check_code(code_lines):
+        code = textwrap.dedent("\n".join(code_lines))
+        if not code.strip():
+            return
+        try:
+            ast.parse(code)
+        except SyntaxError as e:
+            raise StreamAborted([f"Syntax error on line {e.lineno}: {e.msg}."])
@@ -0,0 +1,285 @@
+import logging
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+from retry_policy import classify_error, QUOTA
+
+# Limiter names
+MODEL_CALLS = 'model'
+EXTRACTION = 'extraction'
+
+# Seconds between adjustments, and samples needed for one
+ADJUST_INTERVAL = 5.0
+MIN_SAMPLES = 5
+
+# Share of failed calls in an interval above which the limit is cut
+MAX_ERROR_RATE = 0.1
+
+# Median latency, as a multiple of the best median seen, above which the limit is cut
+LATENCY_TOLERANCE = 2.0
+
+# Share of system memory in use above which the limit is cut
+MAX_MEMORY_FRACTION = 0.85
+
+# Seconds after a quota error during which the limit is not raised
+QUOTA_COOLDOWN = 30.0
+
+# Factor applied to the limit when it is cut
+DECREASE_FACTOR = 0.5
+
+
+def memory_usage():
+    """
+    Returns the process RSS in bytes, including child processes, and the share
+    of system memory in use, or (None, None) if psutil is not installed.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None, None
+    try:
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return rss, psutil.virtual_memory().percent / 100
+    except psutil.Error:
+        return None, None
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to the pool it guards, with additive increase
+    and multiplicative decrease (AIMD).
+
+    Every interval, the limit is cut by DECREASE_FACTOR when quota errors, a high
+    error rate, high memory use or rising latency are seen. It is raised by one
+    slot when every slot was in use and none of these happened. Each change is logged.
+
+    Attributes:
+        name (str): The pool name, used in logs.
+        limit (int): Current number of slots.
+        minimum (int): Lowest limit.
+        maximum (int): Highest limit.
+    """
+
+    def __init__(self, name, initial, minimum=1, maximum=32, latency_tolerance=LATENCY_TOLERANCE,
+                 interval=ADJUST_INTERVAL, memory_probe=memory_usage):
+        """
+        Initializes the limiter.
+
+        Args:
+            name (str): The pool name, used in logs.
+            initial (int): Starting limit.
+            minimum (int): Lowest limit.
+            maximum (int): Highest limit.
+            latency_tolerance (float): Median latency, as a multiple of the best median
+                seen, above which the limit is cut. None to ignore latency, for pools
+                whose task sizes vary too much.
+            interval (float): Seconds between adjustments.
+            memory_probe (callable): Returns (rss_bytes, memory_fraction).
+        """
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.latency_tolerance = latency_tolerance
+        self.interval = interval
+        self.memory_probe = memory_probe
+        self.condition = threading.Condition()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.latencies = []
+        self.errors = 0
+        self.quota_errors = 0
+        self.last_quota_error = None
+        self.best_latency = None
+        self.last_adjust = time.monotonic()
+        self.decisions = []
+
+    def acquire(self, cancel_event=None):
+        """
+        Waits for a free slot.
+
+        Args:
+            cancel_event (threading.Event): Optional event that stops the wait.
+
+        Returns:
+            bool: True if a slot was taken, False if cancel_event was set first.
+        """
+        with self.condition:
+            while self.in_use >= self.limit:
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                self.condition.wait(timeout=0.5)
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return True
+
+    def release(self, latency=None, error_class=None):
+        """
+        Frees a slot and records how the task went.
+
+        Args:
+            latency (float): Seconds the task took, or None if it did not run.
+            error_class (str): The retry_policy error class if it failed, else None.
+        """
+        with self.condition:
+            self.in_use -= 1
+            if latency is not None:
+                self.latencies.append(latency)
+                if error_class is not None:
+                    self.errors += 1
+                if error_class == QUOTA:
+                    self.quota_errors += 1
+                    self.last_quota_error = time.monotonic()
+            due = time.monotonic() - self.last_adjust >= self.interval and len(self.latencies) >= MIN_SAMPLES
+            self.condition.notify()
+        if due:
+            self.adjust()
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds a slot for the duration of a with block, recording its latency and
+        whether it raised.
+        """
+        self.acquire()
+        start = time.monotonic()
+        error_class = None
+        try:
+            yield
+        except Exception as e:
+            error_class = classify_error(e)
+            raise
+        finally:
+            self.release(time.monotonic() - start, error_class)
+
+    def adjust(self):
+        """
+        Changes the limit from the samples recorded since the last adjustment.
+        """
+        rss, memory_fraction = self.memory_probe() if self.memory_probe else (None, None)
+        with self.condition:
+            if not self.latencies:
+                return
+            now = time.monotonic()
+            samples = len(self.latencies)
+            median = statistics.median(self.latencies)
+            error_rate = self.errors / samples
+            quota_errors = self.quota_errors
+            saturated = self.peak_in_use >= self.limit
+            in_cooldown = self.last_quota_error is not None and now - self.last_quota_error < QUOTA_COOLDOWN
+            # The baseline drifts up slowly, so one unusually fast interval is forgotten
+            self.best_latency = median if self.best_latency is None else min(median, self.best_latency * 1.05)
+            slow = (self.latency_tolerance is not None and median > self.latency_tolerance * self.best_latency)
+
+            old_limit = self.limit
+            if quota_errors:
+                reason = f"quota errors: {quota_errors}"
+            elif error_rate > MAX_ERROR_RATE:
+                reason = f"error rate {error_rate:.0%}"
+            elif memory_fraction is not None and memory_fraction > MAX_MEMORY_FRACTION:
+                reason = f"memory use {memory_fraction:.0%}"
+            elif slow:
+                reason = f"median latency {median:.2f}s over {self.latency_tolerance:g}x the best {self.best_latency:.2f}s"
+            else:
+                reason = None
+
+            if reason is not None:
+                self.limit = max(self.minimum, int(self.limit * DECREASE_FACTOR))
+            elif in_cooldown:
+                reason = "quota cooldown"
+            elif not saturated:
+                reason = "slots not all in use"
+            elif self.limit < self.maximum:
+                self.limit += 1
+                reason = "all slots in use, no pressure"
+            else:
+                reason = "at maximum"
+
+            decision = {
+                'time': time.time(), 'old_limit': old_limit, 'limit': self.limit, 'reason': reason,
+                'samples': samples, 'median_latency': median, 'error_rate': error_rate,
+                'rss': rss, 'memory_fraction': memory_fraction,
+            }
+            self.decisions = (self.decisions + [decision])[-100:]
+            self.latencies = []
+            self.errors = 0
+            self.quota_errors = 0
+            self.peak_in_use = self.in_use
+            self.last_adjust = now
+            self.condition.notify_all()
+
+        rss_text = f", RSS {rss / 2 ** 20:.0f} MB" if rss is not None else ""
+        message = (f"Concurrency of {self.name}: {old_limit} -> {self.limit} ({reason}; {samples} samples, "
+                   f"median {median:.2f}s, errors {error_rate:.0%}{rss_text})")
+        if self.limit != old_limit:
+            logging.info(message)
+        else:
+            logging.debug(message)
+
+    def stats(self):
+        with self.condition:
+            return {'limit': self.limit, 'in_use': self.in_use, 'minimum': self.minimum, 'maximum': self.maximum,
+                    'decisions': len(self.decisions), 'last_decision': self.decisions[-1] if self.decisions else None}
+
+
+def limiter_settings(name):
+    """
+    Returns the default (initial, maximum) limits of a named pool, overridden by
+    HS_FILEINFO_<NAME>_CONCURRENCY as 'initial' or 'initial:maximum'.
+    """
+    cores = os.cpu_count() or 1
+    initial, maximum = {MODEL_CALLS: (4, 32), EXTRACTION: (cores, 4 * cores)}.get(name, (2, 16))
+    value = os.getenv(f'HS_FILEINFO_{name.upper()}_CONCURRENCY', '')
+    try:
+        if value:
+            parts = [int(part) for part in value.split(':')]
+            initial = parts[0]
+            maximum = parts[1] if len(parts) > 1 else max(maximum, initial)
+    except ValueError:
+        logging.warning(f"Ignoring invalid HS_FILEINFO_{name.upper()}_CONCURRENCY: {value}")
+    return initial, maximum
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(name, **kwargs):
+    """
+    Returns the shared AdaptiveLimiter of a pool, created on first use.
+
+    Args:
+        name (str): MODEL_CALLS, EXTRACTION or another pool name.
+        **kwargs: AdaptiveLimiter arguments used when the limiter is created.
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                initial, maximum = limiter_settings(name)
+                kwargs.setdefault('initial', initial)
+                kwargs.setdefault('maximum', maximum)
+                if name in (EXTRACTION, MODEL_CALLS):
+                    # Extraction time depends on the file, and model call time on the task
+                    # and tier, so latency mixed across them says little about load
+                    kwargs.setdefault('latency_tolerance', None)
+                limiter = _limiters[name] = AdaptiveLimiter(name, **kwargs)
+    return limiter
+
+
+def get_concurrency_stats():
+    """
+    Returns the state of every limiter created so far.
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
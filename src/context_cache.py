@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from cache_utils import default_cache_dir, write_atomic
+
+
+def normalize_text(text):
+    """
+    Normalizes text for cache keys: lower case with runs of whitespace collapsed.
+    """
+    return re.sub(r'\s+', ' ', text or '').strip().lower()
+
+
+def normalize_additional_info(additional_info):
+    """
+    Normalizes serialized file attributes for cache keys, dropping path entries,
+    which differ for every file.
+    """
+    try:
+        info = json.loads(additional_info)
+    except (TypeError, ValueError):
+        return normalize_text(additional_info)
+    if isinstance(info, dict):
+        info = {k: v for k, v in info.items() if 'path' not in str(k).lower()}
+    return json.dumps(info, sort_keys=True, ensure_ascii=False)
+
+
+def context_key(text_content=None, file_name="", file_extension="", additional_info=""):
+    """
+    Builds the cache key for a context summary from its normalized prompt input.
+
+    Args:
+        text_content (str): Text sent to the context prompt, or None.
+        file_name (str): The file name, used when there is no text. It is kept as it
+            is, since the prompt and so the summary can quote it.
+        file_extension (str): The file extension, used when there is no text.
+        additional_info (str): Serialized file attributes, used when there is no text.
+
+    Returns:
+        str: A hex digest.
+    """
+    if text_content:
+        parts = ['text', normalize_text(text_content)]
+    else:
+        parts = ['extension', (file_name or '').strip(), normalize_text(file_extension),
+                 normalize_additional_info(additional_info)]
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()
+
+
+class ContextCache:
+    """
+    Two-level cache of context summaries: an in-memory LRU in front of one text
+    file per summary on disk.
+
+    Attributes:
+        cache_dir (str): Directory holding the summaries.
+        max_memory_entries (int): Summaries kept in memory.
+    """
+
+    def __init__(self, cache_dir=None, max_memory_entries=1024):
+        """
+        Initializes the cache.
+
+        Args:
+            cache_dir (str): Directory holding the summaries. Defaults to <cache dir>/context.
+            max_memory_entries (int): Summaries kept in memory.
+        """
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), 'context')
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.txt')
+
+    def get(self, key):
+        """
+        Returns the cached summary for a key, or None.
+
+        Args:
+            key (str): A key from context_key.
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+        try:
+            with open(self.path_for(key), 'r', encoding='utf-8') as file:
+                summary = file.read()
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            self.remember(key, summary)
+        return summary
+
+    def put(self, key, summary):
+        """
+        Stores a summary.
+
+        Args:
+            key (str): A key from context_key.
+            summary (str): The context summary.
+        """
+        with self.lock:
+            self.remember(key, summary)
+        try:
+            os.makedirs(os.path.dirname(self.path_for(key)), exist_ok=True)
+            write_atomic(self.path_for(key), summary.encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Could not write context cache entry: {e}")
+
+    def remember(self, key, summary):
+        self.memory[key] = summary
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'memory_entries': len(self.memory)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_context_cache():
+    """
+    Returns the shared ContextCache, created on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ContextCache()
+    return _cache
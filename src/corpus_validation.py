@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from cache_utils import default_cache_dir, write_atomic
+
+# Share of sample files a candidate must handle to be accepted
+MIN_CORPUS_SUCCESS_RATE = 0.8
+
+# Distinct corpus files and success rate on them after which a stored extractor is trusted without the LLM
+VALIDATED_MIN_RUNS = 3
+VALIDATED_MIN_SUCCESS_RATE = 0.9
+
+# Corpus files whose outcome is kept per extractor
+MAX_CORPUS_FILES = 100
+
+# Seconds a candidate may spend on a single sample file
+SAMPLE_TIMEOUT = 60
+
+# Name ending of the reports this tool writes next to the files, which are never samples
+REPORT_SUFFIX = '_report.pdf'
+
+
+class ExtractorInstance:
+    """
+    Minimal stand-in for MyClass, passed to extractors run outside of it.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def read_text(self, max_chars=None):
+        from text_extraction import extract_text
+
+        text = extract_text(self.file_path, target_length=max_chars)
+        return text[:max_chars] if max_chars else text
+
+    @property
+    def analysis(self):
+        import analysis_helpers
+
+        return analysis_helpers
+
+
+def run_extractor_code(code, file_path):
+    """
+    Runs extractor code on one file. Used in worker processes.
+
+    Args:
+        code (str): Method logic defining read_file_info.
+        file_path (str): The file to run it on.
+
+    Returns:
+        dict: 'ok', 'runtime' in seconds, 'keys' (number of non-error keys) and 'error'.
+    """
+    start = time.perf_counter()
+    try:
+        namespace = {'__name__': 'corpus_candidate'}
+        exec(compile(code, '<candidate>', 'exec'), namespace)
+        result = namespace['read_file_info'](ExtractorInstance(file_path))
+        if not isinstance(result, dict) or 'path' not in result:
+            raise ValueError("The output is not a dict with a 'path' key.")
+        keys = sum(1 for key in result if 'error' not in str(key).lower())
+        return {'ok': True, 'runtime': time.perf_counter() - start, 'keys': keys, 'error': None}
+    except Exception as e:
+        return {'ok': False, 'runtime': time.perf_counter() - start, 'keys': 0, 'error': f"{type(e).__name__}: {e}"}
+
+
+def find_sample_files(file_path, limit=4):
+    """
+    Picks other files of the same type from the same directory, spread evenly over
+    the directory listing so they are not all from the start of the alphabet.
+    Reports written by this tool are skipped.
+
+    Args:
+        file_path (str): The file being processed.
+        limit (int): Maximum number of sample files.
+
+    Returns:
+        list: Paths of up to limit other files with the same extension, in name order.
+    """
+    file_path = os.path.abspath(file_path)
+    directory = os.path.dirname(file_path)
+    extension = os.path.splitext(file_path)[1].lower()
+    if not extension or limit <= 0:
+        return []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return []
+
+    candidates = []
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.splitext(name)[1].lower() != extension or path == file_path:
+            continue
+        if name.lower().endswith(REPORT_SUFFIX):
+            continue
+        candidates.append(path)
+
+    # Evenly spaced picks, moving on to the next file where one is not a regular file
+    samples = []
+    step = max(len(candidates) / limit, 1)
+    position = 0
+    for i in range(limit):
+        position = max(position, int(i * step + step / 2))
+        while position < len(candidates) and not os.path.isfile(candidates[position]):
+            position += 1
+        if position >= len(candidates):
+            break
+        samples.append(candidates[position])
+        position += 1
+    return samples
+
+
+class CorpusReport:
+    """
+    Results of running one candidate extractor over a sample set.
+
+    Attributes:
+        results (dict): Per-file results from run_extractor_code.
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def success_rate(self):
+        if not self.results:
+            return 1.0
+        return sum(result['ok'] for result in self.results.values()) / len(self.results)
+
+    @property
+    def mean_runtime(self):
+        if not self.results:
+            return 0.0
+        return sum(result['runtime'] for result in self.results.values()) / len(self.results)
+
+    def failures(self):
+        return {path: result['error'] for path, result in self.results.items() if not result['ok']}
+
+
+def validate_on_corpus(code, sample_files, max_workers=None, use_processes=True, timeout=SAMPLE_TIMEOUT):
+    """
+    Runs a candidate extractor over sample files in parallel.
+
+    Args:
+        code (str): Method logic defining read_file_info.
+        sample_files (list): Files of the same type to run it on.
+        max_workers (int): Thread count when use_processes is False. Defaults to one
+            per file, up to the CPU count.
+        use_processes (bool): True to run in the shared worker processes, which isolates
+            crashes, uses several cores and has the extraction libraries preloaded;
+            False to use threads.
+        timeout (float): Seconds allowed per file. Slower files count as failures.
+
+    Returns:
+        CorpusReport: The per-file results.
+    """
+    if not sample_files:
+        return CorpusReport({})
+
+    results = {}
+    if use_processes:
+        from extractor_libraries import get_worker_pool
+
+        executor = get_worker_pool()
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers or min(len(sample_files), os.cpu_count() or 1))
+    # A hung or crashed worker would hold up every later validation, so the shared pool is replaced
+    replace_pool = False
+    try:
+        futures = {path: executor.submit(run_extractor_code, code, path) for path in sample_files}
+        deadline = time.monotonic() + timeout
+        for path, future in futures.items():
+            try:
+                results[path] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                results[path] = {'ok': False, 'runtime': timeout, 'keys': 0, 'error': 'Timed out'}
+                replace_pool = True
+            except Exception as e:
+                results[path] = {'ok': False, 'runtime': 0.0, 'keys': 0, 'error': f"{type(e).__name__}: {e}"}
+                replace_pool = replace_pool or isinstance(e, BrokenProcessPool)
+    finally:
+        if not use_processes:
+            executor.shutdown(wait=False)
+        elif replace_pool:
+            from extractor_libraries import reset_worker_pool
+
+            reset_worker_pool()
+    return CorpusReport(results)
+
+
+class ExtractorStats:
+    """
+    Persistent success rate and runtime of each extractor version, keyed by extractor ID.
+
+    Only corpus runs, counted once per distinct sample file, decide whether an
+    extractor is validated. Other runs, such as a job's final run on its own file,
+    only add to the overall success rate and runtime.
+
+    Attributes:
+        path (str): The JSON file holding the statistics.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), 'extractor_stats.json')
+        self.lock = threading.Lock()
+        self.stats = {}
+        try:
+            with open(self.path, 'r') as file:
+                self.stats = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, extractor_id, report, extension="", corpus=True):
+        """
+        Adds the results of a run to an extractor's statistics and saves them.
+
+        Args:
+            extractor_id (str): The extractor ID.
+            report (CorpusReport): The run.
+            extension (str): The file type the extractor was run on.
+            corpus (bool): True if the files were corpus samples, other than the
+                file the extractor was written for.
+        """
+        with self.lock:
+            entry = self.stats.setdefault(extractor_id, {'runs': 0, 'successes': 0, 'total_runtime': 0.0,
+                                                         'extensions': []})
+            corpus_files = entry.setdefault('corpus_files', {})
+            for path, result in report.results.items():
+                entry['runs'] += 1
+                entry['successes'] += int(result['ok'])
+                entry['total_runtime'] += result['runtime']
+                if corpus and (path in corpus_files or len(corpus_files) < MAX_CORPUS_FILES):
+                    corpus_files[path] = bool(result['ok'])
+            if extension and extension not in entry['extensions']:
+                entry['extensions'].append(extension)
+            data = json.dumps(self.stats).encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_atomic(self.path, data)
+        except OSError as e:
+            logging.warning(f"Could not save extractor statistics: {e}")
+
+    def get(self, extractor_id):
+        """
+        Returns an extractor's statistics with success_rate and mean_runtime, or None.
+        """
+        with self.lock:
+            entry = self.stats.get(extractor_id)
+            if entry is None:
+                return None
+            entry = dict(entry)
+        entry['success_rate'] = entry['successes'] / entry['runs'] if entry['runs'] else 0.0
+        entry['mean_runtime'] = entry['total_runtime'] / entry['runs'] if entry['runs'] else 0.0
+        corpus_files = entry.pop('corpus_files', None) or {}
+        entry['corpus_runs'] = len(corpus_files)
+        entry['corpus_success_rate'] = sum(corpus_files.values()) / len(corpus_files) if corpus_files else 0.0
+        return entry
+
+    def is_validated(self, extractor_id):
+        """
+        Returns True if the extractor has a good enough record on distinct corpus
+        files to be used without the LLM.
+        """
+        entry = self.get(extractor_id)
+        return (entry is not None and entry['corpus_runs'] >= VALIDATED_MIN_RUNS
+                and entry['corpus_success_rate'] >= VALIDATED_MIN_SUCCESS_RATE)
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+def get_extractor_stats():
+    """
+    Returns the shared ExtractorStats, loaded on first use.
+    """
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = ExtractorStats()
+    return _stats
@@ -0,0 +1,491 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from cache_utils import default_cache_dir, write_atomic
+
+# Sizes of the blocks that make up a file feature vector
+MAGIC_DIM = 32
+HISTOGRAM_DIM = 64
+EXTENSION_DIM = 32
+KEYS_DIM = 64
+FEATURE_DIM = MAGIC_DIM + HISTOGRAM_DIM + EXTENSION_DIM + KEYS_DIM
+
+# Relative weight of each block in the similarity score
+BLOCK_WEIGHTS = {'magic': 3.0, 'histogram': 2.0, 'extension': 2.0, 'keys': 1.0}
+
+BLOCKS = [
+    ('magic', 0, MAGIC_DIM),
+    ('histogram', MAGIC_DIM, MAGIC_DIM + HISTOGRAM_DIM),
+    ('extension', MAGIC_DIM + HISTOGRAM_DIM, MAGIC_DIM + HISTOGRAM_DIM + EXTENSION_DIM),
+    ('keys', MAGIC_DIM + HISTOGRAM_DIM + EXTENSION_DIM, FEATURE_DIM),
+]
+
+# Bytes read from the start of a file to build its features
+SAMPLE_SIZE = 4096
+
+# Rows scored per matrix product, which bounds temporary memory during lookups
+QUERY_BLOCK_ROWS = 65536
+
+# Saved shards after which a save merges them into the base file
+MAX_SHARDS = 64
+
+# Seconds after which a merge lock left by a crashed process is broken
+MERGE_LOCK_TIMEOUT = 300
+
+
+def hash_bucket(token, buckets):
+    return zlib.crc32(token.encode('utf-8', errors='ignore')) % buckets
+
+
+def extractor_id(extractor_code):
+    """
+    Returns the ID of an extractor: a short hash of its code.
+    """
+    return hashlib.sha256(extractor_code.encode('utf-8')).hexdigest()[:16]
+
+
+def file_features(file_path, result=None):
+    """
+    Builds a local feature vector from a file's magic bytes, byte distribution,
+    extension and, if given, the keys an extractor returned for it.
+
+    Each block is L2-normalized on its own; blocks with no data are left as zeros.
+
+    Args:
+        file_path (str): The path to the file.
+        result (dict): Optional extractor result whose keys are added to the vector.
+
+    Returns:
+        numpy.ndarray: A float32 vector of length FEATURE_DIM.
+    """
+    import numpy as np
+
+    vector = np.zeros(FEATURE_DIM, dtype=np.float32)
+    blocks = {name: vector[start:end] for name, start, end in BLOCKS}
+
+    try:
+        with open(file_path, 'rb') as file:
+            sample = file.read(SAMPLE_SIZE)
+    except OSError as e:
+        logging.warning(f"Could not read {file_path} for features: {e}")
+        sample = b''
+
+    if sample:
+        # Position-aware hash of the leading bytes, where magic numbers live
+        for position in range(min(len(sample), 16)):
+            blocks['magic'][hash_bucket(f'{position}:{sample[position]}', MAGIC_DIM)] += 1.0
+        data = np.frombuffer(sample, dtype=np.uint8)
+        blocks['histogram'][:] = np.bincount(data >> 2, minlength=HISTOGRAM_DIM)
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension:
+        blocks['extension'][hash_bucket(extension, EXTENSION_DIM)] = 1.0
+
+    if result:
+        for key in result:
+            blocks['keys'][hash_bucket(str(key).lower(), KEYS_DIM)] += 1.0
+
+    for block in blocks.values():
+        norm = np.linalg.norm(block)
+        if norm:
+            block /= norm
+    return vector
+
+
+def embedding_features(file_path, result=None, text_sample=""):
+    """
+    Builds a feature vector with GeminiAPI.embed_content from a short description
+    of the file. Requires credentials and a network call per file.
+
+    Args:
+        file_path (str): The path to the file.
+        result (dict): Optional extractor result whose keys describe the file.
+        text_sample (str): Optional text extracted from the file.
+
+    Returns:
+        numpy.ndarray: The L2-normalized float32 embedding, or None if embedding failed.
+    """
+    import numpy as np
+    from hs import get_gemini
+
+    description = f"File extension: {os.path.splitext(file_path)[1].lower()}\n"
+    if result:
+        description += f"Extracted attributes: {', '.join(sorted(map(str, result)))}\n"
+    if text_sample:
+        description += f"Text sample: {text_sample[:500]}\n"
+
+    embedding = get_gemini().embed_content(description)
+    if not embedding or 'embedding' not in embedding:
+        return None
+    vector = np.asarray(embedding['embedding'], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def query_vector(vector):
+    """
+    Weights a feature vector for lookups. Only blocks present in the query count,
+    so a file that has not been extracted yet (no keys) can still score 1.0.
+
+    Args:
+        vector (numpy.ndarray): A vector from file_features.
+
+    Returns:
+        numpy.ndarray: The weighted query vector.
+    """
+    import numpy as np
+
+    query = np.zeros_like(vector)
+    total_weight = 0.0
+    for name, start, end in BLOCKS:
+        if np.any(vector[start:end]):
+            query[start:end] = vector[start:end] * BLOCK_WEIGHTS[name]
+            total_weight += BLOCK_WEIGHTS[name]
+    return query / total_weight if total_weight else query
+
+
+class ExtractorIndex:
+    """
+    Nearest-neighbour index from file feature vectors to the extractors that
+    worked best for those files.
+
+    Vectors are stored as rows of a float32 NumPy matrix, which grows by doubling.
+    A lookup is a blocked matrix-vector product, so it stays fast for hundreds of
+    thousands of entries (about 0.8 KB per entry). Each distinct extractor is stored once.
+
+    On disk, each save appends the rows added since the last save as a new shard,
+    so saving costs the new rows only and processes sharing the directory never
+    overwrite each other. Once MAX_SHARDS shards exist, the saving process merges
+    them into the base file under a lock file.
+
+    Attributes:
+        index_dir (str): Directory the index is saved to.
+        dim (int): Length of the feature vectors.
+    """
+
+    def __init__(self, index_dir=None, dim=FEATURE_DIM):
+        """
+        Initializes the index and loads it from disk if it was saved before.
+
+        Args:
+            index_dir (str): Directory the index is saved to. Defaults to
+                <cache dir>/extractor_index.
+            dim (int): Length of the feature vectors.
+        """
+        import numpy as np
+
+        self.index_dir = index_dir or os.path.join(default_cache_dir(), 'extractor_index')
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.entries = []
+        self.extractors = {}
+        self.saved_size = 0
+        self.load()
+
+    def __len__(self):
+        return self.size
+
+    def add(self, vector, extractor_code, file_path=""):
+        """
+        Adds a processed file and its winning extractor.
+
+        Args:
+            vector (numpy.ndarray): The file's feature vector.
+            extractor_code (str): The extractor code that worked for the file.
+            file_path (str): The file path, kept for reference.
+
+        Returns:
+            str: The ID of the stored extractor.
+        """
+        import numpy as np
+
+        code_id = extractor_id(extractor_code)
+        with self.lock:
+            if self.size == len(self.vectors):
+                grown = np.zeros((max(64, 2 * len(self.vectors)), self.dim), dtype=np.float32)
+                grown[:self.size] = self.vectors[:self.size]
+                self.vectors = grown
+            self.vectors[self.size] = vector
+            self.size += 1
+            self.entries.append({'extractor_id': code_id, 'path': file_path})
+            self.extractors[code_id] = extractor_code
+        return code_id
+
+    def query(self, vector, k=1):
+        """
+        Finds the stored entries closest to a feature vector.
+
+        Args:
+            vector (numpy.ndarray): The file's feature vector.
+            k (int): Number of neighbours to return.
+
+        Returns:
+            list: ``(similarity, entry)`` tuples, most similar first. Similarities
+            range from 0 to 1 for vectors built by file_features.
+        """
+        import numpy as np
+
+        query = query_vector(np.asarray(vector, dtype=np.float32))
+        with self.lock:
+            size = self.size
+            vectors = self.vectors
+            entries = self.entries[:size]
+        if not size:
+            return []
+
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, QUERY_BLOCK_ROWS):
+            end = min(start + QUERY_BLOCK_ROWS, size)
+            scores[start:end] = vectors[start:end] @ query
+
+        k = min(k, size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), entries[i]) for i in top]
+
+    def best_extractor(self, vector, min_similarity=0.9):
+        """
+        Returns the extractor of the closest known file, if it is similar enough.
+
+        Args:
+            vector (numpy.ndarray): The file's feature vector.
+            min_similarity (float): Minimum similarity to reuse an extractor.
+
+        Returns:
+            tuple: ``(similarity, extractor_code)``, or None if no entry is close enough.
+        """
+        matches = self.query(vector, k=1)
+        if not matches or matches[0][0] < min_similarity:
+            return None
+        similarity, entry = matches[0]
+        return similarity, self.extractors[entry['extractor_id']]
+
+    def save(self):
+        """
+        Writes the entries added since the last save to a new shard, and merges the
+        shards into the base file once there are MAX_SHARDS of them.
+        """
+        with self.lock:
+            if self.saved_size == self.size:
+                return
+            os.makedirs(os.path.join(self.index_dir, 'extractors'), exist_ok=True)
+            os.makedirs(os.path.join(self.index_dir, 'shards'), exist_ok=True)
+            new_entries = self.entries[self.saved_size:self.size]
+            for extractor_id in {entry['extractor_id'] for entry in new_entries}:
+                extractor_path = os.path.join(self.index_dir, 'extractors', f'{extractor_id}.py')
+                if not os.path.exists(extractor_path):
+                    write_atomic(extractor_path, self.extractors[extractor_id].encode('utf-8'))
+
+            # Time-ordered names, so shards load in the order they were saved
+            name = f'{int(time.time() * 1000):013d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.npz'
+            write_atomic(os.path.join(self.index_dir, 'shards', name),
+                         self.pack(self.vectors[self.saved_size:self.size], new_entries))
+            self.saved_size = self.size
+        if len(self.shard_names()) >= MAX_SHARDS:
+            self.merge()
+
+    def pack(self, vectors, entries, merged_shards=()):
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.savez(buffer, vectors=vectors, metadata=np.array(json.dumps(
+            {'dim': self.dim, 'entries': entries, 'merged_shards': list(merged_shards)})))
+        return buffer.getvalue()
+
+    def unpack(self, path):
+        """
+        Reads a base or shard file.
+
+        Returns:
+            tuple: ``(vectors, entries, merged_shards)``.
+        """
+        import numpy as np
+
+        with np.load(path) as data:
+            metadata = json.loads(str(data['metadata']))
+            if metadata.get('dim') != self.dim:
+                raise ValueError(f"vector length {metadata.get('dim')} instead of {self.dim}")
+            vectors = data['vectors'].astype(np.float32)
+        return vectors, metadata['entries'][:len(vectors)], metadata.get('merged_shards', [])
+
+    def shard_names(self):
+        try:
+            return sorted(name for name in os.listdir(os.path.join(self.index_dir, 'shards'))
+                          if name.endswith('.npz'))
+        except FileNotFoundError:
+            return []
+
+    def read_saved(self, retries=3):
+        """
+        Reads the base file and the shards not yet merged into it.
+
+        Args:
+            retries (int): Times to start over when another process merges meanwhile.
+
+        Returns:
+            tuple: ``(vectors, entries, shard_names)``, where shard_names are the
+            shards read besides the base.
+        """
+        import numpy as np
+
+        base_path = os.path.join(self.index_dir, 'index.npz')
+        parts = []
+        merged = set()
+        if os.path.exists(base_path):
+            vectors, entries, merged_shards = self.unpack(base_path)
+            parts.append((vectors, entries))
+            merged.update(merged_shards)
+        elif os.path.exists(os.path.join(self.index_dir, 'vectors.npy')):
+            # Index saved as a whole before shards were introduced
+            with open(os.path.join(self.index_dir, 'entries.json'), 'r') as file:
+                saved = json.load(file)
+            if saved.get('dim') != self.dim:
+                raise ValueError(f"vector length {saved.get('dim')} instead of {self.dim}")
+            vectors = np.load(os.path.join(self.index_dir, 'vectors.npy')).astype(np.float32)
+            parts.append((vectors, saved['entries'][:len(vectors)]))
+
+        shard_names = []
+        for name in self.shard_names():
+            if name in merged:
+                continue
+            try:
+                parts.append(self.unpack(os.path.join(self.index_dir, 'shards', name))[:2])
+            except FileNotFoundError:
+                # Merged and removed by another process meanwhile; its rows are in a newer base
+                if retries:
+                    return self.read_saved(retries - 1)
+                continue
+            shard_names.append(name)
+        if not parts:
+            return np.zeros((0, self.dim), dtype=np.float32), [], []
+        vectors = np.concatenate([part[0] for part in parts])
+        entries = [entry for part in parts for entry in part[1]]
+        return vectors, entries, shard_names
+
+    @contextmanager
+    def merge_lock(self):
+        """
+        Holds the lock file that serializes merges between processes.
+
+        Yields:
+            bool: True if the lock was taken, False if another process holds it.
+        """
+        path = os.path.join(self.index_dir, 'merge.lock')
+        try:
+            if time.time() - os.stat(path).st_mtime > MERGE_LOCK_TIMEOUT:
+                logging.warning(f"Breaking stale extractor index lock {path}")
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            yield False
+            return
+        try:
+            os.close(fd)
+            yield True
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def merge(self):
+        """
+        Merges the saved shards, including other processes', into the base file and
+        reloads the index from it. Skipped while another process is merging.
+        """
+        with self.lock, self.merge_lock() as locked:
+            if not locked:
+                return
+            try:
+                vectors, entries, shard_names = self.read_saved()
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Could not merge extractor index shards in {self.index_dir}: {e}")
+                return
+            # The base lists the shards it holds, so a crash before they are removed
+            # cannot make them load twice
+            write_atomic(os.path.join(self.index_dir, 'index.npz'), self.pack(vectors, entries, shard_names))
+            for name in shard_names:
+                try:
+                    os.remove(os.path.join(self.index_dir, 'shards', name))
+                except FileNotFoundError:
+                    pass
+            logging.debug(f"Merged {len(shard_names)} extractor index shards into {len(entries)} entries")
+            self.set_loaded(vectors, entries)
+
+    def load(self):
+        """
+        Loads the index from its directory, if it exists and matches the vector length.
+        """
+        try:
+            vectors, entries, _ = self.read_saved()
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not load extractor index from {self.index_dir}: {e}")
+            return
+        with self.lock:
+            self.set_loaded(vectors, entries)
+
+    def set_loaded(self, vectors, entries):
+        """
+        Replaces the saved part of the index with saved entries, reading their
+        extractors. Entries whose extractor file is missing are dropped. Entries
+        added since the last save are kept after them, still unsaved.
+        """
+        import numpy as np
+
+        pending_vectors = self.vectors[self.saved_size:self.size].copy()
+        pending_entries = self.entries[self.saved_size:self.size]
+        pending_extractors = {entry['extractor_id']: self.extractors[entry['extractor_id']]
+                              for entry in pending_entries}
+
+        extractors = {}
+        keep = []
+        for i, entry in enumerate(entries):
+            extractor_id = entry['extractor_id']
+            if extractor_id not in extractors:
+                try:
+                    with open(os.path.join(self.index_dir, 'extractors', f'{extractor_id}.py'), 'r') as file:
+                        extractors[extractor_id] = file.read()
+                except OSError as e:
+                    logging.warning(f"Skipping extractor index entry without its extractor: {e}")
+                    continue
+            keep.append(i)
+        if len(keep) < len(entries):
+            vectors = vectors[np.asarray(keep, dtype=np.int64)]
+            entries = [entries[i] for i in keep]
+        self.saved_size = len(entries)
+        if len(pending_entries):
+            vectors = np.concatenate([vectors, pending_vectors])
+            entries = entries + pending_entries
+            extractors.update(pending_extractors)
+        self.vectors = vectors
+        self.size = len(entries)
+        self.entries = entries
+        self.extractors = extractors
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_extractor_index():
+    """
+    Returns the shared ExtractorIndex, loading it from the cache directory on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ExtractorIndex()
+    return _index
@@ -0,0 +1,304 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import site
+import subprocess
+import sys
+import sysconfig
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from cache_utils import default_cache_dir, write_atomic
+
+# Third-party modules that extractors commonly use, by import name, with what they read
+EXTRACTION_LIBRARIES = {
+    'PyPDF2': 'PDF documents',
+    'pdf2image': 'PDF pages as images',
+    'PIL': 'images (Pillow)',
+    'cv2': 'images and video frames (OpenCV)',
+    'imageio': 'images and video frames',
+    'moviepy': 'video',
+    'mutagen': 'audio tags and stream info',
+    'librosa': 'audio analysis',
+    'soundfile': 'audio samples',
+    'audioread': 'audio decoding',
+    'pydub': 'audio segments',
+    'mido': 'MIDI files',
+    'openpyxl': 'XLSX workbooks',
+    'xlrd': 'XLS workbooks',
+    'docx': 'DOCX documents (python-docx)',
+    'pptx': 'PPTX presentations (python-pptx)',
+    'odf': 'OpenDocument files (odfpy)',
+    'ebooklib': 'EPUB books',
+    'bs4': 'HTML and XML (BeautifulSoup)',
+    'lxml': 'XML and HTML',
+    'magic': 'file type detection (python-magic)',
+    'py7zr': '7z archives',
+    'rarfile': 'RAR archives',
+    'h5py': 'HDF5 files',
+    'chess': 'PGN chess games',
+    'regipy': 'Windows registry hives',
+    'pytesseract': 'OCR of images',
+    'numpy': 'numeric arrays',
+    'pandas': 'tables',
+    'scipy': 'scientific formats and signal processing',
+}
+
+# Seconds the library probe may take; importing every library can be slow the first time
+PROBE_TIMEOUT = 300
+
+# Imports each library in a fresh interpreter and prints the ones that loaded, with their versions
+PROBE_SCRIPT = """
+import importlib, json, sys
+available = {}
+for name in sys.argv[1:]:
+    try:
+        module = importlib.import_module(name)
+    except Exception:
+        continue
+    available[name] = str(getattr(module, '__version__', '') or '')
+print(json.dumps(available))
+"""
+
+
+def environment_fingerprint():
+    """
+    Returns a key that changes when the interpreter or its installed packages
+    change: the interpreter, its version and the modification times of its
+    package directories, which installs and removals update.
+    """
+    digest = hashlib.sha256(f'{sys.executable}\x00{sys.version}'.encode('utf-8'))
+    for name in sorted(EXTRACTION_LIBRARIES):
+        digest.update(name.encode('utf-8'))
+    paths = {sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib'], site.getusersitepackages()}
+    paths.update(path for path in sys.path if os.path.basename(path) in ('site-packages', 'dist-packages'))
+    for path in sorted(paths):
+        try:
+            digest.update(f'\x00{path}\x00{os.stat(path).st_mtime_ns}'.encode('utf-8'))
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def probe_libraries():
+    """
+    Finds which EXTRACTION_LIBRARIES import, in a separate interpreter so this
+    process does not load them.
+
+    Returns:
+        dict: The version of each library that imports, by import name.
+    """
+    try:
+        completed = subprocess.run([sys.executable, '-c', PROBE_SCRIPT, *sorted(EXTRACTION_LIBRARIES)],
+                                   capture_output=True, text=True, timeout=PROBE_TIMEOUT, check=True)
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError) as e:
+        logging.warning(f"Library probe failed, checking installed packages only: {e}")
+        return {name: '' for name in EXTRACTION_LIBRARIES if importlib.util.find_spec(name) is not None}
+
+
+_available = None
+_available_lock = threading.Lock()
+
+def libraries_cache_path():
+    return os.path.join(default_cache_dir(), 'libraries.json')
+
+
+def cached_libraries():
+    """
+    Returns the result of an earlier probe of this environment, without probing.
+
+    Returns:
+        dict: The version of each available library, by import name, or None if
+            the libraries have not been probed since the environment last changed.
+    """
+    if _available is not None:
+        return _available
+    try:
+        with open(libraries_cache_path(), 'r') as file:
+            cached = json.load(file)
+        if cached.get('fingerprint') == environment_fingerprint():
+            return cached['available']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def available_libraries():
+    """
+    Returns the extraction libraries that import in this environment, probed once
+    and cached on disk until the environment changes.
+
+    Returns:
+        dict: The version of each available library, by import name.
+    """
+    global _available
+    if _available is None:
+        with _available_lock:
+            if _available is None:
+                path = libraries_cache_path()
+                fingerprint = environment_fingerprint()
+                _available = cached_libraries()
+                if _available is None:
+                    _available = probe_libraries()
+                    logging.info(f"Available extraction libraries: {', '.join(sorted(_available)) or 'none'}")
+                    try:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        write_atomic(path, json.dumps({'fingerprint': fingerprint,
+                                                       'available': _available}).encode('utf-8'))
+                    except OSError as e:
+                        logging.warning(f"Could not cache the library probe: {e}")
+    return _available
+
+
+def known_libraries():
+    """
+    Returns the available extraction libraries without waiting for the probe.
+
+    Before the first probe of this environment finishes, the probe is started in
+    the background and the libraries are looked up with is_importable instead,
+    which finds installed packages but not broken installs.
+
+    Returns:
+        dict: The version of each available library by import name, with empty
+            versions when the probe has not finished.
+    """
+    cached = cached_libraries()
+    if cached is not None:
+        return cached
+    start_warm_up()
+    return {name: '' for name in EXTRACTION_LIBRARIES if is_importable(name)}
+
+
+def missing_libraries(available=None):
+    """
+    Returns the import names of EXTRACTION_LIBRARIES that are not available.
+
+    Args:
+        available (dict): The available libraries. Defaults to available_libraries().
+    """
+    if available is None:
+        available = available_libraries()
+    return sorted(name for name in EXTRACTION_LIBRARIES if name not in available)
+
+
+def is_importable(name):
+    """
+    Returns True if a top-level module can be imported, without importing it.
+    EXTRACTION_LIBRARIES are looked up in an earlier probe when there is one, which
+    also catches broken installs. The probe itself is never started from here.
+    """
+    if name in sys.builtin_module_names or name in getattr(sys, 'stdlib_module_names', ()):
+        return True
+    cached = cached_libraries() if name in EXTRACTION_LIBRARIES else None
+    if cached is not None:
+        return name in cached
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def preload_modules():
+    """
+    Returns the modules imported once by the worker server before it forks workers.
+
+    HS_FILEINFO_PRELOAD limits them to a comma-separated list of import names, or
+    disables preloading when set to 0. By default every available library is preloaded.
+    """
+    available = available_libraries()
+    setting = os.getenv('HS_FILEINFO_PRELOAD', '').strip()
+    if setting == '0':
+        names = []
+    elif setting:
+        names = [name.strip() for name in setting.split(',') if name.strip() in available]
+    else:
+        names = sorted(available)
+    return ['corpus_validation'] + names
+
+
+def import_modules(names):
+    """
+    Imports modules, skipping those that fail. Runs in spawned workers when fork
+    servers are not supported.
+    """
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.debug(f"Could not preload {name}: {e}")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """
+    Returns the shared process pool that runs extractors outside this process,
+    created on first use.
+
+    Workers are forked from a fork server that has imported the available extraction
+    libraries, so they start with the libraries loaded and never inherit this
+    process's threads. Where fork servers are not supported, spawned workers import
+    the libraries once when they start.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                modules = preload_modules()
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(modules)
+                    _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+                else:
+                    _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=import_modules, initargs=(modules,))
+    return _pool
+
+
+def reset_worker_pool():
+    """
+    Discards the shared pool, for example after a worker crashed or hung. A new
+    pool is created on next use.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def warm_up():
+    """
+    Probes the libraries and starts the pool's workers ahead of the first job.
+    """
+    pool = get_worker_pool()
+    for future in [pool.submit(os.getpid) for _ in range(os.cpu_count() or 1)]:
+        future.result()
+
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+def start_warm_up():
+    """
+    Runs warm_up on a background thread, once per process, so the first jobs do
+    not wait for the library probe and the extractor workers.
+    """
+    global _warm_up_thread
+
+    def run():
+        try:
+            warm_up()
+        except Exception as e:
+            logging.warning(f"Could not start the extractor workers: {e}")
+
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=run, name='warm-up', daemon=True)
+            _warm_up_thread.start()
@@ -0,0 +1,227 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from cache_utils import default_cache_dir, write_atomic
+
+# Entries kept per profile
+TOP_FUNCTIONS = 10
+TOP_ALLOCATIONS = 10
+
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 5
+
+# Allocations smaller than this are left out of profiles
+MIN_ALLOCATION_BYTES = 16 * 1024
+
+# Extractors faster than this are not asked to speed up
+SLOW_EXTRACTOR_SECONDS = 0.5
+
+# cProfile and tracemalloc are process-wide, so profiled runs are serialized
+_profile_lock = threading.Lock()
+
+
+def profiling_enabled():
+    """
+    Returns True if extractor profiling is turned on with HS_FILEINFO_PROFILE.
+    """
+    return os.getenv('HS_FILEINFO_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def short_path(path):
+    parts = path.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
+
+
+def profile_call(func, *args, source_file=None):
+    """
+    Runs a function under cProfile and tracemalloc.
+
+    Args:
+        func (callable): The function to run, usually an extractor's read_file_info.
+        *args: Its arguments.
+        source_file (str): The extractor module file. Its lines are listed first among
+            the allocations.
+
+    tracemalloc traces the whole process, so 'peak_memory' and 'allocations' also
+    count memory that other threads, such as concurrent jobs, allocate during the
+    call. They are approximate unless the call runs alone; 'hot_spots' and the
+    times cover only this thread.
+
+    Returns:
+        tuple: The function's return value and a profile dict with 'wall_time',
+        'cpu_time', 'peak_memory', 'hot_spots' and 'allocations'.
+    """
+    with _profile_lock:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        start_memory = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            profiler.enable()
+            try:
+                result = func(*args)
+            finally:
+                profiler.disable()
+            wall_time, cpu_time = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+            peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+    profile = {
+        'wall_time': wall_time,
+        'cpu_time': cpu_time,
+        'peak_memory': max(peak_memory, 0),
+        'hot_spots': hot_spots(profiler),
+        'allocations': top_allocations(snapshot, source_file),
+    }
+    return result, profile
+
+
+def hot_spots(profiler, limit=TOP_FUNCTIONS):
+    """
+    Returns the functions with the highest cumulative time in a profile.
+    """
+    stats = pstats.Stats(profiler)
+    entries = []
+    for (file_name, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        if file_name == __file__ or '_lsprof' in function:
+            continue
+        entries.append({
+            'function': f'{short_path(file_name)}:{line}({function})',
+            'calls': ncalls,
+            'self_time': round(tottime, 6),
+            'cumulative_time': round(cumtime, 6),
+        })
+    entries.sort(key=lambda entry: entry['cumulative_time'], reverse=True)
+    return entries[:limit]
+
+
+def top_allocations(snapshot, source_file=None, limit=TOP_ALLOCATIONS):
+    """
+    Returns the source lines holding the most memory after the run, with the
+    extractor's own lines first.
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    entries = []
+    for stat in snapshot.statistics('lineno'):
+        if stat.size < MIN_ALLOCATION_BYTES:
+            continue
+        frame = stat.traceback[0]
+        entries.append({
+            'line': f'{short_path(frame.filename)}:{frame.lineno}',
+            'size': stat.size,
+            'count': stat.count,
+            'extractor': bool(source_file) and os.path.abspath(frame.filename) == os.path.abspath(source_file),
+        })
+    entries.sort(key=lambda entry: (not entry['extractor'], -entry['size']))
+    return entries[:limit]
+
+
+def format_profile(profile):
+    """
+    Formats a profile as plain text for the improvement prompt.
+
+    Args:
+        profile (dict): A profile from profile_call.
+
+    Returns:
+        str: The formatted profile.
+    """
+    lines = [
+        f"Wall time: {profile['wall_time']:.3f} s, CPU time: {profile['cpu_time']:.3f} s, "
+        f"peak memory: about {profile['peak_memory'] / 2 ** 20:.1f} MB (measured under the profiler, which slows "
+        f"it down; memory counts may include other jobs running at the same time)",
+        "Hot spots (cumulative time):",
+    ]
+    for entry in profile['hot_spots']:
+        lines.append(f"- {entry['function']}: {entry['cumulative_time']:.3f} s cumulative, "
+                     f"{entry['self_time']:.3f} s own, {entry['calls']} calls")
+    if profile['allocations']:
+        lines.append("Largest allocations still held after the run:")
+    for entry in profile['allocations']:
+        origin = " (in read_file_info)" if entry['extractor'] else ""
+        lines.append(f"- {entry['line']}{origin}: {entry['size'] / 1024:.1f} KB in {entry['count']} blocks")
+    return "\n".join(lines)
+
+
+def is_slow(profile):
+    return profile is not None and profile['wall_time'] >= SLOW_EXTRACTOR_SECONDS
+
+
+class ProfileStore:
+    """
+    Latest profile of each extractor version, in memory and as one JSON file per
+    version on disk.
+
+    Attributes:
+        profile_dir (str): Directory holding the profiles.
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir or os.path.join(default_cache_dir(), 'profiles')
+        self.lock = threading.Lock()
+        self.profiles = {}
+
+    def put(self, extractor_id, profile, file_path=""):
+        """
+        Stores the profile of an extractor run.
+
+        Args:
+            extractor_id (str): The extractor ID.
+            profile (dict): A profile from profile_call.
+            file_path (str): The profiled file, kept for reference.
+        """
+        profile = dict(profile, extractor_id=extractor_id, file_path=file_path)
+        with self.lock:
+            self.profiles[extractor_id] = profile
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            write_atomic(os.path.join(self.profile_dir, f'{extractor_id}.json'), json.dumps(profile).encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Could not save extractor profile: {e}")
+
+    def get(self, extractor_id):
+        """
+        Returns the latest profile of an extractor version, or None.
+        """
+        with self.lock:
+            if extractor_id in self.profiles:
+                return self.profiles[extractor_id]
+        try:
+            with open(os.path.join(self.profile_dir, f'{extractor_id}.json'), 'r') as file:
+                profile = json.load(file)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            self.profiles[extractor_id] = profile
+        return profile
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_profile_store():
+    """
+    Returns the shared ProfileStore, created on first use.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ProfileStore()
+    return _store
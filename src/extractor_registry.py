@@ -0,0 +1,311 @@
+import json
+import linecache
+import logging
+import os
+import statistics
+import threading
+import time
+import types
+import zlib
+from collections import deque, namedtuple
+
+from cache_utils import default_cache_dir, write_atomic
+from extractor_index import extractor_id
+
+# Share of the files of a type that run the candidate version while it is on trial
+CANDIDATE_SHARE = 0.2
+
+# Candidate runs after which it is promoted or rolled back
+MIN_TRIALS = 20
+
+# Median latency of a candidate, as a multiple of the active version's, above which it is rolled back
+LATENCY_TOLERANCE = 1.1
+
+# Seconds of median latency difference always tolerated, so timer noise on fast extractors is ignored
+LATENCY_SLACK = 0.005
+
+# Mean completeness of a candidate, as a share of the active version's, below which it is rolled back
+COMPLETENESS_TOLERANCE = 0.95
+
+# Failure rate a candidate may have above the active version's
+FAILURE_MARGIN = 0.05
+
+# Latencies kept per version for the median
+LATENCY_WINDOW = 200
+
+# The versions serving a file type. Replaced as a whole, so readers see a consistent pair
+Slot = namedtuple('Slot', ['active', 'candidate'])
+
+
+def candidate_share():
+    """
+    Returns the share of traffic sent to candidates: HS_FILEINFO_CANDIDATE_SHARE, or CANDIDATE_SHARE.
+    """
+    try:
+        return min(max(float(os.getenv('HS_FILEINFO_CANDIDATE_SHARE', CANDIDATE_SHARE)), 0.0), 1.0)
+    except ValueError:
+        return CANDIDATE_SHARE
+
+
+def completeness(result):
+    """
+    Returns the number of non-empty values an extractor returned, besides the path.
+    """
+    return sum(1 for key, value in result.items() if key != 'path' and value not in (None, '', [], {}))
+
+
+class ExtractorVersion:
+    """
+    One compiled extractor, loaded into a private module that is never written
+    to disk or registered in sys.modules. A job that picked a version keeps running
+    it even after another version is activated.
+
+    Attributes:
+        key (str): The file type the version serves.
+        version_id (str): The extractor ID of its code.
+        code (str): The extractor code.
+        module (module): The module the code was executed in.
+        method (callable): Its read_file_info function.
+    """
+
+    def __init__(self, key, code):
+        """
+        Compiles the extractor.
+
+        Args:
+            key (str): The file type the version serves.
+            code (str): The extractor code, defining read_file_info(instance).
+
+        Raises:
+            SyntaxError: If the code does not compile.
+            AttributeError: If it does not define read_file_info.
+        """
+        self.key = key
+        self.code = code
+        self.version_id = extractor_id(code)
+        filename = f'<extractor {self.version_id}>'
+        # Registered with linecache so inspect.getsource and tracebacks show the code
+        linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+        self.module = types.ModuleType(f'extractor_{self.version_id}')
+        self.module.__file__ = filename
+        exec(compile(code, filename, 'exec'), self.module.__dict__)
+        self.method = self.module.read_file_info
+        self.created = time.time()
+        self.runs = 0
+        self.failures = 0
+        self.total_completeness = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def stats(self):
+        return {
+            'version_id': self.version_id,
+            'runs': self.runs,
+            'failure_rate': self.failures / self.runs if self.runs else 0.0,
+            'median_latency': statistics.median(self.latencies) if self.latencies else None,
+            'completeness': self.total_completeness / (self.runs - self.failures) if self.runs > self.failures else 0.0,
+        }
+
+
+class ExtractorRegistry:
+    """
+    The extractor versions serving each file type in a long-running process.
+
+    Each type has an active version and at most one candidate on trial. A fixed
+    share of files, chosen by a hash of their path, runs the candidate. Once it has
+    MIN_TRIALS runs, its failure rate, completeness and median latency are compared
+    with the active version's. It is then promoted, or rolled back if it is worse on
+    any of them. Activation swaps the type's Slot in one assignment.
+
+    The code of the active and candidate versions is saved, so they survive restarts.
+    Trial statistics start over.
+
+    Attributes:
+        path (str): The JSON file holding the versions' code.
+        share (float): Share of files that run a candidate.
+    """
+
+    def __init__(self, path=None, share=None):
+        """
+        Initializes the registry and loads the saved versions.
+
+        Args:
+            path (str): The JSON file holding the versions' code. Defaults to
+                <cache dir>/extractor_registry.json.
+            share (float): Share of files that run a candidate. Defaults to candidate_share().
+        """
+        self.path = path or os.path.join(default_cache_dir(), 'extractor_registry.json')
+        self.share = candidate_share() if share is None else share
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.decisions = []
+        self.load()
+
+    def select(self, key, routing_key):
+        """
+        Picks the version that runs a file.
+
+        Args:
+            key (str): The file type.
+            routing_key (str): A stable key of the file, such as its path.
+
+        Returns:
+            ExtractorVersion: The version, or None if no version serves the type.
+        """
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        if slot.candidate is not None and zlib.crc32(routing_key.encode('utf-8')) % 1000 < self.share * 1000:
+            return slot.candidate
+        return slot.active
+
+    def publish(self, key, code):
+        """
+        Adds a version. It becomes active if the type has none, and otherwise the
+        candidate, unless a candidate is already on trial.
+
+        Args:
+            key (str): The file type.
+            code (str): The extractor code.
+
+        Returns:
+            ExtractorVersion: The new version, or None if it was not added.
+        """
+        version_id = extractor_id(code)
+        slot = self.slots.get(key)
+        if slot is not None and version_id in {version.version_id for version in slot if version is not None}:
+            return None
+        try:
+            version = ExtractorVersion(key, code)
+        except Exception as e:
+            logging.warning(f"Could not load extractor {version_id} for {key}: {e}")
+            return None
+
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                self.slots[key] = Slot(version, None)
+                logging.info(f"Activated extractor {version_id} for {key}")
+            elif slot.candidate is None or not slot.candidate.runs:
+                self.slots[key] = Slot(slot.active, version)
+                logging.info(f"Trying extractor {version_id} for {key} on {self.share:.0%} of files")
+            else:
+                logging.debug(f"Extractor {slot.candidate.version_id} is still on trial for {key}; "
+                              f"not trying {version_id}")
+                return None
+        self.save()
+        return version
+
+    def record(self, version, latency, result=None):
+        """
+        Records a run of a version, and decides on a candidate once it has enough runs.
+
+        Args:
+            version (ExtractorVersion): The version that ran.
+            latency (float): Seconds the run took.
+            result (dict): The result, or None if the run failed.
+        """
+        with self.lock:
+            version.runs += 1
+            version.latencies.append(latency)
+            if result is None or 'error' in result:
+                version.failures += 1
+            else:
+                version.total_completeness += completeness(result)
+            slot = self.slots.get(version.key)
+            due = slot is not None and slot.candidate is version and version.runs >= MIN_TRIALS
+        if due:
+            self.decide(version.key)
+
+    def compare(self, key):
+        """
+        Returns the statistics of a type's active and candidate versions, side by side.
+        """
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        with self.lock:
+            return {'active': slot.active.stats(),
+                    'candidate': slot.candidate.stats() if slot.candidate is not None else None}
+
+    def decide(self, key):
+        """
+        Promotes a type's candidate, or rolls it back if it is worse than the active version.
+        """
+        comparison = self.compare(key)
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None or slot.candidate is None:
+                return
+            active, candidate = comparison['active'], comparison['candidate']
+            reasons = []
+            if candidate['failure_rate'] > active['failure_rate'] + FAILURE_MARGIN:
+                reasons.append(f"failure rate {candidate['failure_rate']:.0%} vs {active['failure_rate']:.0%}")
+            if candidate['completeness'] < COMPLETENESS_TOLERANCE * active['completeness']:
+                reasons.append(f"completeness {candidate['completeness']:.1f} vs {active['completeness']:.1f}")
+            if (active['median_latency'] is not None
+                    and candidate['median_latency'] > LATENCY_TOLERANCE * active['median_latency'] + LATENCY_SLACK):
+                reasons.append(f"median latency {candidate['median_latency']:.3f}s "
+                               f"vs {active['median_latency']:.3f}s")
+            promoted = not reasons
+            self.slots[key] = Slot(slot.candidate, None) if promoted else Slot(slot.active, None)
+            self.decisions = (self.decisions + [{'time': time.time(), 'key': key, 'promoted': promoted,
+                                                 'active': active, 'candidate': candidate}])[-100:]
+        if promoted:
+            logging.info(f"Promoted extractor {candidate['version_id']} for {key}: {json.dumps(comparison)}")
+        else:
+            logging.info(f"Rolled back extractor {candidate['version_id']} for {key} ({'; '.join(reasons)}): "
+                         f"{json.dumps(comparison)}")
+        self.save()
+
+    def save(self):
+        """
+        Writes the code of every active and candidate version.
+        """
+        with self.lock:
+            saved = {key: {'active': slot.active.code,
+                           'candidate': slot.candidate.code if slot.candidate is not None else None}
+                     for key, slot in self.slots.items()}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_atomic(self.path, json.dumps(saved).encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Could not save the extractor registry: {e}")
+
+    def load(self):
+        """
+        Loads the saved versions, skipping any that no longer compile.
+        """
+        try:
+            with open(self.path, 'r') as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        for key, codes in saved.items():
+            try:
+                active = ExtractorVersion(key, codes['active'])
+                candidate = ExtractorVersion(key, codes['candidate']) if codes.get('candidate') else None
+            except Exception as e:
+                logging.warning(f"Could not load saved extractor for {key}: {e}")
+                continue
+            self.slots[key] = Slot(active, candidate)
+
+    def stats(self):
+        """
+        Returns the side-by-side comparison of each type's versions.
+        """
+        return {key: self.compare(key) for key in list(self.slots)}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_extractor_registry():
+    """
+    Returns the shared ExtractorRegistry, loaded on first use.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ExtractorRegistry()
+    return _registry
@@ -1,7 +1,11 @@
-from fpdf import FPDF
 import os
 import logging
 
+from result_store import BlobHandle
+
+# Bump when the report layout changes, so that cached reports are rendered again
+LAYOUT_VERSION = 1
+
 class PDFElement:
     def __init__(self, pdf):
         self.pdf = pdf
@@ -45,6 +49,8 @@ class FileReport:
         Args:
             data (dict): The dictionary containing file information.
         """
+        from fpdf import FPDF  # Imported on first use to keep startup fast
+
         self.data = self.sanitize_data(data)
         self.pdf = FPDF()
         self.pdf.add_page()
@@ -52,7 +58,8 @@ class FileReport:
         self.pdf.set_right_margin(10)
         self.max_text_length = 500  # Example threshold for text data
 
-    def sanitize_data(self, data):
+    @staticmethod
+    def sanitize_data(data):
         """
         Sanitizes the input data by removing entries with None or empty string values.
 
@@ -224,6 +231,9 @@ class FileReport:
                 self.add_key_value(key.replace('_', ' ').title(), value)
             elif isinstance(value, list) and len(value) <= self.max_text_length:
                 self.add_key_value(key.replace('_', ' ').title(), ', '.join(map(str, value)))
+            elif isinstance(value, BlobHandle):
+                # Spilled values are summarized rather than loaded back into memory
+                self.add_key_value(key.replace('_', ' ').title(), value.describe())
             elif isinstance(value, str) and os.path.exists(value) and self.is_supported_image(value):
                 self.add_image_with_caption(value, key)
                 if value == self.data['path']:
@@ -233,7 +243,8 @@ class FileReport:
         if path_is_image and not image_path_included:
             self.add_image_with_caption(self.data['path'], "Image:")
 
-    def is_supported_image(self, file_path):
+    @staticmethod
+    def is_supported_image(file_path):
         """
         Checks if the file is a supported image format.
 
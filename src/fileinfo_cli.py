@@ -0,0 +1,205 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__))
+from job_spool import JobSpool, SpoolWorker, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS
+from scheduler import JobScheduler, POLICIES, LONGEST_FIRST, DEFAULT_TYPE_LIMITS
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s',
+    handlers=[logging.StreamHandler()]
+)
+
+
+def iter_input_files(paths, recursive=False):
+    """
+    Yields the files named on the command line, walking directories if requested.
+
+    Args:
+        paths (list): File or directory paths.
+        recursive (bool): True to include the files under directories.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            if not recursive:
+                logging.warning(f"Skipping directory {path}; use --recursive to include it")
+                continue
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def submit(args):
+    """
+    Adds one job per input file to the spool.
+    """
+    spool = JobSpool(args.spool)
+    count = 0
+    for file_path in iter_input_files(args.files, args.recursive):
+        file_path = os.path.abspath(file_path)
+        if file_path.endswith('_report.pdf'):
+            continue
+        if args.output_dir:
+            output_path = os.path.join(os.path.abspath(args.output_dir),
+                                       os.path.splitext(os.path.basename(file_path))[0] + "_report.pdf")
+        else:
+            output_path = os.path.splitext(file_path)[0] + "_report.pdf"
+        spool.submit(file_path, output_path, args.improvements)
+        count += 1
+    logging.info(f"Submitted {count} jobs to {args.spool}")
+
+
+def work(args):
+    """
+    Runs headless workers that drain the spool.
+    """
+    from hs import check_environment
+    from extractor_libraries import start_warm_up
+
+    check_environment()
+    start_warm_up()
+    spool = JobSpool(args.spool, lease_seconds=args.lease, max_attempts=args.max_attempts)
+    type_limits = dict(DEFAULT_TYPE_LIMITS)
+    type_limits.update(args.type_limit or [])
+    scheduler = JobScheduler(policy=args.schedule, type_limits=type_limits)
+    limiter = None
+    if args.adaptive:
+        from concurrency import get_limiter, limiter_settings, EXTRACTION
+
+        initial, maximum = limiter_settings(EXTRACTION)
+        if not args.staged:
+            # --workers caps the jobs run at once; the limiter finds the level below it
+            initial, maximum = min(initial, args.workers), args.workers
+        limiter = get_limiter(EXTRACTION, initial=initial, maximum=maximum)
+    staged = None
+    if args.staged:
+        from staged_pipeline import StagedReportPipeline, EXTRACT
+
+        stage_config = {EXTRACT: {'workers': limiter.maximum, 'limiter': limiter}} if limiter else None
+        staged = StagedReportPipeline(stage_config)
+        # Workers submit jobs without waiting for them, up to what the stages can hold
+        max_in_flight = max(1, staged.capacity() // args.workers)
+    workers = [SpoolWorker(spool, poll_interval=args.poll, scheduler=scheduler, batch_size=args.batch_size,
+                           submitter=staged.submit if staged else None,
+                           max_in_flight=max_in_flight if staged else 1, limiter=None if staged else limiter)
+               for _ in range(args.workers)]
+
+    def stop(signum, frame):
+        logging.info("Stopping workers after their current jobs")
+        for worker in workers:
+            worker.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    threads = [threading.Thread(target=worker.run, kwargs={'drain': args.drain}, name=f'worker-{i}')
+               for i, worker in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    # Join with a timeout so the main thread keeps handling signals
+    last_report = time.monotonic()
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1.0)
+        if staged and time.monotonic() - last_report >= args.stats_interval:
+            logging.info(f"Stage queue depths: {staged.queue_depths()}")
+            last_report = time.monotonic()
+    if staged:
+        logging.info(f"Stage statistics: {json.dumps(staged.stats())}")
+        staged.shutdown()
+    if args.adaptive:
+        from concurrency import get_concurrency_stats
+
+        logging.info(f"Concurrency limits: {json.dumps(get_concurrency_stats(), default=str)}")
+
+
+def parse_type_limit(value):
+    """
+    Parses a TYPE=N argument, such as '.wav=1' or 'video=1', into a (type, limit) pair.
+    """
+    key, _, limit = value.partition('=')
+    if not key or not limit.isdigit():
+        raise argparse.ArgumentTypeError(f"invalid type limit '{value}'; expected TYPE=N")
+    return key.lower(), int(limit)
+
+
+def status(args):
+    """
+    Prints the number of jobs in each state.
+    """
+    print(json.dumps(JobSpool(args.spool).status(), indent=2))
+
+
+def requeue(args):
+    """
+    Moves jobs with expired leases back to pending.
+    """
+    moved = JobSpool(args.spool, lease_seconds=args.lease, max_attempts=args.max_attempts).requeue_expired()
+    logging.info(f"Moved {len(moved)} jobs with expired leases")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate file reports without the GUI, from a shared job spool.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    submit_parser = subparsers.add_parser('submit', help="Add files to the spool")
+    submit_parser.add_argument('spool', help="The spool directory, on a filesystem shared by all workers")
+    submit_parser.add_argument('files', nargs='+', help="Files or directories to process")
+    submit_parser.add_argument('-r', '--recursive', action='store_true', help="Include files under directories")
+    submit_parser.add_argument('-n', '--improvements', type=int, default=5, help="Improvements per file")
+    submit_parser.add_argument('-o', '--output-dir', help="Directory for the reports; defaults to next to each file")
+    submit_parser.set_defaults(func=submit)
+
+    work_parser = subparsers.add_parser('work', help="Run workers that drain the spool")
+    work_parser.add_argument('spool', help="The spool directory")
+    work_parser.add_argument('-w', '--workers', type=int, default=1, help="Jobs run at the same time")
+    work_parser.add_argument('--drain', action='store_true', help="Exit once no job is pending or claimed")
+    work_parser.add_argument('--poll', type=float, default=5.0, help="Seconds between checks of an empty spool")
+    work_parser.add_argument('--schedule', choices=POLICIES, default=LONGEST_FIRST,
+                             help="Job order: submission order, longest or shortest expected job first")
+    work_parser.add_argument('--staged', action='store_true',
+                             help="Run jobs through a staged pipeline that overlaps extraction, model calls and rendering")
+    work_parser.add_argument('--stats-interval', type=float, default=30.0,
+                             help="Seconds between queue depth reports with --staged")
+    work_parser.add_argument('--adaptive', action='store_true',
+                             help="Adjust the jobs extracted at once to memory use; --workers becomes the maximum")
+    work_parser.add_argument('--batch-size', type=int, default=1,
+                             help="Files of the same type sharing batched model requests; not with --staged")
+    work_parser.add_argument('--type-limit', action='append', type=parse_type_limit, metavar='TYPE=N',
+                             help="Jobs of an extension (.wav) or family (video) run at the same time; repeatable")
+    work_parser.set_defaults(func=work)
+
+    status_parser = subparsers.add_parser('status', help="Show the number of jobs in each state")
+    status_parser.add_argument('spool', help="The spool directory")
+    status_parser.set_defaults(func=status)
+
+    requeue_parser = subparsers.add_parser('requeue', help="Re-queue jobs of crashed workers")
+    requeue_parser.add_argument('spool', help="The spool directory")
+    requeue_parser.set_defaults(func=requeue)
+
+    for lease_parser in (work_parser, requeue_parser):
+        lease_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                                  help="Seconds a claim stays valid without a heartbeat")
+        lease_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                                  help="Claims per job before it is marked as failed")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'work' and args.staged and args.batch_size > 1:
+        parser.error("--batch-size cannot be combined with --staged; batches run outside the stages")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,14 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from tkinterdnd2 import TkinterDnD, DND_FILES
 import os
-import re
-import json
-import threading
+import queue
 import logging
-import google.generativeai as genai
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 sys.path.append(os.path.dirname(__file__))
-from hs import MyClass, update_method_logic, generate_improved_method
-from hs import generate_context_info, clean_info_dict
-from file_report import FileReport
+from hs import JobCancelled, check_environment
+from report_pipeline import ReportJob, run_report_generation, ORIGINAL_METHOD_LOGIC
 
 # Configure logging for debugging purposes
 logging.basicConfig(
@@ -21,18 +18,65 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
-# Retrieve API key and project ID from environment variables
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-gemini_project_id = os.getenv('GEMINI_PROJECT_ID')
+# Maximum number of report jobs that run at the same time
+MAX_CONCURRENT_JOBS = 3
 
-# Validate environment variables
-if not gemini_api_key or not gemini_project_id:
-    logging.error("Gemini API key and/or Project ID not set in environment variables.")
-    raise EnvironmentError("Please set GEMINI_API_KEY and GEMINI_PROJECT_ID environment variables.")
+# Interval (ms) at which the Tk main loop drains job events
+EVENT_POLL_INTERVAL = 100
+
+
+class JobRow(tk.Frame):
+    """
+    A row in the job queue panel showing one job's file, status, progress and cancel button.
+    """
+
+    def __init__(self, master, job, on_cancel):
+        """
+        Initializes the row.
+
+        Args:
+            master (tk.Widget): The parent widget.
+            job (ReportJob): The job shown by this row.
+            on_cancel (callable): Called with the job when its cancel button is pressed.
+        """
+        super().__init__(master)
+        self.job = job
+
+        self.name_label = tk.Label(self, text=os.path.basename(job.file_path), width=24, anchor="w")
+        self.name_label.pack(side=tk.LEFT)
+
+        self.progress = ttk.Progressbar(self, orient='horizontal', mode='determinate', length=160, maximum=100)
+        self.progress.pack(side=tk.LEFT, padx=5)
+
+        self.status_label = tk.Label(self, text="Queued", width=22, anchor="w", fg="blue")
+        self.status_label.pack(side=tk.LEFT)
+
+        self.cancel_button = tk.Button(self, text="Cancel", command=lambda: on_cancel(job))
+        self.cancel_button.pack(side=tk.LEFT)
+
+    def update_status(self, status, value=None):
+        """
+        Updates the status text and progress value.
+
+        Args:
+            status (str): The status text to show.
+            value (int): The progress percentage, or None to keep the current one.
+        """
+        self.status_label.config(text=status)
+        if value is not None:
+            self.progress["value"] = value
+
+    def finish(self, status, color):
+        """
+        Marks the job as finished and disables its cancel button.
+
+        Args:
+            status (str): The final status text.
+            color (str): The text color of the status.
+        """
+        self.status_label.config(text=status, fg=color)
+        self.cancel_button.config(state=tk.DISABLED)
 
-# Configure the Gemini API
-genai.configure(api_key=gemini_api_key)
-logging.info("Gemini API configured successfully.")
 
 class Application(TkinterDnD.Tk):
     """
@@ -45,13 +89,16 @@ class Application(TkinterDnD.Tk):
         """
         super().__init__()
         self.title("File Info Improvement App")
-        self.geometry("640x500")
+        self.geometry("640x860")
         self.configure(padx=20, pady=20)
 
-        self.original_method_logic = """
-def read_file_info(instance):
-    return {'path': instance.file_path}
-"""
+        self.original_method_logic = ORIGINAL_METHOD_LOGIC
+
+        # Jobs run on a bounded executor; workers only talk to Tk through this queue
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS)
+        self.events = queue.Queue()
+        self.jobs = {}
+        self.job_rows = {}
 
         self.reset_method_logic()
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -63,6 +110,8 @@ def read_file_info(instance):
 
         self.bind_drop_target()
 
+        self.after(EVENT_POLL_INTERVAL, self.process_events)
+
     def set_app_icon(self, icon_path):
         """
         Sets the window icon.
@@ -84,19 +133,20 @@ def read_file_info(instance):
 
     def on_file_drop(self, event):
         """
-        Handles the event when a file is dropped onto the application.
+        Handles the event when one or more files are dropped onto the application.
 
         Args:
             event (tk.Event): The event object containing file drop data.
         """
-        file_path = event.data.strip('{}')
-        self.load_input_file(file_path)
+        file_paths = self.tk.splitlist(event.data)
+        if file_paths:
+            self.load_input_files(file_paths)
 
     def create_widgets(self):
         """
         Creates and arranges the widgets in the application window.
         """
-        self.file_path_label = tk.Label(self, text="Select File:")
+        self.file_path_label = tk.Label(self, text="Select Files (one per line):")
         self.file_path_label.pack(pady=5, anchor="w")
 
         self.file_path_entry = tk.Text(self, width=50, height=3, wrap=tk.WORD)
@@ -112,7 +162,7 @@ def read_file_info(instance):
         self.improvements_entry.pack(pady=5)
         self.improvements_entry.insert(0, "5")
 
-        self.output_path_label = tk.Label(self, text="Output PDF Path:")
+        self.output_path_label = tk.Label(self, text="Output PDF Paths (one per file):")
         self.output_path_label.pack(pady=5, anchor="w")
 
         self.output_path_entry = tk.Text(self, width=50, height=3, wrap=tk.WORD)
@@ -122,16 +172,20 @@ def read_file_info(instance):
         self.output_path_button.pack(pady=5)
 
         self.generate_button = tk.Button(self, text="Generate Report", command=self.generate_report)
-        self.generate_button.pack(pady=20)
-
-        self.progress = ttk.Progressbar(self, orient='horizontal', mode='determinate', length=400)
-        self.progress.pack(pady=10)
-        self.progress["value"] = 0
-        self.progress["maximum"] = 100
+        self.generate_button.pack(pady=10)
 
         self.generating_label = tk.Label(self, text="", fg="blue")
         self.generating_label.pack(pady=5)
 
+        self.jobs_frame = tk.LabelFrame(self, text="Jobs", padx=5, pady=5)
+        self.jobs_frame.pack(pady=5, fill=tk.BOTH, expand=True)
+
+        self.context_label = tk.Label(self, text="Context Preview:")
+        self.context_label.pack(pady=5, anchor="w")
+
+        self.context_text = tk.Text(self, width=50, height=5, wrap=tk.WORD, state=tk.DISABLED)
+        self.context_text.pack(pady=5, fill=tk.X)
+
     def reset_method_logic(self):
         """
         Resets the method logic file to its original state.
@@ -144,16 +198,19 @@ def read_file_info(instance):
         """
         Handles the window closing event.
         """
+        for job in self.jobs.values():
+            job.cancel()
+        self.executor.shutdown(wait=False)
         self.reset_method_logic()
         self.destroy()
 
     def browse_file(self):
         """
-        Opens a file dialog to select a file.
+        Opens a file dialog to select one or more files.
         """
-        file_path = filedialog.askopenfilename()
-        if file_path:
-            self.load_input_file(file_path)
+        file_paths = filedialog.askopenfilenames()
+        if file_paths:
+            self.load_input_files(self.tk.splitlist(file_paths))
 
     def browse_output(self):
         """
@@ -164,159 +221,190 @@ def read_file_info(instance):
             self.output_path_entry.delete(1.0, tk.END)
             self.output_path_entry.insert(tk.END, output_path)
 
-    def load_input_file(self, file_path):
+    def load_input_files(self, file_paths):
         """
-        Loads the input file and updates the UI.
+        Loads the input files and updates the UI.
 
         Args:
-            file_path (str): The path to the file selected.
+            file_paths (list): The paths to the files selected.
         """
         self.file_path_entry.delete(1.0, tk.END)
-        self.file_path_entry.insert(tk.END, file_path)
+        self.file_path_entry.insert(tk.END, "\n".join(file_paths))
 
-        output_path = os.path.splitext(file_path)[0] + "_report.pdf"
+        output_paths = [os.path.splitext(file_path)[0] + "_report.pdf" for file_path in file_paths]
         self.output_path_entry.delete(1.0, tk.END)
-        self.output_path_entry.insert(tk.END, output_path)
-
-        self.reset_method_logic()
+        self.output_path_entry.insert(tk.END, "\n".join(output_paths))
 
     def validate_inputs(self):
         """
-        Validates user inputs for file path, output path, and improvements.
+        Validates user inputs for file paths, output paths, and improvements.
 
         Returns:
-            tuple: The validated file path, output path, and improvements.
+            tuple: The validated list of (file path, output path) pairs, and improvements.
             bool: False if validation fails.
         """
         try:
-            file_path = self.file_path_entry.get("1.0", tk.END).strip()
-            output_path = self.output_path_entry.get("1.0", tk.END).strip()
+            file_paths = self.read_lines(self.file_path_entry)
+            output_paths = self.read_lines(self.output_path_entry)
             improvements = int(self.improvements_entry.get())
 
-            if not file_path or not output_path:
+            if not file_paths or not output_paths:
                 messagebox.showerror("Missing Input", "Please specify both the file path and output path.")
                 return False
 
+            if len(file_paths) != len(output_paths):
+                messagebox.showerror("Invalid Input", "Please specify one output path for each file.")
+                return False
+
             if not (1 <= improvements <= 20):
                 messagebox.showerror("Invalid Input", "Please enter a number of improvements between 1 and 20.")
                 return False
 
-            return file_path, output_path, improvements
+            return list(zip(file_paths, output_paths)), improvements
         except ValueError:
             messagebox.showerror("Invalid Input", "Please enter a valid number for improvements.")
             return False
 
+    @staticmethod
+    def read_lines(text_widget):
+        """
+        Returns the non-empty lines of a Text widget.
+
+        Args:
+            text_widget (tk.Text): The widget to read.
+
+        Returns:
+            list: The stripped, non-empty lines.
+        """
+        content = text_widget.get("1.0", tk.END)
+        return [line.strip() for line in content.splitlines() if line.strip()]
+
     def generate_report(self):
         """
-        Generates the report in a separate thread to keep the GUI responsive.
+        Queues one report job per input file on the bounded executor.
         """
         validated = self.validate_inputs()
         if not validated:
             return
 
-        file_path, output_path, improvements = validated
+        file_pairs, improvements = validated
+
+        input_paths = [file_path for file_path, _ in file_pairs]
+        for file_path, output_path in file_pairs:
+            # Other files of the same type in the batch are used to validate extractors
+            extension = os.path.splitext(file_path)[1].lower()
+            sample_files = [path for path in input_paths
+                            if path != file_path and os.path.splitext(path)[1].lower() == extension]
+            job = ReportJob(file_path, output_path, improvements, sample_files=sample_files or None)
+            self.jobs[job.job_id] = job
+            row = JobRow(self.jobs_frame, job, self.cancel_job)
+            row.pack(fill=tk.X, pady=2)
+            self.job_rows[job.job_id] = row
+            self.executor.submit(self.run_job, job)
 
-        threading.Thread(target=self.run_report_generation, args=(file_path, output_path, improvements)).start()
+        self.update_summary()
 
-    def update_progress(self, value):
+    def cancel_job(self, job):
         """
-        Updates the progress bar value.
+        Cancels a queued or running job.
 
         Args:
-            value (int): The progress percentage to set.
+            job (ReportJob): The job to cancel.
         """
-        self.progress["value"] = value
-        self.update_idletasks()
+        job.cancel()
+        self.job_rows[job.job_id].update_status("Cancelling...")
 
-    def run_report_generation(self, file_path, output_path, improvements):
+    def run_job(self, job):
         """
-        Handles the actual report generation process.
+        Runs a report job on a worker thread, posting progress to the event queue.
 
         Args:
-            file_path (str): The path to the file being processed.
-            output_path (str): The path where the PDF report will be saved.
-            improvements (int): The number of improvements to apply.
+            job (ReportJob): The job to run.
         """
-        self.generate_button.config(state=tk.DISABLED)
-        self.generating_label.config(text="Generating report...")
-
-        try:
-            instance = MyClass(file_path)
-
-            for iteration in range(improvements):
-                with open(os.path.join(os.path.dirname(__file__), 'method_logic.py'), 'r') as file:
-                    current_method = file.read()
-
-                last_result = instance.dynamic_method()
-                text_content = last_result.pop('text', None)
-                # logging.info(f'Last result: {last_result}')
-
-                improved_method = generate_improved_method(current_method, last_result, iteration)
-                intermediate_logic_path = os.path.join(os.path.dirname(__file__), f'intermediate_logic_iteration_{iteration + 1}.txt')
-                with open(intermediate_logic_path, 'w') as file:
-                    file.write(improved_method)
+        if job.cancelled:
+            self.events.put((job.job_id, 'cancelled', None, None))
+            return
 
-                sanitized_method = re.sub(r'^```.*\n', '', improved_method).strip().strip('```').strip()
-                sanitized_method = re.sub(r'^python\n', '', sanitized_method).strip()
-                
-                # logging.info(f"Sanitized Method Logic for Iteration {iteration + 1}:\n{sanitized_method}")
+        def progress_callback(value, message):
+            self.events.put((job.job_id, 'progress', value, message))
 
-                update_method_logic(sanitized_method, file_path)
+        def context_callback(text):
+            self.events.put((job.job_id, 'context', None, text))
 
-                self.update_progress(int((iteration + 1) / improvements * 100))
+        self.events.put((job.job_id, 'running', 0, "Starting"))
+        try:
+            output_path = run_report_generation(job, progress_callback, context_callback)
+            self.events.put((job.job_id, 'done', 100, output_path))
+        except JobCancelled:
+            self.events.put((job.job_id, 'cancelled', None, None))
+        except Exception as e:
+            logging.error(f"An error occurred: {e}")
+            self.events.put((job.job_id, 'failed', None, str(e)))
 
-            final_result = instance.dynamic_method()
+    def process_events(self):
+        """
+        Applies job events from worker threads to the widgets on the Tk main loop.
+        """
+        try:
+            while True:
+                job_id, kind, value, message = self.events.get_nowait()
+                row = self.job_rows.get(job_id)
+                if row is None:
+                    continue
+
+                if kind in ('running', 'progress'):
+                    if not self.jobs[job_id].cancelled:
+                        row.update_status(message, value)
+                elif kind == 'context':
+                    self.show_context_preview(row.job, message)
+                elif kind == 'done':
+                    row.update_status("Done", value)
+                    row.finish("Done", "green")
+                    self.finish_job(job_id)
+                    self.open_pdf(message)
+                elif kind == 'cancelled':
+                    row.finish("Cancelled", "gray")
+                    self.finish_job(job_id)
+                elif kind == 'failed':
+                    row.finish("Failed", "red")
+                    self.finish_job(job_id)
+                    messagebox.showerror("Error", f"An error occurred during report generation: {message}")
+        except queue.Empty:
+            pass
+
+        self.after(EVENT_POLL_INTERVAL, self.process_events)
+
+    def show_context_preview(self, job, text):
+        """
+        Shows the contextual information streamed in so far for a job.
 
-            if text_content:
-                context_info = generate_context_info(text_content=text_content)
-                final_result['text'] = text_content
-            else:
-                file_extension = os.path.splitext(file_path)[1]
-                file_name = os.path.basename(file_path)
-
-                def default_json_serializer(obj):
-                    try:
-                        if isinstance(obj, bytes):
-                            return obj.decode('utf-8', errors='ignore')
-                        return str(obj)
-                    except Exception as e:
-                        logging.warning(f"Skipping non-serializable object: {obj}. Error: {e}")
-                        return None
-
-                additional_info = json.dumps(
-                    {k: truncate_value(v) for k, v in final_result.items() if 'error' not in str(k).lower() and v is not None and v != ''},
-                    indent=2,
-                    default=default_json_serializer
-                )
-
-                context_info = generate_context_info(None, file_name=file_name, file_extension=file_extension, additional_info=additional_info)
-
-            report = FileReport(clean_info_dict(final_result))
-            report.generate_pdf(output_path)
-
-            if context_info:
-                report.add_context_info(context_info)
-
-            report.finalize_pdf(output_path)
-            logging.info(f"PDF report generated successfully at {output_path}")
-            self.reset_method_logic()
-            # Automatically open the generated PDF
-            self.open_pdf(output_path)
+        Args:
+            job (ReportJob): The job the text belongs to.
+            text (str): The partial contextual information.
+        """
+        self.context_label.config(text=f"Context Preview ({os.path.basename(job.file_path)}):")
+        self.context_text.config(state=tk.NORMAL)
+        self.context_text.delete(1.0, tk.END)
+        self.context_text.insert(tk.END, text)
+        self.context_text.see(tk.END)
+        self.context_text.config(state=tk.DISABLED)
+
+    def finish_job(self, job_id):
+        """
+        Forgets a finished job and refreshes the summary label.
 
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-            messagebox.showerror("Error", f"An error occurred during report generation: {e}")
-        
-        finally:
-            # Re-enable the generate button
-            self.generate_button.config(state=tk.NORMAL)
-            # Reset method logic
-            self.reset_method_logic()
-            # Reset progress bar
-            self.update_progress(0)
-            # Hide the generating label
-            self.generating_label.config(text="")
+        Args:
+            job_id (str): The identifier of the finished job.
+        """
+        self.jobs.pop(job_id, None)
+        self.update_summary()
 
+    def update_summary(self):
+        """
+        Shows how many jobs are still pending.
+        """
+        pending = len(self.jobs)
+        self.generating_label.config(text=f"{pending} job(s) in progress..." if pending else "")
 
     def open_pdf(self, pdf_path):
         """Open the generated PDF with the default system viewer."""
@@ -332,13 +420,11 @@ def read_file_info(instance):
             messagebox.showinfo("Success", f"PDF report generated successfully at {pdf_path}")
 
 
-def truncate_value(value, max_length=100):
-    """Truncate the value if it exceeds max_length."""
-    if isinstance(value, str) and len(value) > max_length:
-        return value[:max_length] + '...'
-    return value
-
 def main():
+    from extractor_libraries import start_warm_up
+
+    check_environment()
+    start_warm_up()
     app = Application()
     app.mainloop()
 
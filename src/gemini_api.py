@@ -1,5 +1,108 @@
 import logging
-import google.generativeai as genai
+import threading
+import time
+
+
+def load_genai():
+    """
+    Imports the google-generativeai SDK on first use.
+
+    Returns:
+        module: The ``google.generativeai`` module.
+    """
+    import google.generativeai as genai
+    return genai
+
+class ModelPool:
+    """
+    Thread-safe pool of model handles, keyed by model ID.
+
+    A handle is created once per model and shared by every thread for the
+    lifetime of the process. All handles go through the SDK's default client,
+    so its connection stays open between requests instead of being set up again.
+    """
+
+    def __init__(self, factory):
+        """
+        Initializes the pool.
+
+        Args:
+            factory (callable): Creates a model handle from a model ID.
+        """
+        self.factory = factory
+        self.models = {}
+        self.lock = threading.Lock()
+        self.created_at = time.monotonic()
+        self.counters = {'hits': 0, 'misses': 0}
+        self.requests = {}
+        self.errors = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, model_id):
+        """
+        Returns the handle for a model, creating it on first use.
+
+        Args:
+            model_id (str): The model ID.
+
+        Returns:
+            object: The shared model handle.
+        """
+        with self.lock:
+            model = self.models.get(model_id)
+            if model is not None:
+                self.counters['hits'] += 1
+                return model
+            self.counters['misses'] += 1
+            model = self.factory(model_id)
+            self.models[model_id] = model
+            return model
+
+    def warm(self, model_ids):
+        """
+        Creates handles for the given models ahead of the first request.
+
+        Args:
+            model_ids (list): The model IDs to create.
+        """
+        for model_id in model_ids:
+            self.get(model_id)
+
+    def request_started(self, model_id):
+        with self.lock:
+            self.requests[model_id] = self.requests.get(model_id, 0) + 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, model_id, failed=False):
+        with self.lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors[model_id] = self.errors.get(model_id, 0) + 1
+
+    def stats(self):
+        """
+        Returns pool statistics.
+
+        Returns:
+            dict: Handles in the pool, handle reuse (hits) and creation (misses) counts,
+            requests and errors per model, and current and peak concurrent requests.
+        """
+        with self.lock:
+            total = self.counters['hits'] + self.counters['misses']
+            return {
+                'models': sorted(self.models),
+                'hits': self.counters['hits'],
+                'misses': self.counters['misses'],
+                'reuse_rate': self.counters['hits'] / total if total else 0.0,
+                'requests': dict(self.requests),
+                'errors': dict(self.errors),
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'uptime': time.monotonic() - self.created_at,
+            }
+
 
 class GeminiAPI:
     """
@@ -21,11 +124,13 @@ class GeminiAPI:
         self.default_model = default_model
 
         # Configure the Gemini API
+        genai = load_genai()
         genai.configure(api_key=self.api_key)
+        self.model_pool = ModelPool(genai.GenerativeModel)
         logging.basicConfig(level=logging.INFO)
         logging.info("Gemini API configured successfully.")
 
-    def generate_content(self, text, model_id=None, stream=False):
+    def generate_content(self, text, model_id=None, stream=False, raise_errors=False):
         """
         Generate text using a specified model.
 
@@ -33,19 +138,66 @@ class GeminiAPI:
             text (str): The text prompt for the model.
             model_id (str): Model ID to use. If None, uses default model.
             stream (bool): True to stream the response, False to return it as a single object.
+            raise_errors (bool): True to re-raise API errors so the caller can retry them.
 
         Returns:
             str: The generated text response.
         """
         model_id = model_id if model_id else self.default_model
         try:
-            model = genai.GenerativeModel(model_id)
-            response = model.generate_content(text, stream=stream)
+            if stream:
+                return self.format_response("".join(self.stream_content(text, model_id=model_id)))
+            model = self.model_pool.get(model_id)
+            self.model_pool.request_started(model_id)
+            try:
+                response = model.generate_content(text)
+            except Exception:
+                self.model_pool.request_finished(model_id, failed=True)
+                raise
+            self.model_pool.request_finished(model_id)
             return self.format_response(response)
         except Exception as e:
+            if raise_errors:
+                raise
             logging.error(f"Error in generate_content: {e}")
             return None
 
+    def stream_content(self, text, model_id=None):
+        """
+        Generate text using a specified model, yielding chunks as they arrive.
+
+        Closing the generator early stops reading the response, so an answer that
+        is clearly unusable does not have to be received in full.
+
+        Args:
+            text (str): The text prompt for the model.
+            model_id (str): Model ID to use. If None, uses default model.
+
+        Yields:
+            str: The raw text of each response chunk.
+        """
+        model_id = model_id if model_id else self.default_model
+        model = self.model_pool.get(model_id)
+        self.model_pool.request_started(model_id)
+        failed = True
+        try:
+            response = model.generate_content(text, stream=True)
+            for chunk in response:
+                try:
+                    chunk_text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. only safety ratings)
+                    continue
+                if chunk_text:
+                    yield chunk_text
+            failed = False
+        except GeneratorExit:
+            # Closed early by the caller, which is not an API error
+            failed = False
+            raise
+        finally:
+            self.model_pool.request_finished(model_id, failed=failed)
+
     def embed_content(self, content, model_id="models/embedding-001", task_type="retrieval_document", title=""):
         """
         Embed text using the specified model.
@@ -60,7 +212,7 @@ class GeminiAPI:
             dict: The embedding result.
         """
         try:
-            result = genai.embed_content(
+            result = load_genai().embed_content(
                 model=model_id,
                 content=content,
                 task_type=task_type,
@@ -99,6 +251,12 @@ class GeminiAPI:
 
         return formatted_text.strip()
 
+    def pool_stats(self):
+        """
+        Returns the model pool statistics. See ModelPool.stats.
+        """
+        return self.model_pool.stats()
+
     def get_response(self, prompt):
         response = self.generate_content(prompt)
         return self.format_response(response)
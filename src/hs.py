@@ -2,51 +2,273 @@ import json
 import logging
 import os
 import importlib
+import importlib.resources
+import threading
 import traceback
 import time
 from datetime import datetime
 import sys
 import inspect
+from functools import lru_cache
 
-import pkg_resources
+from retry_policy import RetryPolicy, ValidationError, DeadlineExceeded
+from retry_policy import classify_error, remaining_time, TRANSIENT_IO, QUOTA
+from code_validation import prepare_method_code, CodeValidationError, CodeStreamParser, StreamAborted
+from model_router import get_router, CORRECTION, IMPROVEMENT, PATCH, CONTEXT, SERIALIZE
+from result_store import ResultRecord
+from concurrency import get_limiter, MODEL_CALLS
 
+# Prompts live in the ``prompts`` package next to this module, which is either
+# ``src.prompts`` (installed entry point) or ``prompts`` (src on sys.path).
+PROMPTS_PACKAGE = f'{__package__}.prompts' if __package__ else 'prompts'
+
+# Files summarized per batched context request
+CONTEXT_BATCH_SIZE = 8
+
+@lru_cache(maxsize=None)
 def load_prompt_file(filename):
-    """Loads a text file from the installed package data."""
-    resource_package = __name__  # name of the package where this module is located
-    resource_path = f'prompts/{filename}'  # Do not use os.path.join() here
-    return pkg_resources.resource_string(resource_package, resource_path).decode('utf-8')
+    """Loads a text file from the installed package data, caching the result."""
+    if hasattr(importlib.resources, 'files'):
+        return importlib.resources.files(PROMPTS_PACKAGE).joinpath(filename).read_text(encoding='utf-8')
+    return importlib.resources.read_text(PROMPTS_PACKAGE, filename, encoding='utf-8')
+
+def helpers_prompt():
+    """
+    Returns the prompt section on what extractors can use: the instance helpers
+    and the extraction libraries installed here. It never waits for the library probe.
+    """
+    from extractor_libraries import EXTRACTION_LIBRARIES, known_libraries, missing_libraries
 
-# from tests import test_method_logic
-# from src.gemini_api import GeminiAPI
+    known = known_libraries()
+    available = "\n".join(f"- {name}: {EXTRACTION_LIBRARIES[name]}" for name in sorted(known))
+    missing = ", ".join(missing_libraries(known)) or "none"
+    libraries = load_prompt_file("libraries_prompt.txt").replace('{available}', available or "- none")
+    return load_prompt_file("helpers_prompt.txt") + libraries.replace('{missing}', missing)
 
-sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests'))
-import test_method_logic
-from gemini_api import GeminiAPI
+_gemini = None
+_gemini_lock = threading.Lock()
 
-# Retrieve API key and project ID from environment variables
-gemini_api_key = os.getenv('GEMINI_API_KEY')
-project_id = os.getenv('GEMINI_PROJECT_ID')
+def get_gemini():
+    """
+    Returns the shared GeminiAPI instance, creating it on first use.
 
-# Initialize GeminiAPI instance
-gemini = GeminiAPI(api_key=gemini_api_key, project_id=project_id)
+    The model SDK is only imported and configured here, so importing this
+    module does not require credentials or the google-generativeai package.
+
+    Returns:
+        GeminiAPI: The shared API wrapper.
+    """
+    global _gemini
+    if _gemini is None:
+        with _gemini_lock:
+            if _gemini is None:
+                from gemini_api import GeminiAPI
+
+                # Retrieve API key and project ID from environment variables
+                gemini_api_key = os.getenv('GEMINI_API_KEY')
+                project_id = os.getenv('GEMINI_PROJECT_ID')
+                _gemini = GeminiAPI(api_key=gemini_api_key, project_id=project_id)
+    return _gemini
+
+def check_environment():
+    """
+    Validates that the Gemini credentials are set in the environment.
+
+    Raises:
+        EnvironmentError: If the API key or project ID is missing.
+    """
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    gemini_project_id = os.getenv('GEMINI_PROJECT_ID')
+
+    if not gemini_api_key or not gemini_project_id:
+        logging.error("Gemini API key and/or Project ID not set in environment variables.")
+        raise EnvironmentError("Please set GEMINI_API_KEY and GEMINI_PROJECT_ID environment variables.")
 
 class LlmAnswerGenerator:
-    def __init__(self, model='gemini-pro'):
-        self.gemini = gemini
+    def __init__(self, model='gemini-pro', retry_policy=None, cancel_event=None):
+        self.gemini = get_gemini()
         self.model = model
         self.conversation_history = []
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.cancel_event = cancel_event
+        self.limiter = get_limiter(MODEL_CALLS)
 
     def get_answer(self, prompt, stream=False):
-        try:
-            response = self.gemini.generate_content(text=prompt, model_id=self.model, stream=stream)
+        """
+        Sends the prompt to the model, backing off and retrying on quota and
+        transient network errors.
+
+        Returns:
+            str: The response text, or None if the request failed.
+        """
+        attempts = {}
+        while True:
+            self.acquire_slot()
+            start = time.monotonic()
+            try:
+                response = self.gemini.generate_content(text=prompt, model_id=self.model, stream=stream,
+                                                        raise_errors=True)
+            except Exception as e:
+                # The slot is freed before backing off, so a waiting call can use it
+                self.limiter.release(time.monotonic() - start, classify_error(e))
+                if not self.wait_before_retry(e, attempts):
+                    logging.error(f"Error in get_answer: {e}")
+                    return None
+                continue
+            self.limiter.release(time.monotonic() - start)
             return response
-        except Exception as e:
-            logging.error(f"Error in get_answer: {e}")
-            return None
 
     def get_response(self, prompt):
         return self.get_answer(prompt)
 
+    def get_streamed_response(self, prompt, on_chunk=None, parser=None, format_text=True):
+        """
+        Streams the answer to the prompt, passing chunks on as they arrive.
+
+        Args:
+            prompt (str): The prompt to send.
+            on_chunk (callable): Optional ``callback(chunk)`` called with each raw chunk.
+            parser (CodeStreamParser): Optional parser fed with each chunk. The stream is
+                closed as soon as the parser reports the code complete or aborts it.
+            format_text (bool): True to strip Markdown bullets and bold formatting.
+
+        Returns:
+            str: The response text, or None if the request failed or was aborted.
+
+        Raises:
+            JobCancelled: If the job is cancelled while the answer streams in.
+        """
+        attempts = {}
+        while True:
+            parts = []
+            error = None
+            self.acquire_slot()
+            start = time.monotonic()
+            chunks = self.gemini.stream_content(prompt, model_id=self.model)
+            try:
+                for chunk in chunks:
+                    if self.cancel_event is not None and self.cancel_event.is_set():
+                        raise JobCancelled()
+                    parts.append(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+                    if parser is not None and parser.feed(chunk):
+                        break
+                text = "".join(parts)
+                return self.gemini.format_response(text) if format_text else text
+            except StreamAborted as e:
+                logging.warning(f"Aborted streamed answer after {len(''.join(parts))} characters: {e}")
+                return None
+            except JobCancelled:
+                raise
+            except Exception as e:
+                error = e
+            finally:
+                chunks.close()
+                self.limiter.release(time.monotonic() - start, classify_error(error) if error else None)
+            # Only retry before anything was passed on, so callers never see a restart
+            if parts or not self.wait_before_retry(error, attempts):
+                logging.error(f"Error in get_streamed_response: {error}")
+                return None
+
+    def acquire_slot(self):
+        """
+        Waits for a free slot in the shared model-call limiter.
+
+        Raises:
+            JobCancelled: If the job is cancelled while waiting.
+        """
+        if not self.limiter.acquire(self.cancel_event):
+            raise JobCancelled()
+
+    def wait_before_retry(self, error, attempts):
+        """
+        Backs off before retrying a failed model call if the retry policy allows it.
+
+        Args:
+            error (Exception): The error raised by the model call.
+            attempts (dict): Retries made so far per error class. Updated in place.
+
+        Returns:
+            bool: True if the call should be retried.
+        """
+        error_class = classify_error(error)
+        attempt = attempts.get(error_class, 0)
+        if error_class not in (TRANSIENT_IO, QUOTA) or not self.retry_policy.should_backoff(error_class, attempt):
+            return False
+
+        attempts[error_class] = attempt + 1
+        delay = self.retry_policy.backoff_delay(error_class, attempt)
+        logging.info(f"Retrying model call in {delay:.2f} seconds after {error_class} error: {error}")
+        wait_or_cancel(delay, self.cancel_event)
+        return True
+
+
+_worker_state = threading.local()
+
+def get_generator(model='gemini-pro', retry_policy=None, cancel_event=None):
+    """
+    Returns the calling worker thread's LlmAnswerGenerator for a model.
+
+    Each worker thread keeps one generator per model for its whole lifetime.
+    The retry policy and cancel event are set for the job the worker is running.
+
+    Args:
+        model (str): The model ID.
+        retry_policy (RetryPolicy): How to retry failed calls. Defaults to RetryPolicy().
+        cancel_event (threading.Event): Optional event that cancels the job.
+
+    Returns:
+        LlmAnswerGenerator: The worker's generator.
+    """
+    generators = getattr(_worker_state, 'generators', None)
+    if generators is None:
+        generators = _worker_state.generators = {}
+    generator = generators.get(model)
+    if generator is None:
+        generator = generators[model] = LlmAnswerGenerator(model=model)
+    generator.retry_policy = retry_policy or RetryPolicy()
+    generator.cancel_event = cancel_event
+    return generator
+
+
+def get_client_stats():
+    """
+    Returns the model pool statistics of the shared GeminiAPI, or an empty dict
+    if no model call was made yet.
+    """
+    if _gemini is None or not hasattr(_gemini, 'pool_stats'):
+        return {}
+    return _gemini.pool_stats()
+
+
+def get_routing_stats():
+    """
+    Returns latency and success rate per task type and model tier.
+    """
+    return get_router().get_stats()
+
+
+class JobCancelled(Exception):
+    """Raised when a report job is cancelled while it is running."""
+
+
+def wait_or_cancel(delay_duration, cancel_event=None):
+    """
+    Sleeps for the given duration, waking up early if the job is cancelled.
+
+    Args:
+        delay_duration (float): The time to wait in seconds.
+        cancel_event (threading.Event): Event set when the job is cancelled.
+
+    Raises:
+        JobCancelled: If the event is set before or during the wait.
+    """
+    if cancel_event is None:
+        time.sleep(delay_duration)
+    elif cancel_event.wait(delay_duration):
+        raise JobCancelled()
+
 
 class MyClass:
     """
@@ -54,64 +276,281 @@ class MyClass:
 
     Attributes:
         file_path (str): The path to the file that is being processed.
+        module_name (str): The module holding the method logic for this instance.
+        cancel_event (threading.Event): Event set when the running job is cancelled.
+        retry_policy (RetryPolicy): Decides between backoff and correction for each error.
+        deadline (float): Monotonic time after which the current dynamic_method call gets
+            no more retries, or None until its first error.
+        blob_store (BlobStore): Store that large result values are spilled to, or None.
+        profile (bool): True to run the method under cProfile and tracemalloc.
+        last_profile (dict): Profile of the last successful profiled run, or None.
+        traverse_archives (bool): True to add the members of ZIP and TAR files to results.
+        archive_info (dict): The archive entries added to results, once traversed.
+        extractor (ExtractorVersion): Registry version run by the next call of
+            dynamic_method instead of the module, or None.
     """
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, module_name='method_logic', cancel_event=None, retry_policy=None,
+                 blob_store=None, profile=None, traverse_archives=True, extractor=None):
         """
         Initializes MyClass with the provided file path.
 
         Args:
             file_path (str): The path to the file.
+            module_name (str): The module holding the method logic. Concurrent jobs
+                each use their own module so they do not overwrite each other.
+            cancel_event (threading.Event): Optional event that cancels the job.
+            retry_policy (RetryPolicy): How to react to errors. Defaults to RetryPolicy().
+            blob_store (BlobStore): Optional store for large result values. When set,
+                results are returned as size-capped ResultRecord objects.
+            profile (bool): True to profile each run of the method. Defaults to the
+                HS_FILEINFO_PROFILE environment variable.
+            traverse_archives (bool): True to stream the members of ZIP containers
+                (including DOCX and XLSX) and TAR files and merge a summary into results.
+            extractor (ExtractorVersion): Optional registry version to run from memory on
+                the first call of dynamic_method. Its run is recorded as a trial of the
+                version; later calls load the module, which corrections and improvements rewrite.
         """
+        from extractor_profiler import profiling_enabled
+
         self.file_path = file_path
+        self.module_name = module_name
+        self.cancel_event = cancel_event
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.blob_store = blob_store
+        self.deadline = None
+        self.profile = profiling_enabled() if profile is None else profile
+        self.last_profile = None
+        self.traverse_archives = traverse_archives
+        self.archive_info = None
+        self.extractor = extractor
+
+    def run_profiled(self, method, module):
+        """
+        Runs the method under cProfile and tracemalloc.
+
+        Returns:
+            tuple: The method's result and its profile.
+        """
+        from extractor_profiler import profile_call
+
+        return profile_call(method, self, source_file=getattr(module, '__file__', None))
+
+    def record_profile(self, module, profile):
+        """
+        Keeps the profile of a successful run for this extractor version.
+        """
+        from extractor_profiler import get_profile_store
+        from extractor_index import extractor_id
+
+        self.last_profile = profile
+        try:
+            if self.extractor is not None:
+                code = self.extractor.code
+            else:
+                with open(module.__file__, 'r') as file:
+                    code = file.read()
+            get_profile_store().put(extractor_id(code), profile, self.file_path)
+        except (OSError, AttributeError, TypeError) as e:
+            logging.warning(f"Could not store extractor profile: {e}")
+
+    def read_text(self, max_chars=None):
+        """
+        Returns the text of the file if it is a PDF, DOCX or PPTX document, reading
+        page or part ranges in parallel. Offered to the method logic.
+
+        Args:
+            max_chars (int): Optional number of characters after which reading stops.
+        """
+        from text_extraction import extract_text
+
+        text = extract_text(self.file_path, target_length=max_chars, cancel_event=self.cancel_event)
+        return text[:max_chars] if max_chars else text
+
+    def spill(self, value):
+        """
+        Moves a large value to disk while the result is being built, so the method
+        logic does not hold every large value at once. Offered to the method logic.
+
+        Args:
+            value (object): bytes, str, or a JSON-serializable value.
+
+        Returns:
+            A BlobHandle for values over DEFAULT_MAX_VALUE_BYTES when results are
+            capped, and otherwise the value itself.
+        """
+        from result_store import estimate_size, DEFAULT_MAX_VALUE_BYTES
 
-    def dynamic_method(self, retries=3, delay_duration=5):
+        if self.blob_store is None or estimate_size(value, limit=DEFAULT_MAX_VALUE_BYTES) <= DEFAULT_MAX_VALUE_BYTES:
+            return value
+        return self.blob_store.spill(value)
+
+    def blob_writer(self, kind='bytes'):
+        """
+        Returns a BlobWriter that streams a value to disk chunk by chunk, or joins it
+        in memory when results are not capped. Offered to the method logic.
+
+        Args:
+            kind (str): 'bytes' or 'text'.
+        """
+        from result_store import BlobWriter
+
+        return BlobWriter(self.blob_store, kind)
+
+    @property
+    def analysis(self):
+        """
+        The analysis_helpers module, offered to the method logic for chunked NumPy
+        statistics of audio, images and tables.
+        """
+        import analysis_helpers
+
+        return analysis_helpers
+
+    def merge_archive_info(self, result):
+        """
+        Adds the summary of an archive's members to a result. The archive is
+        traversed once per instance, and keys set by the method are kept.
+        """
+        from archive_traversal import is_archive, archive_info
+
+        if self.archive_info is None:
+            self.archive_info = archive_info(self.file_path, self.cancel_event) if is_archive(self.file_path) else {}
+        for key, value in self.archive_info.items():
+            result.setdefault(key, value)
+
+    def check_cancelled(self):
+        """
+        Raises JobCancelled if the job running this instance was cancelled.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def dynamic_method(self, retries=3):
         """
         Attempts to execute a dynamically loaded method, correcting it if an error occurs.
 
+        Transient I/O and quota errors are retried as is after a jittered exponential
+        backoff. Extractor bugs and validation failures are sent to the model for a
+        correction right away. The file's deadline starts at the first error of each
+        call, so time spent on successful runs and earlier improvement rounds does not
+        count against it. No retries are made once it passes.
+
         Args:
-            retries (int): The number of retry attempts if an error occurs.
-            delay_duration (int): The time to wait (in seconds) before retrying after an error.
+            retries (int): The number of correction attempts if an error occurs.
 
         Returns:
             dict: The result of the method execution.
 
         Raises:
             RuntimeError: If all correction attempts fail.
+            DeadlineExceeded: If the file's retry deadline passes.
+            JobCancelled: If the job is cancelled between attempts.
         """
-        sys.path.append(os.path.dirname(__file__))
-        module_name = 'method_logic'
+        if os.path.dirname(__file__) not in sys.path:
+            sys.path.append(os.path.dirname(__file__))
+        module_name = self.module_name
         method_name = 'read_file_info'
 
-        for attempt in range(retries):
+        self.deadline = None
+        corrections = 0
+        backoff_attempts = {}
+        while True:
+            self.check_cancelled()
+            method = None
+            start = time.perf_counter()
             try:
-                # Invalidate caches and force reload the module
-                importlib.invalidate_caches()
-                if module_name in sys.modules:
-                    del sys.modules[module_name]
-
-                module = importlib.import_module(module_name)
-                importlib.reload(module)
+                if self.extractor is not None:
+                    # A registry version, already loaded and shared with other jobs
+                    module = self.extractor.module
+                else:
+                    # Invalidate caches and force reload the module
+                    importlib.invalidate_caches()
+                    if module_name in sys.modules:
+                        del sys.modules[module_name]
+
+                    module = importlib.import_module(module_name)
                 method = getattr(module, method_name)
 
                 # Execute the method
-                result = method(self)
+                if self.profile:
+                    result, profile = self.run_profiled(method, module)
+                else:
+                    result = method(self)
 
                 # Validate output
                 self.validate_output(result)
-
+                if self.profile:
+                    self.record_profile(module, profile)
+                if self.extractor is not None:
+                    self.record_trial(time.perf_counter() - start, result)
+                if self.traverse_archives:
+                    self.merge_archive_info(result)
+
+                if self.blob_store is not None:
+                    result = ResultRecord.from_dict(result, self.blob_store)
                 return result
 
+            except JobCancelled:
+                raise
             except Exception as e:
-                logging.error(f"Error in method execution: {e}")
-                logging.info(f"Delaying request by {delay_duration} seconds due to fix attempt {attempt + 1}")
-                time.sleep(delay_duration)
-
-                corrected_code = self.correct_method_code(method_name, method, e)
+                error_class = classify_error(e)
+                logging.error(f"Error in method execution ({error_class}): {e}")
+                if self.deadline is None:
+                    self.deadline = self.retry_policy.deadline()
+                if self.extractor is not None:
+                    self.record_trial(time.perf_counter() - start, None)
+
+                attempt = backoff_attempts.get(error_class, 0)
+                if self.retry_policy.should_backoff(error_class, attempt):
+                    delay = self.retry_policy.backoff_delay(error_class, attempt)
+                    backoff_attempts[error_class] = attempt + 1
+                    if delay >= remaining_time(self.deadline):
+                        raise DeadlineExceeded(f"Retry deadline passed for {self.file_path}") from e
+                    logging.info(f"Retrying in {delay:.2f} seconds without correction (attempt {attempt + 1})")
+                    wait_or_cancel(delay, self.cancel_event)
+                    continue
+
+                if corrections >= retries:
+                    break
+                if remaining_time(self.deadline) <= 0:
+                    raise DeadlineExceeded(f"Retry deadline passed for {self.file_path}") from e
+
+                # Candidates that fail the static checks are sent back for another
+                # correction without being written to disk or executed
+                corrected_code = None
+                error = e
+                while corrected_code is None and corrections < retries:
+                    corrections += 1
+                    logging.info(f"Requesting correction {corrections} of {retries}")
+                    candidate = self.correct_method_code(method_name, method, error)
+                    self.check_cancelled()
+                    try:
+                        corrected_code = prepare_method_code(candidate)
+                    except CodeValidationError as validation_error:
+                        logging.error(f"Rejected corrected code: {validation_error}")
+                        error = validation_error
+
+                if corrected_code is None:
+                    break
                 self.apply_corrected_method(module_name, corrected_code)
 
         raise RuntimeError("All correction attempts failed.")
 
+    def record_trial(self, latency, result):
+        """
+        Records the run of the registry version in the registry, and goes back to
+        loading the module for later runs.
+
+        Args:
+            latency (float): Seconds the run took.
+            result (dict): The result, or None if the run failed.
+        """
+        from extractor_registry import get_extractor_registry
+
+        extractor, self.extractor = self.extractor, None
+        get_extractor_registry().record(extractor, latency, result)
+
     def validate_output(self, result):
         """
         Validates the result of the dynamically loaded method.
@@ -120,10 +559,12 @@ class MyClass:
             result (dict): The output from the dynamically executed method.
 
         Raises:
-            ValueError: If the 'path' key is not present in the result.
+            ValidationError: If the result is not a dict or the 'path' key is not present.
         """
+        if not isinstance(result, dict):
+            raise ValidationError(f"The output must be a dict, got {type(result).__name__}. Validation failed.")
         if 'path' not in result:
-            raise ValueError("The 'path' key is not present in the output. Validation failed.")
+            raise ValidationError("The 'path' key is not present in the output. Validation failed.")
 
     def correct_method_code(self, method_name, method, error):
         """
@@ -131,7 +572,7 @@ class MyClass:
 
         Args:
             method_name (str): The name of the method to correct.
-            method (function): The method object.
+            method (function): The method object, or None if the module failed to load.
             error (Exception): The error encountered during method execution.
 
         Returns:
@@ -140,17 +581,23 @@ class MyClass:
         current_code = self.get_method_code(method_name, method)
         prompt_template = self.read_prompt_template()
 
-        # Format the prompt with the current code and error details
-        prompt = prompt_template.format(current_code=current_code, error_details=str(error))
+        # Fill in the current code and error details. The template contains literal
+        # braces in its examples, so str.format cannot be used here.
+        prompt = prompt_template.replace('{current_code}', current_code).replace('{error_details}', str(error))
+        prompt += helpers_prompt()
+
+        # Generate the corrected method code, starting on the fastest model tier
+        def call(model):
+            generator = get_generator(model, retry_policy=self.retry_policy, cancel_event=self.cancel_event)
+            return generator.get_streamed_response(prompt, parser=CodeStreamParser(), format_text=False)
 
-        # Generate the corrected method code using an external generator
-        generator = LlmAnswerGenerator()
-        corrected_code = generator.get_response(prompt)
+        corrected_code = get_router().run(CORRECTION, call, validate=is_valid_method_code)
         return corrected_code
 
     def apply_corrected_method(self, module_name, corrected_code):
         """
-        Applies the corrected method code by writing it to the module and reloading it.
+        Applies the corrected method code by writing it to the module. The module is
+        reloaded by the next attempt in dynamic_method, so load errors are retried there.
 
         Args:
             module_name (str): The name of the module containing the method.
@@ -159,7 +606,6 @@ class MyClass:
         method_logic_path = os.path.join(os.path.dirname(__file__), f'{module_name}.py')
         with open(method_logic_path, 'w') as file:
             file.write(corrected_code)
-        importlib.reload(importlib.import_module(module_name))
 
     def get_method_code(self, method_name, method):
         """
@@ -167,11 +613,15 @@ class MyClass:
 
         Args:
             method_name (str): The name of the method.
-            method (function): The method object.
+            method (function): The method object, or None to read the module source.
 
         Returns:
             str: The source code of the method.
         """
+        if method is None:
+            method_logic_path = os.path.join(os.path.dirname(__file__), f'{self.module_name}.py')
+            with open(method_logic_path, 'r') as file:
+                return file.read()
         return inspect.getsource(method)
 
     def read_prompt_template(self):
@@ -185,6 +635,17 @@ class MyClass:
 
 
 
+def is_valid_method_code(code):
+    """
+    Returns True if generated method code passes the static checks.
+    """
+    try:
+        prepare_method_code(code)
+        return True
+    except CodeValidationError:
+        return False
+
+
 def format_input_prompt(improve_prompt, current_method, last_result):
     separator = '=== SEPARATOR ==='
     before, after = improve_prompt.split(separator, 1)
@@ -206,8 +667,7 @@ def write_serialize_logic(code):
 
 def generate_corrected_serialize_logic(error, current_code):
     prompt = f"Method code:\n{current_code}\nError:\n{str(error)}\nCorrect the serialize function to handle the error without adding comments or additional text."
-    generator = LlmAnswerGenerator()
-    corrected_code = generator.get_response(prompt)
+    corrected_code = get_router().run(SERIALIZE, lambda model: get_generator(model).get_response(prompt))
     return corrected_code
 
 def dynamic_serialize(obj):
@@ -230,7 +690,7 @@ def dynamic_serialize(obj):
 
 
 def generate_improved_method(current_method, last_result, iteration, delay_between_calls=True, 
-                             delay_duration=2):
+                             delay_duration=2, cancel_event=None, on_chunk=None, profile=None):
     """
     Generates an improved method using the Gemini model.
 
@@ -240,10 +700,16 @@ def generate_improved_method(current_method, last_result, iteration, delay_betwe
     - iteration (int): The current iteration number.
     - delay_between_calls (bool): Whether to introduce a delay before making the request. Defaults to False.
     - delay_duration (int): The duration of the delay in seconds if delay_between_calls is True. Defaults to 2 seconds.
+    - cancel_event (threading.Event): Optional event that cancels the job during the delay.
+    - on_chunk (callable): Optional callback receiving the answer chunks as they stream in.
+    - profile (dict): Optional profile of the current method. If the method is slow, its
+      hot spots and allocations are added to the prompt so it also gets faster.
 
     Returns:
     - str: The improved method code generated by the Gemini model.
     """
+    from method_patch import strip_rewrite_instructions
+
     # Determine which prompt file to use based on iteration
     prompt_file = {
         0: "first_prompt.txt",
@@ -261,35 +727,344 @@ def generate_improved_method(current_method, last_result, iteration, delay_betwe
 
     # Format the input prompt with the current method and serialized last_result
     prompt = format_input_prompt(improve_prompt, current_method, last_result_serialized)
+    sections = helpers_prompt() + performance_note(profile)
+    patch_prompt = strip_rewrite_instructions(prompt) + sections
+    prompt += sections
 
     # Introduce a delay if specified and iteration is greater than zero
     if delay_between_calls and iteration > 0:
         logging.info(f"Delaying request by {delay_duration} seconds due to iteration {iteration}")
-        time.sleep(delay_duration)
+        wait_or_cancel(delay_duration, cancel_event)
+
+    return request_improved_method(prompt, current_method=current_method, cancel_event=cancel_event,
+                                   on_chunk=on_chunk, patch_prompt=patch_prompt)
+
+
+def generate_improved_method_batch(current_method, last_results, iteration, cancel_event=None, on_chunk=None,
+                                   profile=None):
+    """
+    Generates one improved method for several files of the same type with a single request.
+
+    Args:
+        current_method (str): The current method code shared by the files.
+        last_results (list): The results of the current method for each file.
+        iteration (int): The current iteration number.
+        cancel_event (threading.Event): Optional event that cancels the job.
+        on_chunk (callable): Optional callback receiving the answer chunks as they stream in.
+        profile (dict): Optional profile of the current method on its slowest file.
+
+    Returns:
+        str: The improved method code, or None if the request failed.
+    """
+    from method_patch import strip_rewrite_instructions
+
+    prompt_file = {
+        0: "first_prompt.txt",
+        1: "second_prompt.txt",
+    }.get(iteration, "third_prompt.txt")
+
+    results = [{k: v for k, v in result.items() if k != 'text'} for result in last_results]
+    results_serialized = json.dumps(results, default=safe_serialize, ensure_ascii=False)
+    prompt = format_input_prompt(load_prompt_file(prompt_file), current_method, results_serialized)
+    sections = load_prompt_file("batch_improvement_prompt.txt") + helpers_prompt() + performance_note(profile)
+    patch_prompt = strip_rewrite_instructions(prompt) + sections
+    prompt += sections
+
+    return request_improved_method(prompt, current_method=current_method, cancel_event=cancel_event,
+                                   on_chunk=on_chunk, patch_prompt=patch_prompt)
+
+
+def performance_note(profile):
+    """
+    Returns the prompt section asking to speed up a slow method, or an empty string.
+
+    Args:
+        profile (dict): A profile from extractor_profiler.profile_call, or None.
+    """
+    from extractor_profiler import is_slow, format_profile
+
+    if not is_slow(profile):
+        return ""
+    return load_prompt_file("performance_prompt.txt").replace('{profile}', format_profile(profile))
+
+
+def request_improved_method(prompt, current_method=None, cancel_event=None, on_chunk=None, patch_prompt=None):
+    """
+    Sends an improvement prompt through the model router.
+
+    Long methods are improved with a patch first, so the model only writes the
+    lines that change. If the patch cannot be applied, or for short methods, the
+    whole method is requested. The answer is streamed and dropped as soon as it
+    is clearly not Python code.
+
+    Args:
+        prompt (str): The improvement prompt, asking for the whole method.
+        current_method (str): The current method code, needed to apply a patch.
+        cancel_event (threading.Event): Optional event that cancels the job.
+        on_chunk (callable): Optional callback receiving the answer chunks as they stream in.
+        patch_prompt (str): The same prompt without the request for the whole method,
+            from strip_rewrite_instructions. No patch is requested without it.
+
+    Returns:
+        str: The improved method code, or None if the request failed.
+    """
+    from method_patch import should_patch
+
+    if current_method is not None and patch_prompt is not None and should_patch(current_method):
+        code = request_method_patch(patch_prompt, current_method, cancel_event=cancel_event, on_chunk=on_chunk)
+        if code is not None:
+            return code
+        logging.info("Falling back to a full rewrite of the method")
+
+    def call(model):
+        generator = get_generator(model, cancel_event=cancel_event)
+        return generator.get_streamed_response(prompt, on_chunk=on_chunk, parser=CodeStreamParser(),
+                                               format_text=False)
+
+    return get_router().run(IMPROVEMENT, call, validate=is_valid_method_code)
+
+
+def request_method_patch(prompt, current_method, cancel_event=None, on_chunk=None):
+    """
+    Asks for the improvement as SEARCH/REPLACE edits and applies them to the
+    current method.
+
+    Args:
+        prompt (str): The improvement prompt without the request for the whole method.
+        current_method (str): The current method code.
+        cancel_event (threading.Event): Optional event that cancels the job.
+        on_chunk (callable): Optional callback receiving the answer chunks as they stream in.
+
+    Returns:
+        str: The patched method code, or None if no usable patch came back.
+    """
+    from method_patch import parse_patch, apply_patch, PatchError
+
+    patch_prompt = prompt + load_prompt_file("patch_prompt.txt")
 
-    # Generate the improved method using the Gemini model
-    generator = LlmAnswerGenerator()
-    improved_method = generator.get_response(prompt)
+    def call(model):
+        generator = get_generator(model, cancel_event=cancel_event)
+        answer = generator.get_streamed_response(patch_prompt, on_chunk=on_chunk, format_text=False)
+        if not answer:
+            return None
+        try:
+            edits = parse_patch(answer)
+            code = apply_patch(current_method, edits)
+        except PatchError as e:
+            logging.info(f"Patch from {model} could not be applied: {e}")
+            return None
+        logging.info(f"Applied {len(edits)} edits from a {len(answer)} character answer "
+                     f"to a {len(current_method)} character method")
+        return code
+
+    code = get_router().run(PATCH, call, validate=is_valid_method_code)
+    return code if code and is_valid_method_code(code) else None
 
-    return improved_method
 
+def generate_context_info(text_content, file_name="", file_extension="", additional_info="",
+                          on_chunk=None, cancel_event=None, use_cache=True, on_reset=None):
+    """
+    Generates contextual information about a file's text content, or about its type
+    when there is no text.
+
+    Args:
+        text_content (str): Text extracted from the file, or None.
+        file_name (str): The file name, used when there is no text.
+        file_extension (str): The file extension, used when there is no text.
+        additional_info (str): Serialized extracted attributes, used when there is no text.
+        on_chunk (callable): Optional callback receiving the answer chunks as they stream in.
+        cancel_event (threading.Event): Optional event that cancels the job.
+        use_cache (bool): True to reuse summaries of identical normalized input.
+        on_reset (callable): Optional callback called when the router moves up a tier,
+            so chunks streamed by the weaker model can be discarded.
+
+    Returns:
+        str: The contextual information, or None if the request failed.
+    """
+    from context_cache import get_context_cache, context_key
+    from text_extraction import sample_text
+
+    if text_content:
+        text_content = sample_text(text_content)
+
+    if use_cache:
+        cache = get_context_cache()
+        key = context_key(text_content, file_name, file_extension, additional_info)
+        context_info = cache.get(key)
+        if context_info is not None:
+            logging.info("Reusing cached contextual information")
+            if on_chunk is not None:
+                on_chunk(context_info)
+            return context_info
 
-def generate_context_info(text_content, file_name="", file_extension="", additional_info=""):
-        
     if text_content:
         context_prompt = load_prompt_file("context_prompt.txt")
-        prompt = context_prompt.format(text_content[:1000])
+        prompt = context_prompt.format(text_content)
     else:
         extension_context_prompt = load_prompt_file("extension_context_prompt.txt")
         prompt = extension_context_prompt.format(file_name, file_extension, additional_info)
 
-    generator = LlmAnswerGenerator()
-    context_info = generator.get_response(prompt)
+    attempts = []
+
+    def call(model):
+        # A retry on a stronger tier streams a new answer from the start
+        if attempts and on_reset is not None:
+            on_reset()
+        attempts.append(model)
+        return get_generator(model, cancel_event=cancel_event).get_streamed_response(prompt, on_chunk=on_chunk)
+
+    context_info = get_router().run(CONTEXT, call)
+    if use_cache and context_info:
+        cache.put(key, context_info)
     return context_info
 
 
-def update_method_logic(new_code, file_path):
-    method_logic_path = os.path.join(os.path.dirname(__file__), 'method_logic.py')
+def generate_context_info_batch(requests, cancel_event=None, use_cache=True, batch_size=CONTEXT_BATCH_SIZE):
+    """
+    Generates contextual information for several files, sending up to batch_size
+    of them in each request.
+
+    Summaries missing from a batched answer are requested one by one.
+
+    Args:
+        requests (list): One dict of generate_context_info arguments per file
+            (text_content, and file_name, file_extension and additional_info).
+        cancel_event (threading.Event): Optional event that cancels the job.
+        use_cache (bool): True to reuse summaries of identical normalized input.
+        batch_size (int): Files per request.
+
+    Returns:
+        list: The contextual information for each request, or None where it failed.
+    """
+    from context_cache import get_context_cache, context_key
+    from gemini_api import GeminiAPI
+    from text_extraction import sample_text
+
+    requests = [dict(request) for request in requests]
+    for request in requests:
+        if request.get('text_content'):
+            request['text_content'] = sample_text(request['text_content'])
+
+    summaries = [None] * len(requests)
+    keys = [context_key(request.get('text_content'), request.get('file_name', ""),
+                        request.get('file_extension', ""), request.get('additional_info', ""))
+            for request in requests]
+    cache = get_context_cache() if use_cache else None
+    # Files with the same normalized input share one item
+    pending = {}
+    for i, key in enumerate(keys):
+        summaries[i] = cache.get(key) if cache is not None else None
+        if summaries[i] is None:
+            pending.setdefault(key, []).append(i)
+    pending = [indices[0] for indices in pending.values()]
+
+    for start in range(0, len(pending), batch_size):
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
+        chunk = pending[start:start + batch_size]
+        item_ids = [str(n + 1) for n in range(len(chunk))]
+        items = "\n\n".join(format_context_item(item_id, requests[i]) for item_id, i in zip(item_ids, chunk))
+        prompt = load_prompt_file("batch_context_prompt.txt").replace('{items}', items)
+
+        def call(model):
+            generator = get_generator(model, cancel_event=cancel_event)
+            return generator.get_streamed_response(prompt, format_text=False)
+
+        answer = get_router().run(CONTEXT, call, validate=lambda answer: bool(parse_batch_answer(answer, item_ids)))
+        parsed = parse_batch_answer(answer, item_ids) if answer else {}
+        logging.info(f"Batched context request answered {len(parsed)} of {len(chunk)} files")
+
+        for item_id, i in zip(item_ids, chunk):
+            if item_id in parsed:
+                summaries[i] = GeminiAPI.format_response(parsed[item_id])
+                if cache is not None:
+                    cache.put(keys[i], summaries[i])
+            else:
+                summaries[i] = generate_context_info(cancel_event=cancel_event, use_cache=use_cache, **requests[i])
+
+    for i, key in enumerate(keys):
+        if summaries[i] is None:
+            summaries[i] = next((summaries[j] for j, other in enumerate(keys) if other == key and summaries[j]), None)
+    return summaries
+
+
+def format_context_item(item_id, request):
+    if request.get('text_content'):
+        return f"Item {item_id}:\nText Content:\n{request['text_content']}"
+    return (f"Item {item_id}:\nFile Name: {request.get('file_name', '')}\n"
+            f"File Extension: {request.get('file_extension', '')}\n"
+            f"Additional Info: {request.get('additional_info', '')}")
+
+
+def parse_batch_answer(answer, item_ids):
+    """
+    Maps the parts of a batched JSON answer back to the item IDs.
+
+    Args:
+        answer (str): The model answer, possibly wrapped in Markdown fences.
+        item_ids (list): The IDs sent in the request.
+
+    Returns:
+        dict: The non-empty answers by item ID. Unknown IDs are ignored, and of an
+        ID answered twice the first non-empty answer is kept.
+    """
+    text = (answer or "").strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[-1].rsplit('```', 1)[0]
+    start, end = text.find('{'), text.rfind('}')
+    try:
+        parsed = json.loads(text[start:end + 1], object_pairs_hook=first_answers) if start != -1 else None
+    except ValueError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {str(key): str(value).strip() for key, value in parsed.items() if str(key) in item_ids}
+
+
+def first_answers(pairs):
+    """
+    Builds a JSON object keeping the first non-empty value of each repeated key.
+    """
+    answers = {}
+    for key, value in pairs:
+        if value and str(value).strip():
+            answers.setdefault(key, value)
+    return answers
+
+
+def check_method_logic(instance):
+    """
+    Runs the method logic for the instance and checks that it reports the file path.
+
+    Args:
+        instance (MyClass): The instance whose file is being processed.
+
+    Returns:
+        bool: True if the method logic produced a valid result.
+    """
+    result = instance.dynamic_method()
+    if result.get('path') != instance.file_path:
+        return False
+    return True
+
+
+def update_method_logic(new_code, file_path, module_name='method_logic', cancel_event=None, sample_files=None):
+    """
+    Replaces the method logic with new code if it works on the file, and on a
+    corpus of sample files of the same type if any are given.
+
+    Args:
+        new_code (str): The candidate method logic.
+        file_path (str): The file being processed.
+        module_name (str): The method logic module to update.
+        cancel_event (threading.Event): Optional event that cancels the check.
+        sample_files (list): Optional files of the same type the candidate must also
+            handle, so that it does not overfit to the one file.
+
+    Returns:
+        bool: True if the new method logic was kept.
+    """
+    method_logic_path = os.path.join(os.path.dirname(__file__), f'{module_name}.py')
 
     with open(method_logic_path, 'r') as file:
         current_code = file.read()
@@ -297,15 +1072,24 @@ def update_method_logic(new_code, file_path):
     with open(method_logic_path, 'w') as file:
         file.write(new_code)
 
-    instance = MyClass(file_path=file_path)
+    instance = MyClass(file_path=file_path, module_name=module_name, cancel_event=cancel_event,
+                       traverse_archives=False)
 
     test_passed = False
+    start = time.perf_counter()
     try:
-        importlib.reload(test_method_logic)
-        test_passed = test_method_logic.test_method_logic(instance)
+        test_passed = check_method_logic(instance)
+    except JobCancelled:
+        with open(method_logic_path, 'w') as file:
+            file.write(current_code)
+        raise
     except Exception as e:
         logging.error(f"Test raised an error: {e}")
         test_passed = False
+    runtime = time.perf_counter() - start
+
+    if test_passed and sample_files:
+        test_passed = check_on_corpus(new_code, file_path, runtime, sample_files, cancel_event)
 
     if test_passed:
         logging.info("Tests passed. Keeping the new method logic.")
@@ -313,6 +1097,42 @@ def update_method_logic(new_code, file_path):
         logging.info("Tests failed. Reverting to the previous method logic.")
         with open(method_logic_path, 'w') as file:
             file.write(current_code)
+    return test_passed
+
+def check_on_corpus(code, file_path, runtime, sample_files, cancel_event=None):
+    """
+    Runs candidate method logic over sample files in parallel and records its
+    success rate and runtime.
+
+    Args:
+        code (str): The candidate method logic.
+        file_path (str): The file it already passed on.
+        runtime (float): Seconds it took on that file.
+        sample_files (list): Files of the same type.
+        cancel_event (threading.Event): Optional event that cancels the check.
+
+    Returns:
+        bool: True if the candidate succeeded on enough of the sample files.
+    """
+    from corpus_validation import validate_on_corpus, get_extractor_stats, CorpusReport, MIN_CORPUS_SUCCESS_RATE
+    from extractor_index import extractor_id
+
+    report = validate_on_corpus(code, sample_files)
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled()
+
+    samples_rate = report.success_rate
+    extension = os.path.splitext(file_path)[1].lower()
+    get_extractor_stats().record(extractor_id(code), report, extension)
+    # The file the candidate was written for says nothing about other files
+    own_run = CorpusReport({file_path: {'ok': True, 'runtime': runtime, 'keys': 0, 'error': None}})
+    get_extractor_stats().record(extractor_id(code), own_run, extension, corpus=False)
+
+    for path, error in report.failures().items():
+        logging.info(f"Candidate failed on sample {path}: {error}")
+    logging.info(f"Candidate succeeded on {samples_rate:.0%} of {len(sample_files)} sample files "
+                 f"(mean runtime {report.mean_runtime:.3f}s)")
+    return samples_rate >= MIN_CORPUS_SUCCESS_RATE
 
 def clean_info_dict(info_dict):
     """
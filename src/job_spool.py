@@ -0,0 +1,684 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from cache_utils import write_atomic
+
+# Directories of the spool, one per job state
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (PENDING, CLAIMED, DONE, FAILED)
+
+# Seconds a claim stays valid without a heartbeat
+DEFAULT_LEASE_SECONDS = 120
+
+# Times a job is re-queued after its worker was lost before it is marked as failed
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class LeaseLost(Exception):
+    """
+    Raised when a worker no longer holds the lease of the job it is running.
+    """
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def write_json(path, data):
+    write_atomic(path, json.dumps(data, indent=2).encode('utf-8'))
+
+
+class JobSpool:
+    """
+    Durable queue of report jobs kept as JSON files in a directory, so that
+    workers on several machines sharing a filesystem can drain one run.
+
+    A job file moves from pending/ to claimed/ with a single rename, which only
+    one worker can win. The claiming worker keeps a lease file next to it and
+    renews it with heartbeats. Jobs whose lease expired are moved back to
+    pending/ by any worker. Finished jobs move to done/ or failed/ with their
+    result written next to them as <job_id>.result.json.
+
+    Lease expiry is compared against each host's clock, so the hosts need
+    roughly synchronized clocks (well within the lease length).
+
+    Attributes:
+        spool_dir (str): The spool directory.
+        lease_seconds (float): Seconds a claim stays valid without a heartbeat.
+        max_attempts (int): Claims allowed per job before it is marked as failed.
+    """
+
+    def __init__(self, spool_dir, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Initializes the spool and creates its directories.
+
+        Args:
+            spool_dir (str): The spool directory.
+            lease_seconds (float): Seconds a claim stays valid without a heartbeat.
+            max_attempts (int): Claims allowed per job before it is marked as failed.
+        """
+        self.spool_dir = spool_dir
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.pending_cache = {}
+        for state in STATES:
+            os.makedirs(os.path.join(spool_dir, state), exist_ok=True)
+
+    def job_path(self, state, job_id):
+        return os.path.join(self.spool_dir, state, f'{job_id}.json')
+
+    def lease_path(self, job_id):
+        return os.path.join(self.spool_dir, CLAIMED, f'{job_id}.lease')
+
+    def result_path(self, state, job_id):
+        return os.path.join(self.spool_dir, state, f'{job_id}.result.json')
+
+    def job_ids(self, state):
+        """
+        Returns the IDs of the jobs in a state, oldest first by name.
+        """
+        names = os.listdir(os.path.join(self.spool_dir, state))
+        return sorted(name[:-len('.json')] for name in names
+                      if name.endswith('.json') and not name.endswith('.result.json'))
+
+    def submit(self, file_path, output_path, improvements, sample_files=None):
+        """
+        Adds a job to the spool.
+
+        Args:
+            file_path (str): The file to process. Must be reachable from every worker.
+            output_path (str): Where the PDF report is written.
+            improvements (int): The number of improvements to apply.
+            sample_files (list): Optional files used to validate extractors.
+
+        Returns:
+            str: The job ID.
+        """
+        from scheduler import detect_type
+
+        # Time-ordered IDs, so workers claim jobs roughly in submission order
+        job_id = f'{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}'
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+        job = {
+            'job_id': job_id,
+            'file_path': file_path,
+            'output_path': output_path,
+            'improvements': improvements,
+            'sample_files': sample_files,
+            'file_type': detect_type(file_path),
+            'size': size,
+            'attempts': 0,
+            'submitted': time.time(),
+        }
+        write_json(self.job_path(PENDING, job_id), job)
+        return job_id
+
+    def pending_jobs(self):
+        """
+        Returns the pending jobs. Job files are only read the first time they are seen.
+
+        Returns:
+            list: The pending jobs.
+        """
+        job_ids = self.job_ids(PENDING)
+        with self.lock:
+            self.pending_cache = {job_id: self.pending_cache[job_id]
+                                  for job_id in job_ids if job_id in self.pending_cache}
+            missing = [job_id for job_id in job_ids if job_id not in self.pending_cache]
+        for job_id in missing:
+            try:
+                job = read_json(self.job_path(PENDING, job_id))
+            except (OSError, ValueError):
+                # Claimed meanwhile, or still being written
+                continue
+            with self.lock:
+                self.pending_cache[job_id] = job
+        with self.lock:
+            return list(self.pending_cache.values())
+
+    def claim(self, worker_id):
+        """
+        Claims the next pending job in submission order.
+
+        Args:
+            worker_id (str): The claiming worker.
+
+        Returns:
+            dict: The claimed job, or None if no job is pending.
+        """
+        for job_id in self.job_ids(PENDING):
+            job = self.claim_job(job_id, worker_id)
+            if job is not None:
+                return job
+        return None
+
+    def claim_job(self, job_id, worker_id):
+        """
+        Claims a specific pending job.
+
+        Args:
+            job_id (str): The job ID.
+            worker_id (str): The claiming worker.
+
+        Returns:
+            dict: The claimed job, or None if it is no longer pending.
+        """
+        try:
+            os.rename(self.job_path(PENDING, job_id), self.job_path(CLAIMED, job_id))
+        except FileNotFoundError:
+            # Another worker claimed it first
+            return None
+
+        job = read_json(self.job_path(CLAIMED, job_id))
+        job['attempts'] = job.get('attempts', 0) + 1
+        job['worker_id'] = worker_id
+        write_json(self.job_path(CLAIMED, job_id), job)
+        self.renew(job_id, worker_id)
+        return job
+
+    def renew(self, job_id, worker_id):
+        """
+        Extends the lease of a claimed job.
+
+        Args:
+            job_id (str): The job ID.
+            worker_id (str): The worker holding the lease.
+
+        Raises:
+            LeaseLost: If the job was re-queued or taken by another worker.
+        """
+        if self.lease_holder(job_id) != worker_id:
+            raise LeaseLost(job_id)
+
+        write_json(self.lease_path(job_id), {
+            'worker_id': worker_id,
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'expires': time.time() + self.lease_seconds,
+        })
+
+    def lease_holder(self, job_id):
+        """
+        Returns the ID of the worker holding a claimed job, or None if it is not claimed.
+        """
+        for path in (self.lease_path(job_id), self.job_path(CLAIMED, job_id)):
+            try:
+                return read_json(path)['worker_id']
+            except (OSError, ValueError, KeyError):
+                continue
+        return None
+
+    def lease_expired(self, job_id, now=None):
+        """
+        Returns True if a claimed job has no valid lease.
+        """
+        now = now or time.time()
+        try:
+            return read_json(self.lease_path(job_id))['expires'] < now
+        except (OSError, ValueError, KeyError):
+            pass
+        # No lease yet: give the claiming worker one lease period to write it
+        try:
+            return os.stat(self.job_path(CLAIMED, job_id)).st_ctime + self.lease_seconds < now
+        except OSError:
+            return False
+
+    def requeue_expired(self):
+        """
+        Moves claimed jobs whose lease expired back to pending, or to failed once
+        they used up their attempts.
+
+        Returns:
+            list: The IDs of the jobs that were moved.
+        """
+        moved = []
+        now = time.time()
+        for job_id in self.job_ids(CLAIMED):
+            if not self.lease_expired(job_id, now):
+                continue
+            try:
+                job = read_json(self.job_path(CLAIMED, job_id))
+            except (OSError, ValueError):
+                continue
+
+            if job.get('attempts', 0) >= self.max_attempts:
+                state = FAILED
+                moved_first = self.finish_job(job_id, FAILED, {
+                    'job_id': job_id, 'status': 'failed',
+                    'error': f"Worker lost {job.get('attempts', 0)} times", 'finished': now,
+                })
+            else:
+                state = PENDING
+                try:
+                    os.rename(self.job_path(CLAIMED, job_id), self.job_path(PENDING, job_id))
+                    moved_first = True
+                except FileNotFoundError:
+                    moved_first = False
+            if not moved_first:
+                # Another worker re-queued or finished it first
+                continue
+            try:
+                os.remove(self.lease_path(job_id))
+            except FileNotFoundError:
+                pass
+            logging.warning(f"Lease of job {job_id} held by {job.get('worker_id')} expired; moved to {state}")
+            moved.append(job_id)
+        return moved
+
+    def complete(self, job_id, worker_id, result, failed=False):
+        """
+        Writes a job's result and moves the job to done or failed.
+
+        Args:
+            job_id (str): The job ID.
+            worker_id (str): The worker holding the lease.
+            result (dict): The result, written to <job_id>.result.json.
+            failed (bool): True if the job failed.
+
+        Raises:
+            LeaseLost: If the job was re-queued or taken by another worker.
+        """
+        self.renew(job_id, worker_id)
+        state = FAILED if failed else DONE
+        if not self.finish_job(job_id, state, dict(result, job_id=job_id, worker_id=worker_id, finished=time.time())):
+            raise LeaseLost(job_id)
+        try:
+            os.remove(self.lease_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def finish_job(self, job_id, state, result):
+        """
+        Moves a claimed job to done or failed with its result, unless another worker
+        moved it first.
+
+        The result is written under a name unique to this call and only renamed into
+        place once the job's rename succeeded, so a worker that loses the race never
+        touches the winner's result.
+
+        Args:
+            job_id (str): The job ID.
+            state (str): DONE or FAILED.
+            result (dict): The result.
+
+        Returns:
+            bool: True if this call moved the job.
+        """
+        temp_path = f'{self.result_path(state, job_id)}.{uuid.uuid4().hex}.tmp'
+        write_json(temp_path, result)
+        try:
+            os.rename(self.job_path(CLAIMED, job_id), self.job_path(state, job_id))
+        except FileNotFoundError:
+            os.remove(temp_path)
+            return False
+        os.replace(temp_path, self.result_path(state, job_id))
+        return True
+
+    def status(self):
+        """
+        Returns the number of jobs in each state.
+        """
+        return {state: len(self.job_ids(state)) for state in STATES}
+
+
+class SpoolWorker:
+    """
+    Headless worker that claims jobs from a spool and runs them until the spool
+    is drained or it is stopped.
+
+    Jobs are claimed in submission order, or in the order chosen by a
+    JobScheduler shared by the workers of a process. With a batch_size above 1,
+    pending jobs of the same type are claimed together and run as one batch with
+    batched model requests. With a submitter, such as a staged pipeline's submit,
+    the worker does not wait for each job: it keeps up to max_in_flight jobs
+    submitted and records each result when its future completes.
+
+    While jobs run, a heartbeat thread renews their leases. If a lease is lost
+    (for example after a long pause made another worker re-queue the job), the
+    job is cancelled and its result discarded.
+
+    Attributes:
+        spool (JobSpool): The spool to drain.
+        worker_id (str): Unique identifier of the worker.
+        poll_interval (float): Seconds to wait when no job is pending.
+        heartbeat_interval (float): Seconds between lease renewals.
+        scheduler (JobScheduler): Optional scheduler that picks the next job.
+        batch_size (int): Maximum jobs of the same type run as one batch.
+        submitter (callable): Submits a single ReportJob and returns a future of its report path.
+        max_in_flight (int): Jobs submitted through submitter that may be unfinished at once.
+        limiter (AdaptiveLimiter): Optional limiter shared by the workers of a process.
+    """
+
+    def __init__(self, spool, worker_id=None, poll_interval=5.0, heartbeat_interval=None, scheduler=None,
+                 batch_size=1, submitter=None, max_in_flight=1, limiter=None):
+        """
+        Initializes the worker.
+
+        Args:
+            spool (JobSpool): The spool to drain.
+            worker_id (str): Unique identifier of the worker. Defaults to host, PID and a random suffix.
+            poll_interval (float): Seconds to wait when no job is pending.
+            heartbeat_interval (float): Seconds between lease renewals. Defaults to a
+                quarter of the lease.
+            scheduler (JobScheduler): Optional scheduler that picks the next job and
+                limits concurrent jobs per type. Share one between the workers of a process.
+            batch_size (int): Maximum jobs of the same type run as one batch.
+            submitter (callable): ``submitter(report_job)`` that starts a single job and
+                returns a concurrent.futures.Future of its report path, such as
+                StagedReportPipeline.submit. Jobs run in the worker's thread with
+                run_report_generation when it is None. Cannot be combined with batches.
+            max_in_flight (int): Jobs submitted through submitter that may be unfinished
+                at once. Size it to what the pipeline can queue.
+            limiter (AdaptiveLimiter): Optional limiter that decides how many of the
+                process's workers run jobs at once. Start as many workers as its maximum.
+
+        Raises:
+            ValueError: If a submitter is combined with a batch_size above 1.
+        """
+        if submitter is not None and batch_size > 1:
+            raise ValueError("Batches cannot be run through a submitter")
+        self.spool = spool
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval or spool.lease_seconds / 4
+        self.scheduler = scheduler
+        self.batch_size = max(1, batch_size)
+        self.submitter = submitter
+        self.max_in_flight = max(1, max_in_flight)
+        self.limiter = limiter
+        self.stop_event = threading.Event()
+        self.in_flight = {}
+        self.in_flight_changed = threading.Condition()
+        self.lost = set()
+        self.submitted_finished = 0
+
+    def stop(self):
+        """
+        Stops the worker after its current job.
+        """
+        self.stop_event.set()
+
+    def run(self, drain=False):
+        """
+        Claims and runs jobs until stopped.
+
+        Args:
+            drain (bool): True to return once no job is pending or claimed.
+
+        Returns:
+            int: The number of jobs this worker finished.
+        """
+        if self.submitter is not None:
+            return self.run_submitted(drain)
+        finished = 0
+        while not self.stop_event.is_set():
+            if self.limiter is not None and not self.limiter.acquire(self.stop_event):
+                break
+            self.spool.requeue_expired()
+            job = self.claim_next()
+            if job is None:
+                if self.limiter is not None:
+                    self.limiter.release()
+                if drain and not self.spool.job_ids(CLAIMED) and not self.spool.job_ids(PENDING):
+                    break
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            batch = self.claim_batch(job)
+            results = []
+            try:
+                results = self.run_jobs(batch)
+            finally:
+                if self.scheduler is not None:
+                    # Each job of the batch holds a type slot. Only successful runs
+                    # are representative of a type's latency
+                    for claimed, result in zip(batch, results or [None] * len(batch)):
+                        done = result is not None and result['status'] == 'done'
+                        self.scheduler.release(claimed, result['elapsed'] / len(batch) if done else None)
+                if self.limiter is not None:
+                    # Failed jobs are mostly extractor bugs, not load, so only latency
+                    # and memory use drive the limit
+                    elapsed = [result['elapsed'] / len(batch) for result in results if result is not None]
+                    self.limiter.release(sum(elapsed) / len(elapsed) if elapsed else None)
+            finished += sum(result is not None for result in results)
+        return finished
+
+    def run_submitted(self, drain):
+        """
+        Claims jobs and submits them without waiting for them to finish, keeping at
+        most max_in_flight unfinished. Returns once they have all finished.
+        """
+        done = threading.Event()
+        heartbeat_thread = threading.Thread(target=self.heartbeat, args=(done, self.in_flight_jobs),
+                                            name=f'heartbeat-{self.worker_id}', daemon=True)
+        heartbeat_thread.start()
+        try:
+            while not self.stop_event.is_set():
+                with self.in_flight_changed:
+                    while len(self.in_flight) >= self.max_in_flight and not self.stop_event.is_set():
+                        self.in_flight_changed.wait(timeout=self.poll_interval)
+                if self.stop_event.is_set():
+                    break
+                self.spool.requeue_expired()
+                job = self.claim_next()
+                if job is None:
+                    if drain and not self.in_flight and not self.spool.job_ids(CLAIMED) \
+                            and not self.spool.job_ids(PENDING):
+                        break
+                    with self.in_flight_changed:
+                        self.in_flight_changed.wait(timeout=self.poll_interval)
+                    continue
+                self.submit_job(job)
+            with self.in_flight_changed:
+                while self.in_flight:
+                    self.in_flight_changed.wait(timeout=self.poll_interval)
+        finally:
+            done.set()
+            heartbeat_thread.join()
+        return self.submitted_finished
+
+    def in_flight_jobs(self):
+        with self.in_flight_changed:
+            return list(self.in_flight.values())
+
+    def submit_job(self, job):
+        """
+        Submits a claimed job through the submitter. Its result is recorded, and its
+        scheduler slot released, when the returned future completes.
+        """
+        from report_pipeline import ReportJob
+
+        report_job = ReportJob(job['file_path'], job['output_path'], job['improvements'],
+                               sample_files=job.get('sample_files'))
+        with self.in_flight_changed:
+            self.in_flight[job['job_id']] = (job, report_job)
+        start = time.time()
+        try:
+            future = self.submitter(report_job)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda future: self.finish_submitted(job, future, start))
+
+    def finish_submitted(self, job, future, start):
+        elapsed = time.time() - start
+        try:
+            outcome = future.exception() or future.result()
+        except Exception as e:
+            # The future was cancelled
+            outcome = e
+        result = None
+        try:
+            result = self.record_result(job, outcome, start, elapsed, 1)
+        except Exception as e:
+            logging.error(f"Could not record the result of job {job['job_id']}: {e}")
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release(job, elapsed if result is not None and result['status'] == 'done' else None)
+            with self.in_flight_changed:
+                self.in_flight.pop(job['job_id'], None)
+                self.submitted_finished += int(result is not None)
+                self.in_flight_changed.notify_all()
+
+    def heartbeat(self, done, jobs):
+        """
+        Renews the leases of running jobs until done is set, cancelling the jobs
+        whose lease was lost.
+
+        Args:
+            done (threading.Event): Set when the jobs have finished.
+            jobs (callable): Returns the (job, report_job) pairs to renew.
+        """
+        while not done.wait(self.heartbeat_interval):
+            for job, report_job in jobs():
+                if job['job_id'] in self.lost:
+                    continue
+                try:
+                    self.spool.renew(job['job_id'], self.worker_id)
+                except LeaseLost:
+                    logging.warning(f"Lost the lease of job {job['job_id']}; cancelling it")
+                    self.lost.add(job['job_id'])
+                    report_job.cancel()
+                except OSError as e:
+                    logging.warning(f"Could not renew the lease of job {job['job_id']}: {e}")
+
+    def claim_next(self):
+        """
+        Claims the next job, through the scheduler if there is one.
+
+        Returns:
+            dict: The claimed job, or None if no job can start now.
+        """
+        if self.scheduler is None:
+            return self.spool.claim(self.worker_id)
+        return self.scheduler.acquire(self.spool.pending_jobs(),
+                                      lambda job_id: self.spool.claim_job(job_id, self.worker_id))
+
+    def claim_batch(self, job):
+        """
+        Claims more pending jobs of the same type as a claimed job, up to batch_size
+        and, with a scheduler, up to the type's limit of running jobs.
+
+        Args:
+            job (dict): The claimed job.
+
+        Returns:
+            list: The claimed jobs, starting with job.
+        """
+        batch = [job]
+        if self.batch_size == 1:
+            return batch
+        for other in self.spool.pending_jobs():
+            if len(batch) >= self.batch_size:
+                break
+            if other.get('file_type') != job.get('file_type') or other.get('improvements') != job.get('improvements'):
+                continue
+            if self.scheduler is not None and not self.scheduler.reserve(other):
+                break
+            claimed = self.spool.claim_job(other['job_id'], self.worker_id)
+            if claimed is not None:
+                batch.append(claimed)
+            elif self.scheduler is not None:
+                self.scheduler.release(other)
+        return batch
+
+    def run_job(self, job):
+        """
+        Runs one claimed job with lease heartbeats and records its result.
+
+        Args:
+            job (dict): The claimed job.
+
+        Returns:
+            dict: The recorded result, or None if the lease was lost.
+        """
+        return self.run_jobs([job])[0]
+
+    def run_jobs(self, jobs):
+        """
+        Runs claimed jobs with lease heartbeats and records their results. Several
+        jobs are run as one batch.
+
+        Args:
+            jobs (list): The claimed jobs.
+
+        Returns:
+            list: The recorded result of each job, or None where the lease was lost.
+        """
+        from report_pipeline import ReportJob, run_report_generation, run_report_batch
+
+        report_jobs = [ReportJob(job['file_path'], job['output_path'], job['improvements'],
+                                 sample_files=job.get('sample_files')) for job in jobs]
+        done = threading.Event()
+        heartbeat_thread = threading.Thread(target=self.heartbeat, args=(done, lambda: zip(jobs, report_jobs)),
+                                            name=f"heartbeat-{jobs[0]['job_id']}", daemon=True)
+        heartbeat_thread.start()
+        start = time.time()
+        try:
+            if len(report_jobs) == 1:
+                try:
+                    outcomes = {report_jobs[0].job_id: run_report_generation(report_jobs[0])}
+                except Exception as e:
+                    outcomes = {report_jobs[0].job_id: e}
+            else:
+                try:
+                    outcomes = run_report_batch(report_jobs)
+                except Exception as e:
+                    outcomes = {report_job.job_id: e for report_job in report_jobs}
+        finally:
+            done.set()
+            heartbeat_thread.join()
+        elapsed = time.time() - start
+        return [self.record_result(job, outcomes.get(report_job.job_id), start, elapsed, len(jobs))
+                for job, report_job in zip(jobs, report_jobs)]
+
+    def record_result(self, job, outcome, start, elapsed, batch_size):
+        """
+        Records the outcome of a job in the spool.
+
+        Args:
+            job (dict): The claimed job.
+            outcome: The report path, or the exception that stopped the job.
+            start (float): When the job started.
+            elapsed (float): Seconds it took.
+            batch_size (int): Jobs run together with it.
+
+        Returns:
+            dict: The recorded result, or None if the lease was lost.
+        """
+        from hs import JobCancelled
+
+        job_id = job['job_id']
+        if job_id in self.lost:
+            self.lost.discard(job_id)
+            return None
+        if isinstance(outcome, JobCancelled):
+            result, failed = {'status': 'cancelled'}, True
+        elif isinstance(outcome, BaseException) or outcome is None:
+            logging.error(f"Job {job_id} failed: {outcome}")
+            result, failed = {'status': 'failed', 'error': f"{type(outcome).__name__}: {outcome}"}, True
+        else:
+            result, failed = {'status': 'done', 'output_path': outcome}, False
+        result.update(file_path=job['file_path'], attempts=job['attempts'], started=start, elapsed=elapsed,
+                      batch_size=batch_size)
+        try:
+            self.spool.complete(job_id, self.worker_id, result, failed=failed)
+        except LeaseLost:
+            logging.warning(f"Job {job_id} was re-queued before it finished; discarding its result")
+            return None
+        logging.info(f"Job {job_id} {result['status']} in {elapsed:.1f}s")
+        return result
@@ -0,0 +1,174 @@
+import ast
+import os
+import re
+import textwrap
+
+from code_validation import METHOD_NAME
+
+# One edit of a patch answer: the lines to find and the lines replacing them
+EDIT_PATTERN = re.compile(r'^[ \t]*<{5,}[ \t]*SEARCH[ \t]*\n(.*?)^[ \t]*={5,}[ \t]*\n(.*?)^[ \t]*>{5,}[ \t]*REPLACE[ \t]*$',
+                          re.DOTALL | re.MULTILINE)
+
+# Methods shorter than this are cheap to rewrite in full
+PATCH_MIN_LINES = 30
+
+# Line between the current method and the instructions in the improvement prompts
+PROMPT_SEPARATOR = '=== SEPARATOR ==='
+
+# The rule of the improvement prompts that asks for the whole method as the answer
+REWRITE_RULE_PATTERN = re.compile(r'^[ \t]*\d+\.[ \t]*Code Execution:[ \t]*\n(?:[ \t]+-[^\n]*\n?)+', re.MULTILINE)
+
+# The heading of the examples of whole improved methods in the improvement prompts
+EXAMPLES_PATTERN = re.compile(r'^[ \t#*]*Examples:?[ \t*]*$', re.MULTILINE)
+
+
+class PatchError(ValueError):
+    """Raised when a patch answer cannot be parsed or applied to the current method."""
+
+
+def patches_enabled():
+    """
+    Returns True unless patch-based improvements are turned off with HS_FILEINFO_PATCHES=0.
+    """
+    return os.getenv('HS_FILEINFO_PATCHES', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def should_patch(current_method):
+    """
+    Returns True if an improvement of the method should be requested as a patch.
+
+    Args:
+        current_method (str): The current method code.
+    """
+    return patches_enabled() and len(current_method.strip().splitlines()) >= PATCH_MIN_LINES
+
+
+def strip_rewrite_instructions(prompt):
+    """
+    Turns a formatted improvement prompt into the start of a patch prompt: the
+    task, rules and packages stay, while the rule asking for the whole method and
+    the examples of whole improved methods are removed.
+
+    Args:
+        prompt (str): The improvement prompt, formatted with the current method.
+
+    Returns:
+        str: The prompt without them.
+    """
+    # Only the instructions are edited, never the current method quoted above them
+    head, separator, instructions = prompt.rpartition(PROMPT_SEPARATOR)
+    examples = EXAMPLES_PATTERN.search(instructions)
+    if examples:
+        instructions = instructions[:examples.start()]
+    return head + separator + REWRITE_RULE_PATTERN.sub('', instructions).rstrip() + "\n"
+
+
+def parse_patch(answer):
+    """
+    Reads the edits of a patch answer.
+
+    Each edit is a SEARCH/REPLACE block. An empty SEARCH part adds the REPLACE
+    lines before the final return statement of the method. Markdown fences and
+    prose around the blocks are ignored.
+
+    Args:
+        answer (str): The raw model answer.
+
+    Returns:
+        list: ``(search, replace)`` pairs, in order.
+
+    Raises:
+        PatchError: If the answer holds no edit.
+    """
+    edits = EDIT_PATTERN.findall(answer or "")
+    if not edits:
+        raise PatchError("The answer holds no SEARCH/REPLACE edit.")
+    return edits
+
+
+def final_return_line(code):
+    """
+    Returns the index of the line holding the last top-level return statement of
+    the method, and its indentation.
+
+    Raises:
+        PatchError: If the method has no such statement.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise PatchError(f"The current method does not parse: {e.msg}")
+    methods = [node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == METHOD_NAME]
+    if not methods or not isinstance(methods[-1].body[-1], ast.Return):
+        raise PatchError(f"'{METHOD_NAME}' does not end with a return statement.")
+    statement = methods[-1].body[-1]
+    line = code.splitlines()[statement.lineno - 1]
+    return statement.lineno - 1, line[:len(line) - len(line.lstrip())]
+
+
+def find_block(lines, search_lines):
+    """
+    Finds where a block of lines occurs in the code, first exactly, then ignoring
+    indentation and trailing spaces.
+
+    Returns:
+        tuple: The start index and the indentation difference to apply to the
+        replacement, as the indent of the found block minus that of the search block.
+
+    Raises:
+        PatchError: If the block is missing or occurs more than once.
+    """
+    size = len(search_lines)
+    for normalize in (lambda line: line.rstrip(), lambda line: line.strip()):
+        wanted = [normalize(line) for line in search_lines]
+        matches = [start for start in range(len(lines) - size + 1)
+                   if [normalize(line) for line in lines[start:start + size]] == wanted]
+        if len(matches) > 1:
+            raise PatchError(f"The SEARCH block starting with '{search_lines[0].strip()}' occurs {len(matches)} times.")
+        if matches:
+            start = matches[0]
+            found, searched = lines[start], search_lines[0]
+            return start, (len(found) - len(found.lstrip())) - (len(searched) - len(searched.lstrip()))
+    raise PatchError(f"The SEARCH block starting with '{search_lines[0].strip()}' was not found.")
+
+
+def shift_indent(lines, difference):
+    if difference > 0:
+        return [" " * difference + line if line.strip() else line for line in lines]
+    if difference < 0:
+        return [line[min(-difference, len(line) - len(line.lstrip())):] for line in lines]
+    return lines
+
+
+def apply_patch(code, edits):
+    """
+    Applies edits to method code.
+
+    Args:
+        code (str): The current method code.
+        edits (list): ``(search, replace)`` pairs from parse_patch.
+
+    Returns:
+        str: The patched code.
+
+    Raises:
+        PatchError: If an edit does not match the code exactly once.
+    """
+    lines = code.rstrip("\n").splitlines()
+    for search, replace in edits:
+        search_lines = search.splitlines()
+        while search_lines and not search_lines[-1].strip():
+            search_lines.pop()
+        while search_lines and not search_lines[0].strip():
+            search_lines.pop(0)
+        replace_lines = replace.rstrip("\n").splitlines()
+
+        if not search_lines:
+            index, indent = final_return_line("\n".join(lines))
+            block = [indent + line if line.strip() else line for line in textwrap.dedent(replace.rstrip("\n")).splitlines()]
+            lines[index:index] = block
+            continue
+
+        start, difference = find_block(lines, search_lines)
+        lines[start:start + len(search_lines)] = shift_indent(replace_lines, difference)
+    return "\n".join(lines) + "\n"
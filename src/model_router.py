@@ -0,0 +1,182 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# Task types sent to the model
+CORRECTION = 'correction'
+IMPROVEMENT = 'improvement'
+PATCH = 'patch'
+CONTEXT = 'context'
+SERIALIZE = 'serialize'
+
+# Model tiers, from the fastest to the strongest
+DEFAULT_TIERS = ['gemini-1.5-flash', 'gemini-pro']
+
+# Tier each task starts on
+DEFAULT_ROUTES = {CORRECTION: 0, IMPROVEMENT: 0, PATCH: 0, CONTEXT: 0, SERIALIZE: 0}
+
+
+class TierStats:
+    """
+    Latency and success rate of one model tier for one task type.
+    """
+
+    def __init__(self, window=20):
+        self.calls = 0
+        self.successes = 0
+        self.total_latency = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, latency, success):
+        self.calls += 1
+        self.successes += int(success)
+        self.total_latency += latency
+        self.recent.append(success)
+
+    @property
+    def recent_success_rate(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 1.0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'success_rate': self.successes / self.calls if self.calls else None,
+            'recent_success_rate': self.recent_success_rate,
+            'mean_latency': self.total_latency / self.calls if self.calls else None,
+        }
+
+
+class ModelRouter:
+    """
+    Sends each task type to a configurable model tier, and moves up to a stronger
+    tier only when the answer of a cheaper one fails validation.
+
+    When a tier's recent success rate for a task drops below min_success_rate, the
+    task starts on the next tier, except for every probe_interval-th call, which
+    still tries the cheaper tier so it can recover.
+
+    Attributes:
+        tiers (list): Model IDs from the fastest to the strongest.
+        routes (dict): Starting tier index for each task type.
+    """
+
+    def __init__(self, tiers=None, routes=None, min_success_rate=0.3, min_calls=5, probe_interval=10):
+        """
+        Initializes the router.
+
+        Args:
+            tiers (list): Model IDs from the fastest to the strongest.
+            routes (dict): Starting tier for each task type, as an index or a model ID.
+            min_success_rate (float): Recent success rate below which a tier is skipped.
+            min_calls (int): Calls needed on a tier before it can be skipped.
+            probe_interval (int): Every this many calls, skipped tiers are tried again.
+        """
+        self.tiers = list(tiers or DEFAULT_TIERS)
+        self.routes = dict(DEFAULT_ROUTES)
+        for task, tier in (routes or {}).items():
+            self.routes[task] = self.tiers.index(tier) if isinstance(tier, str) else tier
+        self.min_success_rate = min_success_rate
+        self.min_calls = min_calls
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.task_calls = {}
+
+    def tier_stats(self, task, model):
+        key = (task, model)
+        if key not in self.stats:
+            self.stats[key] = TierStats()
+        return self.stats[key]
+
+    def starting_tier(self, task):
+        """
+        Returns the tier index a task should start on.
+
+        Args:
+            task (str): The task type.
+        """
+        tier = min(self.routes.get(task, 0), len(self.tiers) - 1)
+        with self.lock:
+            calls = self.task_calls.get(task, 0)
+            self.task_calls[task] = calls + 1
+            if calls % self.probe_interval == 0:
+                return tier
+            while tier < len(self.tiers) - 1:
+                stats = self.tier_stats(task, self.tiers[tier])
+                if stats.calls < self.min_calls or stats.recent_success_rate >= self.min_success_rate:
+                    break
+                tier += 1
+        return tier
+
+    def run(self, task, call, validate=None):
+        """
+        Runs a model call for a task, escalating through the tiers until the answer
+        passes validation.
+
+        Args:
+            task (str): The task type.
+            call (callable): ``call(model_id)`` that returns the answer, or None on failure.
+            validate (callable): Optional ``validate(answer)`` returning True if the
+                answer is usable. Defaults to accepting any non-empty answer.
+
+        Returns:
+            The first valid answer, or the strongest tier's answer if none was valid.
+        """
+        answer = None
+        for tier in range(self.starting_tier(task), len(self.tiers)):
+            model = self.tiers[tier]
+            start = time.monotonic()
+            answer = call(model)
+            latency = time.monotonic() - start
+
+            success = bool(answer) and (validate is None or validate(answer))
+            with self.lock:
+                self.tier_stats(task, model).record(latency, success)
+            if success:
+                return answer
+            if tier + 1 < len(self.tiers):
+                logging.info(f"Answer from {model} for {task} failed validation; moving up to {self.tiers[tier + 1]}")
+        return answer
+
+    def get_stats(self):
+        """
+        Returns latency and success statistics per task type and model.
+
+        Returns:
+            dict: ``{task: {model: stats}}``.
+        """
+        with self.lock:
+            result = {}
+            for (task, model), stats in self.stats.items():
+                result.setdefault(task, {})[model] = stats.as_dict()
+            return result
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """
+    Returns the shared ModelRouter, created on first use.
+
+    The tiers can be set with HS_FILEINFO_MODEL_TIERS, a comma-separated list of
+    model IDs from the fastest to the strongest, and the starting tier of a task
+    with HS_FILEINFO_ROUTE_<TASK> (for example HS_FILEINFO_ROUTE_IMPROVEMENT=gemini-pro).
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                tiers = [tier.strip() for tier in os.getenv('HS_FILEINFO_MODEL_TIERS', '').split(',') if tier.strip()]
+                tiers = tiers or DEFAULT_TIERS
+                routes = {}
+                for task in DEFAULT_ROUTES:
+                    tier = os.getenv(f'HS_FILEINFO_ROUTE_{task.upper()}')
+                    if tier in tiers:
+                        routes[task] = tier
+                    elif tier and tier.isdigit():
+                        routes[task] = int(tier)
+                _router = ModelRouter(tiers=tiers, routes=routes)
+    return _router
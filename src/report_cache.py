@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from cache_utils import default_cache_dir, write_atomic
+from file_report import FileReport, LAYOUT_VERSION
+
+# Bytes of reports kept on disk before the least recently used ones are removed
+DEFAULT_MAX_BYTES = 512 * 2 ** 20
+
+
+def file_digest(path, chunk_size=2 ** 20):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ReportCache:
+    """
+    Cache of rendered PDF reports on disk.
+
+    A report is stored under two keys: one for the sanitized result, the images
+    it shows and the layout version, and one for the contextual information.
+    Since the context is often still being generated when layout starts, the first
+    key alone tells whether waiting for the context to reuse a report is worthwhile.
+
+    Once the stored reports exceed max_bytes, the least recently used ones are
+    removed. Use is tracked by modification time, which a hit refreshes, so the
+    order survives restarts.
+
+    Attributes:
+        cache_dir (str): Directory holding the reports.
+        max_bytes (int): Bytes of reports kept on disk.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initializes the cache.
+
+        Args:
+            cache_dir (str): Directory holding the reports. Defaults to <cache dir>/reports.
+            max_bytes (int): Bytes of reports kept on disk.
+        """
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), 'reports')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Sizes of the stored reports by path, least recently used first; read from disk on first use
+        self.entries = None
+        self.total_bytes = 0
+        # Image digests by (path, size, modification time), so unchanged images are hashed once
+        self.image_digests = {}
+        self.hits = 0
+        self.misses = 0
+
+    def data_key(self, data):
+        """
+        Builds the key of a cleaned extractor result.
+
+        Args:
+            data (dict): The result, as passed to FileReport.
+
+        Returns:
+            str: A hex digest covering the sanitized values, the content of the images
+            the report shows, and LAYOUT_VERSION.
+        """
+        data = FileReport.sanitize_data(data)
+        items = sorted(([str(key), value] for key, value in data.items()), key=lambda item: item[0])
+        images = sorted({value for value in data.values()
+                         if isinstance(value, str) and FileReport.is_supported_image(value) and os.path.isfile(value)})
+        digest = hashlib.sha256(f'layout {LAYOUT_VERSION}\x00'.encode('utf-8'))
+        digest.update(json.dumps(items, default=str, ensure_ascii=False).encode('utf-8'))
+        for image_path in images:
+            digest.update(f'\x00{image_path}\x00{self.image_digest(image_path)}'.encode('utf-8'))
+        return digest.hexdigest()
+
+    def image_digest(self, path):
+        try:
+            stat = os.stat(path)
+            identity = (path, stat.st_size, stat.st_mtime_ns)
+            with self.lock:
+                if identity in self.image_digests:
+                    return self.image_digests[identity]
+            digest = file_digest(path)
+        except OSError:
+            return 'missing'
+        with self.lock:
+            self.image_digests[identity] = digest
+        return digest
+
+    @staticmethod
+    def context_key(context_info):
+        return hashlib.sha256((context_info or '').encode('utf-8')).hexdigest()[:16]
+
+    def path_for(self, data_key, context_info):
+        return os.path.join(self.cache_dir, data_key[:2], f'{data_key}-{self.context_key(context_info)}.pdf')
+
+    def has_data(self, data_key):
+        """
+        Returns True if a report was stored for this result with any contextual information.
+
+        Args:
+            data_key (str): A key from data_key.
+        """
+        try:
+            names = os.listdir(os.path.join(self.cache_dir, data_key[:2]))
+        except OSError:
+            return False
+        return any(name.startswith(f'{data_key}-') for name in names)
+
+    def fetch(self, data_key, context_info, output_path):
+        """
+        Writes the cached report for a result and its contextual information to a path.
+
+        Args:
+            data_key (str): A key from data_key.
+            context_info (str): The contextual information, or None.
+            output_path (str): Where the report is written.
+
+        Returns:
+            bool: True if a cached report was written.
+        """
+        path = self.path_for(data_key, context_info)
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+            write_atomic(output_path, content)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return False
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+            self.load_entries()
+            if path in self.entries:
+                self.entries.move_to_end(path)
+        return True
+
+    def store(self, data_key, context_info, output_path):
+        """
+        Stores a rendered report.
+
+        Args:
+            data_key (str): A key from data_key.
+            context_info (str): The contextual information, or None.
+            output_path (str): The rendered report.
+        """
+        path = self.path_for(data_key, context_info)
+        try:
+            with open(output_path, 'rb') as file:
+                content = file.read()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, content)
+        except OSError as e:
+            logging.warning(f"Could not write report cache entry: {e}")
+            return
+        with self.lock:
+            self.load_entries()
+            self.total_bytes += len(content) - self.entries.pop(path, 0)
+            self.entries[path] = len(content)
+            self.evict()
+
+    def load_entries(self):
+        """
+        Reads the sizes of the stored reports, oldest first, unless they were read before.
+        """
+        if self.entries is not None:
+            return
+        found = []
+        try:
+            prefixes = os.listdir(self.cache_dir)
+        except OSError:
+            prefixes = []
+        for prefix in prefixes:
+            try:
+                names = os.listdir(os.path.join(self.cache_dir, prefix))
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(self.cache_dir, prefix, name)
+                try:
+                    if name.endswith('.pdf'):
+                        stat = os.stat(path)
+                        found.append((stat.st_mtime, path, stat.st_size))
+                except OSError:
+                    # Removed by another process meanwhile
+                    continue
+        self.entries = OrderedDict((path, size) for _, path, size in sorted(found))
+        self.total_bytes = sum(self.entries.values())
+
+    def evict(self):
+        """
+        Removes the least recently used reports until the cache fits in max_bytes.
+        The newest report is kept even if it is larger than that.
+        """
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            path, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Could not remove report cache entry {path}: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes': self.total_bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_report_cache():
+    """
+    Returns the shared ReportCache, created on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReportCache()
+    return _cache
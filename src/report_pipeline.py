@@ -0,0 +1,692 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from hs import MyClass, JobCancelled, update_method_logic, generate_improved_method, generate_improved_method_batch
+from hs import generate_context_info, generate_context_info_batch, clean_info_dict
+from hs import get_client_stats, get_routing_stats
+from code_validation import prepare_method_code, CodeValidationError
+from result_store import BlobStore
+from corpus_validation import find_sample_files, get_extractor_stats, CorpusReport
+
+# Threads generating contextual information while reports are laid out
+CONTEXT_WORKERS = 4
+
+ORIGINAL_METHOD_LOGIC = """
+def read_file_info(instance):
+    return {'path': instance.file_path}
+"""
+
+
+class ReportJob:
+    """
+    A single report generation request, with its own method logic module and cancel flag.
+
+    Attributes:
+        job_id (str): Short unique identifier of the job.
+        file_path (str): The path to the file being processed.
+        output_path (str): The path where the PDF report will be saved.
+        improvements (int): The number of improvements to apply.
+        module_name (str): The method logic module used only by this job.
+        cancel_event (threading.Event): Set when the job is cancelled.
+        sample_files (list): Files of the same type that candidate extractors are
+            validated on, or None to pick them from the file's directory.
+        validation_samples (int): Number of sample files picked when sample_files is None.
+        extractor_version (ExtractorVersion): The registry version the job started from, or None.
+        cancel_listeners (list): Callables called after the job is cancelled.
+    """
+
+    def __init__(self, file_path, output_path, improvements, reuse_extractors=True, sample_files=None,
+                 validation_samples=4):
+        """
+        Initializes the job.
+
+        Args:
+            file_path (str): The path to the file being processed.
+            output_path (str): The path where the PDF report will be saved.
+            improvements (int): The number of improvements to apply.
+            reuse_extractors (bool): True to start from the extractor of the most similar
+                file processed before, and to add this file's extractor to the index.
+                A reused extractor with a good record on other files is used without
+                further improvements.
+            sample_files (list): Files of the same type that candidate extractors are
+                validated on, or None to pick them from the file's directory.
+            validation_samples (int): Number of sample files picked when sample_files
+                is None. 0 disables corpus validation.
+        """
+        self.job_id = uuid.uuid4().hex[:8]
+        self.file_path = file_path
+        self.output_path = output_path
+        self.improvements = improvements
+        self.reuse_extractors = reuse_extractors
+        self.module_name = f'method_logic_{self.job_id}'
+        self.cancel_event = threading.Event()
+        self.sample_files = sample_files
+        self.validation_samples = validation_samples
+        self.extractor_version = None
+        self.cancel_listeners = []
+
+    @property
+    def method_logic_path(self):
+        return os.path.join(os.path.dirname(__file__), f'{self.module_name}.py')
+
+    def intermediate_logic_path(self, iteration):
+        return os.path.join(os.path.dirname(__file__), f'intermediate_logic_{self.job_id}_iteration_{iteration}.txt')
+
+    def cancel(self):
+        """
+        Requests cancellation. Pending LLM calls and extractor runs are skipped.
+        """
+        self.cancel_event.set()
+        for listener in list(self.cancel_listeners):
+            listener()
+
+    @property
+    def file_type(self):
+        return os.path.splitext(self.file_path)[1].lower()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """
+        Raises JobCancelled if the job was cancelled.
+        """
+        if self.cancelled:
+            raise JobCancelled()
+
+    def corpus_samples(self):
+        """
+        Returns the sample files candidate extractors are validated on.
+        """
+        if self.sample_files is not None:
+            return [path for path in self.sample_files if path != self.file_path][:max(self.validation_samples, 0)]
+        if self.validation_samples <= 0:
+            return []
+        return find_sample_files(self.file_path, self.validation_samples)
+
+    def reset_method_logic(self, code=ORIGINAL_METHOD_LOGIC):
+        """
+        Writes the original method logic, or the given code, to the job's module.
+
+        Args:
+            code (str): The method logic to start from.
+        """
+        with open(self.method_logic_path, 'w') as file:
+            file.write(code)
+
+    def read_method_logic(self):
+        with open(self.method_logic_path, 'r') as file:
+            return file.read()
+
+    def remove_method_logic(self):
+        """
+        Removes the job's method logic module and intermediate files from disk,
+        and the module from the import cache.
+        """
+        sys.modules.pop(self.module_name, None)
+        paths = [self.method_logic_path]
+        paths += [self.intermediate_logic_path(iteration + 1) for iteration in range(self.improvements)]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def truncate_value(value, max_length=100):
+    """Truncate the value if it exceeds max_length."""
+    if isinstance(value, str) and len(value) > max_length:
+        return value[:max_length] + '...'
+    return value
+
+
+def default_json_serializer(obj):
+    try:
+        if isinstance(obj, bytes):
+            return obj.decode('utf-8', errors='ignore')
+        return str(obj)
+    except Exception as e:
+        logging.warning(f"Skipping non-serializable object: {obj}. Error: {e}")
+        return None
+
+
+_context_executor = None
+_context_executor_lock = threading.Lock()
+
+def get_context_executor():
+    """
+    Returns the shared executor that generates contextual information alongside PDF layout.
+    """
+    global _context_executor
+    if _context_executor is None:
+        with _context_executor_lock:
+            if _context_executor is None:
+                _context_executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix='context')
+    return _context_executor
+
+
+def seed_from_registry(job):
+    """
+    Starts the job from the registry version serving its file type: the active
+    version, or the candidate for the share of files on trial.
+
+    Args:
+        job (ReportJob): The job to seed.
+
+    Returns:
+        bool: True if a registry version was picked.
+    """
+    from extractor_registry import get_extractor_registry
+
+    version = get_extractor_registry().select(job.file_type, job.file_path)
+    if version is None:
+        return False
+    logging.info(f"Starting {job.file_path} from registry extractor {version.version_id}")
+    job.reset_method_logic(version.code)
+    job.extractor_version = version
+    return True
+
+
+def publish_to_registry(job, final_result):
+    """
+    Offers the job's final extractor to the registry, unless it is the version the
+    job started from. It becomes the type's active version or a candidate.
+
+    Args:
+        job (ReportJob): The finished job.
+        final_result (dict): The final extractor result for the file.
+    """
+    from extractor_registry import get_extractor_registry
+
+    extractor_code = job.read_method_logic()
+    if extractor_code.strip() == ORIGINAL_METHOD_LOGIC.strip() or 'error' in final_result:
+        return
+    if job.extractor_version is not None and extractor_code == job.extractor_version.code:
+        return
+    get_extractor_registry().publish(job.file_type, extractor_code)
+
+
+def seed_from_index(job):
+    """
+    Starts the job from the extractor of the most similar file processed before.
+
+    Args:
+        job (ReportJob): The job to seed.
+
+    Returns:
+        bool: True if a known extractor was reused.
+    """
+    from extractor_index import get_extractor_index, file_features
+
+    try:
+        match = get_extractor_index().best_extractor(file_features(job.file_path))
+    except Exception as e:
+        logging.warning(f"Extractor index lookup failed: {e}")
+        return False
+    if match is None:
+        return False
+
+    similarity, extractor_code = match
+    logging.info(f"Reusing known extractor for {job.file_path} (similarity {similarity:.3f})")
+    job.reset_method_logic(extractor_code)
+    return True
+
+
+def record_in_index(job, final_result):
+    """
+    Adds the job's file and its final extractor to the extractor index.
+
+    Args:
+        job (ReportJob): The finished job.
+        final_result (dict): The final extractor result for the file.
+    """
+    from extractor_index import get_extractor_index, file_features
+
+    extractor_code = job.read_method_logic()
+    if extractor_code.strip() == ORIGINAL_METHOD_LOGIC.strip():
+        return
+    try:
+        index = get_extractor_index()
+        index.add(file_features(job.file_path, final_result), extractor_code, job.file_path)
+        index.save()
+    except Exception as e:
+        logging.warning(f"Could not add extractor to the index: {e}")
+
+
+def record_final_run(job, final_result, runtime):
+    """
+    Adds the final extractor run on the job's file to the extractor's statistics.
+    It counts towards the success rate and runtime, not towards validation.
+
+    Args:
+        job (ReportJob): The finished job.
+        final_result (dict): The final extractor result for the file.
+        runtime (float): Seconds the final run took.
+    """
+    from extractor_index import extractor_id
+
+    ok = isinstance(final_result, dict) and 'error' not in final_result
+    report = CorpusReport({job.file_path: {'ok': ok, 'runtime': runtime, 'keys': len(final_result), 'error': None}})
+    get_extractor_stats().record(extractor_id(job.read_method_logic()), report, job.file_type,
+                                corpus=False)
+
+
+def starting_improvements(job):
+    """
+    Seeds the job from the extractor index or registry and returns how many improvements it needs.
+
+    The index is asked first, since it matches the file's content. The registry,
+    which only knows the file type, is the fallback when no indexed file is similar enough.
+
+    Args:
+        job (ReportJob): The job to start.
+
+    Returns:
+        int: The job's improvements, or 0 if the reused extractor is validated on other files.
+    """
+    if job.reuse_extractors and (seed_from_index(job) or seed_from_registry(job)):
+        from extractor_index import extractor_id
+
+        if get_extractor_stats().is_validated(extractor_id(job.read_method_logic())):
+            logging.info(f"Reused extractor is validated on other files; skipping improvements for {job.file_path}")
+            return 0
+    return job.improvements
+
+
+def context_request(job, final_result, text_content):
+    """
+    Builds the generate_context_info arguments for a job's final result.
+
+    Args:
+        job (ReportJob): The job.
+        final_result (dict): The final extractor result. Its text is moved back in
+            for the report.
+        text_content (str): Text extracted during the improvements, if any. Without
+            it, the text of PDF, DOCX and PPTX files is sampled from the file.
+
+    Returns:
+        dict: The keyword arguments for generate_context_info.
+    """
+    from text_extraction import sample_text
+
+    text_content = final_result.pop('text', None) or text_content
+    if text_content:
+        final_result['text'] = text_content
+        return {'text_content': text_content}
+
+    # Documents whose extractor returned no text are sampled directly, stopping early
+    text_content = sample_text(file_path=job.file_path, cancel_event=job.cancel_event)
+    if text_content:
+        return {'text_content': text_content}
+
+    additional_info = json.dumps(
+        {k: truncate_value(v) for k, v in final_result.items() if 'error' not in str(k).lower() and v is not None and v != ''},
+        indent=2,
+        default=default_json_serializer
+    )
+    return {'text_content': None, 'file_name': os.path.basename(job.file_path),
+            'file_extension': os.path.splitext(job.file_path)[1], 'additional_info': additional_info}
+
+
+def finish_extraction(job, instance):
+    """
+    Runs the job's final extraction and records its extractor.
+
+    Args:
+        job (ReportJob): The job.
+        instance (MyClass): The instance running the job's method logic.
+
+    Returns:
+        dict: The final extractor result.
+    """
+    start = time.perf_counter()
+    final_result = instance.dynamic_method()
+    final_runtime = time.perf_counter() - start
+    job.check_cancelled()
+
+    if job.reuse_extractors:
+        record_in_index(job, final_result)
+        record_final_run(job, final_result, final_runtime)
+        publish_to_registry(job, final_result)
+    return final_result
+
+
+def write_report(job, report, context_info, data_key=None):
+    """
+    Adds the contextual information to a laid out report and writes it.
+
+    Args:
+        job (ReportJob): The job.
+        report (FileReport): The report, after generate_pdf.
+        context_info (str): The contextual information, or None.
+        data_key (str): Optional report cache key of the result. If given, the
+            report is stored in the report cache.
+
+    Returns:
+        str: The path of the generated PDF report.
+    """
+    from report_cache import get_report_cache
+
+    job.check_cancelled()
+    if context_info:
+        report.add_context_info(context_info)
+    report.finalize_pdf(job.output_path)
+    if data_key is not None:
+        get_report_cache().store(data_key, context_info, job.output_path)
+    logging.info(f"PDF report generated successfully at {job.output_path}")
+    return job.output_path
+
+
+def reuse_report(job, data_key, context_info):
+    """
+    Writes the cached report of an unchanged result and context, with no layout work.
+
+    Args:
+        job (ReportJob): The job.
+        data_key (str): The report cache key of the cleaned result.
+        context_info (str): The contextual information, or None.
+
+    Returns:
+        str: The path of the report, or None if no matching report was cached.
+    """
+    from report_cache import get_report_cache
+
+    job.check_cancelled()
+    if not get_report_cache().fetch(data_key, context_info, job.output_path):
+        return None
+    logging.info(f"Reused the cached report for {job.file_path} at {job.output_path}")
+    return job.output_path
+
+
+def run_report_generation(job, progress_callback=None, context_callback=None):
+    """
+    Improves the method logic for the job's file and writes the PDF report.
+
+    Args:
+        job (ReportJob): The job to run.
+        progress_callback (callable): Optional ``callback(percent, message)`` called
+            from the worker thread as the job advances.
+        context_callback (callable): Optional ``callback(text)`` called from the worker
+            thread with the contextual information received so far while it streams in.
+
+    Returns:
+        str: The path of the generated PDF report.
+
+    Raises:
+        JobCancelled: If the job is cancelled before it finishes.
+    """
+    from file_report import FileReport
+    from report_cache import get_report_cache
+
+    def report_progress(value, message):
+        if progress_callback is not None:
+            progress_callback(value, message)
+
+    context_parts = []
+
+    def report_context_chunk(chunk):
+        context_parts.append(chunk)
+        if context_callback is not None:
+            context_callback("".join(context_parts))
+
+    def reset_context_preview():
+        context_parts.clear()
+        if context_callback is not None:
+            context_callback("")
+
+    job.reset_method_logic()
+    # Large extracted values are kept on disk for the duration of the job
+    blob_store = BlobStore()
+    try:
+        improvements = starting_improvements(job)
+        sample_files = job.corpus_samples() if improvements else []
+        instance = MyClass(job.file_path, module_name=job.module_name, cancel_event=job.cancel_event,
+                           blob_store=blob_store, extractor=job.extractor_version)
+        text_content = None
+
+        for iteration in range(improvements):
+            job.check_cancelled()
+            report_progress(int(iteration / improvements * 100), f"Improvement {iteration + 1} of {improvements}")
+
+            current_method = job.read_method_logic()
+
+            last_result = instance.dynamic_method()
+            text_content = last_result.pop('text', None)
+
+            job.check_cancelled()
+            improved_method = generate_improved_method(current_method, last_result, iteration,
+                                                       cancel_event=job.cancel_event, profile=instance.last_profile)
+            if improved_method is None:
+                logging.warning(f"No improved method returned for iteration {iteration + 1}")
+                continue
+
+            with open(job.intermediate_logic_path(iteration + 1), 'w') as file:
+                file.write(improved_method)
+
+            try:
+                sanitized_method = prepare_method_code(improved_method)
+            except CodeValidationError as e:
+                logging.warning(f"Rejected improved method for iteration {iteration + 1}: {e}")
+                continue
+
+            update_method_logic(sanitized_method, job.file_path, module_name=job.module_name,
+                                cancel_event=job.cancel_event, sample_files=sample_files)
+
+        report_progress(100, "Generating context")
+        final_result = finish_extraction(job, instance)
+
+        # Context generation runs on its own thread while the PDF is laid out
+        context_future = get_context_executor().submit(
+            generate_context_info, on_chunk=report_context_chunk, on_reset=reset_context_preview,
+            cancel_event=job.cancel_event,
+            **context_request(job, final_result, text_content))
+
+        report_progress(100, "Writing report")
+        data = clean_info_dict(final_result)
+        data_key = get_report_cache().data_key(data)
+        output_path = None
+        if get_report_cache().has_data(data_key):
+            # The same result was rendered before, so the report is reused if the context matches too
+            output_path = reuse_report(job, data_key, context_future.result())
+        if output_path is None:
+            report = FileReport(data)
+            report.generate_pdf(job.output_path)
+            output_path = write_report(job, report, context_future.result(), data_key)
+        logging.debug(f"Model pool statistics: {get_client_stats()}")
+        logging.debug(f"Model routing statistics: {get_routing_stats()}")
+        return output_path
+
+    finally:
+        job.remove_method_logic()
+        blob_store.cleanup()
+
+
+def batch_cancel_event(active):
+    """
+    Returns an event that is set once every job still running in a batch is cancelled,
+    so requests made for the whole batch stop only when no job needs them.
+
+    Args:
+        active (list): The jobs still running in the batch. Jobs removed from it later
+            no longer hold the batch back.
+
+    Returns:
+        tuple: The event, and a callable that sets it if every remaining job is cancelled.
+            Call it after removing a job from active.
+    """
+    event = threading.Event()
+
+    def check():
+        if all(job.cancelled for job in list(active)):
+            event.set()
+
+    for job in active:
+        job.cancel_listeners.append(check)
+    check()
+    return event, check
+
+
+def run_report_batch(jobs, progress_callback=None):
+    """
+    Writes the reports of several files of the same type with batched model requests.
+
+    The files share one extractor: each improvement is a single request showing the
+    results for every file, and the candidate is validated on all of them. The
+    contextual information of all files is requested in batches as well, so the
+    number of model calls per file drops roughly by the size of the batch.
+
+    Args:
+        jobs (list): ReportJob objects for files of the same type. The first job's
+            improvements count and extractor settings are used for the batch.
+        progress_callback (callable): Optional ``callback(percent, message)`` called
+            as the batch advances.
+
+    Returns:
+        dict: For each job ID, the path of its report, or the exception that stopped it.
+    """
+    from file_report import FileReport
+    from report_cache import get_report_cache
+
+    def report_progress(value, message):
+        if progress_callback is not None:
+            progress_callback(value, message)
+
+    outcomes = {}
+    active = list(jobs)
+    cancel_event, check_cancelled = batch_cancel_event(active)
+
+    def drop(job, error):
+        outcomes[job.job_id] = error
+        if job in active:
+            active.remove(job)
+            check_cancelled()
+
+    def drop_cancelled():
+        for job in list(active):
+            if job.cancelled:
+                drop(job, JobCancelled())
+        return bool(active)
+
+    leader = jobs[0]
+    for job in jobs:
+        job.reset_method_logic()
+    blob_store = BlobStore()
+    try:
+        improvements = starting_improvements(leader)
+        instances = {job.job_id: MyClass(job.file_path, module_name=leader.module_name,
+                                         cancel_event=job.cancel_event, blob_store=blob_store,
+                                         extractor=leader.extractor_version)
+                     for job in jobs}
+        texts = {}
+
+        for iteration in range(improvements):
+            if not drop_cancelled():
+                break
+            report_progress(int(iteration / improvements * 100), f"Improvement {iteration + 1} of {improvements}")
+
+            current_method = leader.read_method_logic()
+            last_results = []
+            for job in list(active):
+                try:
+                    last_result = instances[job.job_id].dynamic_method()
+                except Exception as e:
+                    logging.error(f"Extraction failed for {job.file_path}: {e}")
+                    drop(job, e)
+                    continue
+                texts[job.job_id] = last_result.pop('text', None)
+                last_results.append(last_result)
+            if not active:
+                break
+
+            profiles = [instances[job.job_id].last_profile for job in active if instances[job.job_id].last_profile]
+            slowest = max(profiles, key=lambda profile: profile['wall_time'], default=None)
+            improved_method = generate_improved_method_batch(current_method, last_results, iteration,
+                                                             cancel_event=cancel_event, profile=slowest)
+            if improved_method is None:
+                logging.warning(f"No improved method returned for iteration {iteration + 1}")
+                continue
+
+            try:
+                sanitized_method = prepare_method_code(improved_method)
+            except CodeValidationError as e:
+                logging.warning(f"Rejected improved method for iteration {iteration + 1}: {e}")
+                continue
+
+            # The other files of the batch are the validation corpus
+            update_method_logic(sanitized_method, active[0].file_path, module_name=leader.module_name,
+                                cancel_event=cancel_event, sample_files=[job.file_path for job in active[1:]])
+
+        report_progress(100, "Generating context")
+        shared_method = leader.read_method_logic()
+        final_results = {}
+        for job in list(active):
+            if job is not leader:
+                job.reset_method_logic(shared_method)
+                job.extractor_version = leader.extractor_version
+            # Without improvements this is the first run, which is the registry version's trial
+            instance = MyClass(job.file_path, module_name=job.module_name, cancel_event=job.cancel_event,
+                               blob_store=blob_store, extractor=None if improvements else leader.extractor_version)
+            try:
+                final_results[job.job_id] = finish_extraction(job, instance)
+            except Exception as e:
+                logging.error(f"Extraction failed for {job.file_path}: {e}")
+                drop(job, e)
+
+        context_jobs = list(active)
+        requests = [context_request(job, final_results[job.job_id], texts.get(job.job_id)) for job in context_jobs]
+        context_future = get_context_executor().submit(generate_context_info_batch, requests, cancel_event=cancel_event)
+
+        report_progress(100, "Writing reports")
+        report_cache = get_report_cache()
+        reports = {}
+        data_keys = {}
+        for job in list(active):
+            try:
+                data = clean_info_dict(final_results[job.job_id])
+                data_keys[job.job_id] = report_cache.data_key(data)
+                if report_cache.has_data(data_keys[job.job_id]):
+                    # Laid out only if the cached report turns out to have another context
+                    continue
+                reports[job.job_id] = FileReport(data)
+                reports[job.job_id].generate_pdf(job.output_path)
+            except Exception as e:
+                logging.error(f"Report layout failed for {job.file_path}: {e}")
+                drop(job, e)
+
+        context_infos = dict(zip([job.job_id for job in context_jobs], context_future.result()))
+        for job in list(active):
+            try:
+                context_info = context_infos.get(job.job_id)
+                output_path = None
+                if job.job_id not in reports:
+                    output_path = reuse_report(job, data_keys[job.job_id], context_info)
+                    if output_path is None:
+                        reports[job.job_id] = FileReport(clean_info_dict(final_results[job.job_id]))
+                        reports[job.job_id].generate_pdf(job.output_path)
+                if output_path is None:
+                    output_path = write_report(job, reports[job.job_id], context_info, data_keys[job.job_id])
+                outcomes[job.job_id] = output_path
+            except Exception as e:
+                drop(job, e)
+        logging.debug(f"Model pool statistics: {get_client_stats()}")
+        logging.debug(f"Model routing statistics: {get_routing_stats()}")
+        return outcomes
+
+    except JobCancelled:
+        if not cancel_event.is_set():
+            raise
+        drop_cancelled()
+        return outcomes
+
+    finally:
+        for job in jobs:
+            job.cancel_listeners.remove(check_cancelled)
+            job.remove_method_logic()
+        blob_store.cleanup()
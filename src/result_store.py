@@ -0,0 +1,337 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# Values larger than this are spilled to disk
+DEFAULT_MAX_VALUE_BYTES = 256 * 1024
+
+# Records larger than this spill their largest values until they fit
+DEFAULT_MAX_RECORD_BYTES = 2 * 1024 * 1024
+
+# Characters or bytes shown in place of a spilled value
+PREVIEW_LENGTH = 200
+
+CHUNK_SIZE = 64 * 1024
+
+
+def estimate_size(value, limit=None):
+    """
+    Estimates the memory a result value holds, in bytes.
+
+    Containers are walked recursively, stopping once the limit is exceeded.
+
+    Args:
+        value (object): The value to measure.
+        limit (int): Optional size after which counting stops.
+
+    Returns:
+        int: The estimated size.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        items = [item for pair in value.items() for item in pair]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value
+    else:
+        return sys.getsizeof(value)
+
+    total = sys.getsizeof(value)
+    for item in items:
+        total += estimate_size(item, None if limit is None else limit - total)
+        if limit is not None and total > limit:
+            break
+    return total
+
+
+class BlobHandle:
+    """
+    Lazy reference to a result value that was spilled to disk.
+
+    str() gives a short description, so reports and prompts that serialize the
+    record stay small. The value itself can be streamed with iter_chunks or
+    loaded with load.
+
+    Attributes:
+        path (str): The file holding the value.
+        kind (str): 'bytes', 'text' or 'json'.
+        size (int): Size of the stored value in bytes.
+        preview (str): The start of the value.
+    """
+
+    def __init__(self, path, kind, size, preview):
+        self.path = path
+        self.kind = kind
+        self.size = size
+        self.preview = preview
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yields the stored value in chunks: bytes for 'bytes', str otherwise.
+        """
+        mode, encoding = ('rb', None) if self.kind == 'bytes' else ('r', 'utf-8')
+        with open(self.path, mode, encoding=encoding) as file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def read_text(self, limit=None):
+        """
+        Returns the value as text, reading at most limit characters.
+
+        Args:
+            limit (int): Maximum number of characters, or None for all.
+        """
+        if self.kind == 'bytes':
+            with open(self.path, 'rb') as file:
+                return file.read(limit if limit is not None else -1).decode('utf-8', errors='ignore')
+        with open(self.path, 'r', encoding='utf-8') as file:
+            return file.read(limit if limit is not None else -1)
+
+    def load(self):
+        """
+        Loads the whole value back into memory.
+        """
+        if self.kind == 'bytes':
+            with open(self.path, 'rb') as file:
+                return file.read()
+        text = self.read_text()
+        return json.loads(text) if self.kind == 'json' else text
+
+    def describe(self):
+        return f"[{format_size(self.size)} {self.kind} value stored on disk] {self.preview}"
+
+    def __str__(self):
+        return self.describe()
+
+    def __repr__(self):
+        return f"BlobHandle({self.path!r}, kind={self.kind!r}, size={self.size})"
+
+    def __len__(self):
+        return self.size
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class BlobWriter:
+    """
+    Writes a result value to the blob store in chunks, so an extractor never has to
+    hold the whole value in memory. Without a store, the chunks are joined in memory.
+
+    Used as a context manager, it is closed when the block ends and the value is in result.
+
+    Attributes:
+        kind (str): 'bytes' or 'text'.
+        size (int): Bytes written so far.
+        result: The BlobHandle, or the value without a store, once closed.
+    """
+
+    def __init__(self, store, kind='bytes'):
+        """
+        Initializes the writer.
+
+        Args:
+            store (BlobStore): The store to write to, or None to keep the value in memory.
+            kind (str): 'bytes' for bytes chunks, or 'text' for str chunks.
+        """
+        if kind not in ('bytes', 'text'):
+            raise ValueError(f"Unknown blob kind: {kind}")
+        self.store = store
+        self.kind = kind
+        self.size = 0
+        self.preview = b''
+        self.digest = hashlib.blake2b(digest_size=16)
+        self.chunks = []
+        self.file = None
+        self.temp_path = None
+        self.closed = False
+        self.result = None
+        if store is not None:
+            fd, self.temp_path = tempfile.mkstemp(dir=store.directory, suffix='.part')
+            self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        """
+        Appends a chunk: bytes for 'bytes' writers, str for 'text' writers.
+        """
+        data = chunk.encode('utf-8') if self.kind == 'text' else bytes(chunk)
+        if len(self.preview) < PREVIEW_LENGTH:
+            self.preview += data[:PREVIEW_LENGTH - len(self.preview)]
+        self.digest.update(data)
+        self.size += len(data)
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.chunks.append(data)
+
+    def close(self):
+        """
+        Finishes the value.
+
+        Returns:
+            The BlobHandle of the stored value, or the value itself without a store.
+        """
+        if not self.closed:
+            self.closed = True
+            self.result = self.finish()
+        return self.result
+
+    def finish(self):
+        if self.file is None:
+            data = b''.join(self.chunks)
+            return data.decode('utf-8') if self.kind == 'text' else data
+        self.file.close()
+        path = os.path.join(self.store.directory, f'{self.digest.hexdigest()}.{self.kind}')
+        with self.store.lock:
+            if os.path.exists(path):
+                os.remove(self.temp_path)
+            else:
+                os.replace(self.temp_path, path)
+        if self.kind == 'bytes':
+            preview = self.preview[:PREVIEW_LENGTH // 2].hex()
+        else:
+            preview = self.preview.decode('utf-8', errors='ignore')
+        return BlobHandle(path, self.kind, self.size, preview)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.file is not None and not self.closed:
+            self.closed = True
+            self.file.close()
+            os.remove(self.temp_path)
+
+
+class BlobStore:
+    """
+    Temporary directory of spilled result values. Identical values are stored once.
+
+    Attributes:
+        directory (str): The directory holding the values.
+    """
+
+    def __init__(self, directory=None):
+        """
+        Initializes the store.
+
+        Args:
+            directory (str): The directory to use. Defaults to a new temporary directory.
+        """
+        self.directory = directory or tempfile.mkdtemp(prefix='hs_fileinfo_blobs_')
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def spill(self, value):
+        """
+        Writes a value to disk and returns a handle to it.
+
+        Args:
+            value (object): bytes, str, or a JSON-serializable value (others are stored as str).
+
+        Returns:
+            BlobHandle: The handle replacing the value.
+        """
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            kind, data = 'bytes', bytes(value)
+            preview = data[:PREVIEW_LENGTH // 2].hex()
+        elif isinstance(value, str):
+            kind, data = 'text', value.encode('utf-8')
+            preview = value[:PREVIEW_LENGTH]
+        else:
+            if hasattr(value, 'tolist'):
+                value = value.tolist()
+            text = json.dumps(value, default=str, ensure_ascii=False)
+            kind, data = 'json', text.encode('utf-8')
+            preview = text[:PREVIEW_LENGTH]
+
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = os.path.join(self.directory, f'{digest}.{kind}')
+        with self.lock:
+            if not os.path.exists(path):
+                with open(path, 'wb') as file:
+                    file.write(data)
+        return BlobHandle(path, kind, len(data), preview)
+
+    def writer(self, kind='bytes'):
+        """
+        Returns a BlobWriter that streams a value into the store.
+
+        Args:
+            kind (str): 'bytes' or 'text'.
+        """
+        return BlobWriter(self, kind)
+
+    def cleanup(self):
+        """
+        Removes the store directory and every spilled value.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ResultRecord(dict):
+    """
+    Extractor result whose large values are kept on disk.
+
+    Values over max_value_bytes are spilled to the blob store, then the largest
+    remaining values are spilled until the record is under max_record_bytes.
+    Spilled values are replaced with BlobHandle objects. The 'path' key is
+    never spilled.
+
+    The cap applies once the extractor has returned, so the whole result is in
+    memory until then. Extractors bound their own peak memory by spilling large
+    values while they build the result, with MyClass.spill and MyClass.blob_writer.
+    """
+
+    @classmethod
+    def from_dict(cls, result, store, max_value_bytes=DEFAULT_MAX_VALUE_BYTES,
+                  max_record_bytes=DEFAULT_MAX_RECORD_BYTES):
+        """
+        Builds a size-capped record from an extractor result.
+
+        Args:
+            result (dict): The extractor result.
+            store (BlobStore): Where large values are spilled.
+            max_value_bytes (int): Largest value kept in memory.
+            max_record_bytes (int): Largest total size kept in memory.
+
+        Returns:
+            ResultRecord: The capped record.
+        """
+        record = cls(result)
+        sizes = {}
+        for key, value in record.items():
+            if key == 'path' or isinstance(value, BlobHandle):
+                continue
+            sizes[key] = estimate_size(value, limit=max_value_bytes)
+
+        total = sum(sizes.values())
+        for key in sorted(sizes, key=sizes.get, reverse=True):
+            if sizes[key] <= max_value_bytes and total <= max_record_bytes:
+                break
+            try:
+                record[key] = store.spill(record[key])
+            except (OSError, TypeError, ValueError) as e:
+                logging.warning(f"Could not spill result value '{key}': {e}")
+                continue
+            total -= sizes[key]
+        return record
+
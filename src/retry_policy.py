@@ -0,0 +1,135 @@
+import errno
+import random
+import time
+
+# Error classes used to pick a retry strategy
+TRANSIENT_IO = 'transient_io'
+QUOTA = 'quota'
+EXTRACTOR_BUG = 'extractor_bug'
+VALIDATION_FAILURE = 'validation_failure'
+
+# errno values that usually clear up on their own (locked, busy or interrupted files)
+TRANSIENT_ERRNOS = {
+    errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.ETIMEDOUT, errno.EWOULDBLOCK, errno.ETXTBSY,
+}
+
+# Windows "file is being used by another process" / "locked region" errors
+TRANSIENT_WINERRORS = {32, 33}
+
+# Exception class names raised by the model SDK (google.api_core) for each class,
+# matched by name so the SDK does not have to be imported here
+QUOTA_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests'}
+TRANSIENT_ERROR_NAMES = {'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError', 'GatewayTimeout'}
+
+
+class ValidationError(ValueError):
+    """Raised when the output of the method logic fails validation."""
+
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when a file has used up its retry deadline."""
+
+
+def classify_error(error):
+    """
+    Sorts an exception into one of the retry error classes.
+
+    Args:
+        error (Exception): The error raised by the method logic or a model call.
+
+    Returns:
+        str: One of TRANSIENT_IO, QUOTA, EXTRACTOR_BUG or VALIDATION_FAILURE.
+    """
+    if isinstance(error, ValidationError):
+        return VALIDATION_FAILURE
+
+    error_names = {cls.__name__ for cls in type(error).__mro__}
+    message = str(error).lower()
+    if error_names & QUOTA_ERROR_NAMES or '429' in message or 'quota' in message or 'rate limit' in message:
+        return QUOTA
+
+    if error_names & TRANSIENT_ERROR_NAMES:
+        return TRANSIENT_IO
+    if isinstance(error, (InterruptedError, BlockingIOError, TimeoutError, ConnectionError)):
+        return TRANSIENT_IO
+    if isinstance(error, OSError):
+        if error.errno in TRANSIENT_ERRNOS or getattr(error, 'winerror', None) in TRANSIENT_WINERRORS:
+            return TRANSIENT_IO
+
+    return EXTRACTOR_BUG
+
+
+class RetryPolicy:
+    """
+    Decides how to react to each class of error: retry after a jittered exponential
+    backoff, ask the model for a correction right away, or give up.
+
+    Attributes:
+        max_retries (dict): Maximum plain retries for each backoff error class.
+        base_delays (dict): First backoff delay in seconds for each backoff error class.
+        max_delay (float): Upper bound for a single backoff delay in seconds.
+        file_deadline (float): Seconds a single file may spend on retries and corrections,
+            counted from the first error of a run.
+    """
+
+    def __init__(self, max_retries=None, base_delays=None, max_delay=30.0, file_deadline=300.0, rng=None):
+        """
+        Initializes the policy.
+
+        Args:
+            max_retries (dict): Overrides for the maximum plain retries per error class.
+            base_delays (dict): Overrides for the first backoff delay per error class.
+            max_delay (float): Upper bound for a single backoff delay in seconds.
+            file_deadline (float): Seconds a single file may spend on retries and corrections,
+                counted from the first error of a run.
+            rng (random.Random): Random generator used for jitter.
+        """
+        self.max_retries = {TRANSIENT_IO: 4, QUOTA: 5}
+        self.max_retries.update(max_retries or {})
+        self.base_delays = {TRANSIENT_IO: 0.25, QUOTA: 2.0}
+        self.base_delays.update(base_delays or {})
+        self.max_delay = max_delay
+        self.file_deadline = file_deadline
+        self.rng = rng or random.Random()
+
+    def should_backoff(self, error_class, attempt):
+        """
+        Returns True if the error should be retried as is, without a correction.
+
+        Args:
+            error_class (str): The class returned by classify_error.
+            attempt (int): How many plain retries were already made for this class.
+        """
+        return attempt < self.max_retries.get(error_class, 0)
+
+    def backoff_delay(self, error_class, attempt):
+        """
+        Computes an exponential backoff delay with "equal jitter" (between half and all of it).
+
+        Args:
+            error_class (str): The class returned by classify_error.
+            attempt (int): How many plain retries were already made for this class.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        ceiling = min(self.max_delay, self.base_delays.get(error_class, 0.0) * (2 ** attempt))
+        return self.rng.uniform(ceiling / 2, ceiling)
+
+    def deadline(self):
+        """
+        Returns the monotonic time by which a file started now must be finished.
+        """
+        return time.monotonic() + self.file_deadline
+
+
+def remaining_time(deadline):
+    """
+    Returns the seconds left until the deadline.
+
+    Args:
+        deadline (float): A time.monotonic() deadline, or None for no deadline.
+    """
+    if deadline is None:
+        return float('inf')
+    return deadline - time.monotonic()
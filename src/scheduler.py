@@ -0,0 +1,242 @@
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+
+from cache_utils import default_cache_dir, write_atomic
+
+# Scheduling policies
+FIFO = 'fifo'
+LONGEST_FIRST = 'longest'
+SHORTEST_FIRST = 'shortest'
+POLICIES = (FIFO, LONGEST_FIRST, SHORTEST_FIRST)
+
+# Jobs running at the same time per type or type family, to keep heavy formats from exhausting memory
+DEFAULT_TYPE_LIMITS = {'video': 1, 'audio': 2, '.pdf': 2}
+
+# Cost estimate for types with no history: fixed model-call overhead plus reading time
+DEFAULT_BASE_SECONDS = 20.0
+DEFAULT_SECONDS_PER_MB = 0.5
+
+# Runs of a type needed before its history replaces the default estimate
+MIN_HISTORY_RUNS = 3
+
+
+def detect_type(file_path):
+    """
+    Returns the type key of a file: its lower-case extension, or 'unknown'.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    return extension or 'unknown'
+
+
+def type_family(file_type):
+    """
+    Returns the broad family of a type key, such as 'audio' or 'video', from its MIME type.
+    """
+    mime_type, _ = mimetypes.guess_type(f'file{file_type}')
+    return mime_type.split('/')[0] if mime_type else 'unknown'
+
+
+class LatencyHistory:
+    """
+    Per-type history of job latency against file size, kept on disk across runs.
+
+    Each type keeps running sums for a least-squares line of seconds against
+    megabytes, so an estimate is a fixed overhead plus a per-megabyte cost.
+
+    Attributes:
+        path (str): The JSON file holding the history.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), 'job_latency.json')
+        self.lock = threading.Lock()
+        self.sums = {}
+        try:
+            with open(self.path, 'r') as file:
+                self.sums = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    def record(self, file_type, size, seconds):
+        """
+        Adds a finished job to the history and saves it.
+
+        Args:
+            file_type (str): The type key.
+            size (int): The file size in bytes.
+            seconds (float): How long the job took.
+        """
+        megabytes = size / 2 ** 20
+        with self.lock:
+            sums = self.sums.setdefault(file_type, {'n': 0, 'x': 0.0, 'y': 0.0, 'xx': 0.0, 'xy': 0.0})
+            sums['n'] += 1
+            sums['x'] += megabytes
+            sums['y'] += seconds
+            sums['xx'] += megabytes * megabytes
+            sums['xy'] += megabytes * seconds
+            data = json.dumps(self.sums).encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_atomic(self.path, data)
+        except OSError as e:
+            logging.warning(f"Could not save job latency history: {e}")
+
+    def estimate(self, file_type, size):
+        """
+        Estimates how long a job takes, in seconds.
+
+        Args:
+            file_type (str): The type key.
+            size (int): The file size in bytes.
+        """
+        megabytes = size / 2 ** 20
+        with self.lock:
+            sums = dict(self.sums.get(file_type) or {})
+        n = sums.get('n', 0)
+        if n < MIN_HISTORY_RUNS:
+            return DEFAULT_BASE_SECONDS + DEFAULT_SECONDS_PER_MB * megabytes
+
+        mean_x, mean_y = sums['x'] / n, sums['y'] / n
+        variance = sums['xx'] / n - mean_x * mean_x
+        if variance <= 1e-9:
+            # All sizes alike: scale the mean latency by size
+            if mean_x > 0:
+                return mean_y * max(megabytes / mean_x, 0.1)
+            return mean_y
+        slope = max((sums['xy'] / n - mean_x * mean_y) / variance, 0.0)
+        intercept = max(mean_y - slope * mean_x, 0.0)
+        return intercept + slope * megabytes
+
+
+class JobScheduler:
+    """
+    Orders pending jobs by estimated cost and limits how many jobs of each type
+    run at the same time in this process.
+
+    With the 'longest' policy the most expensive jobs start first, which keeps
+    one huge file from finishing alone at the end of a batch. With 'shortest',
+    the cheapest jobs start first, which cuts mean turnaround; jobs waiting longer
+    than max_wait seconds are then moved to the front so large files still run.
+
+    Attributes:
+        policy (str): 'fifo', 'longest' or 'shortest'.
+        type_limits (dict): Maximum running jobs per type key or type family.
+        history (LatencyHistory): Latency history used for estimates.
+        max_wait (float): Seconds after which a waiting job goes first under 'shortest'.
+    """
+
+    def __init__(self, policy=LONGEST_FIRST, type_limits=None, history=None, max_wait=3600.0):
+        """
+        Initializes the scheduler.
+
+        Args:
+            policy (str): 'fifo', 'longest' or 'shortest'.
+            type_limits (dict): Maximum running jobs per type key (like '.pdf') or
+                type family (like 'video'). Defaults to DEFAULT_TYPE_LIMITS.
+            history (LatencyHistory): Latency history. Defaults to the one in the cache directory.
+            max_wait (float): Seconds after which a waiting job goes first under 'shortest'.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.policy = policy
+        self.type_limits = dict(DEFAULT_TYPE_LIMITS if type_limits is None else type_limits)
+        self.history = history or LatencyHistory()
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.running = {}
+
+    def estimate_cost(self, job):
+        """
+        Estimates a job's run time in seconds from its type, size and the latency history.
+
+        Args:
+            job (dict): A spool job with 'file_type' and 'size'.
+        """
+        return self.history.estimate(job.get('file_type') or detect_type(job['file_path']), job.get('size') or 0)
+
+    def limit_keys(self, file_type):
+        return [key for key in (file_type, type_family(file_type)) if key in self.type_limits]
+
+    def has_capacity(self, file_type):
+        return all(self.running.get(key, 0) < self.type_limits[key] for key in self.limit_keys(file_type))
+
+    def order(self, jobs, now=None):
+        """
+        Sorts jobs in the order they should start.
+
+        Args:
+            jobs (list): Spool jobs.
+            now (float): The current time, for aging.
+
+        Returns:
+            list: The jobs in start order.
+        """
+        if self.policy == FIFO:
+            return sorted(jobs, key=lambda job: job.get('submitted', 0))
+        costs = {job['job_id']: self.estimate_cost(job) for job in jobs}
+        if self.policy == LONGEST_FIRST:
+            return sorted(jobs, key=lambda job: -costs[job['job_id']])
+
+        now = now or time.time()
+        def shortest_key(job):
+            waited = now - job.get('submitted', now)
+            return (waited < self.max_wait, costs[job['job_id']])
+        return sorted(jobs, key=shortest_key)
+
+    def acquire(self, jobs, claim):
+        """
+        Claims the first job in schedule order whose type has capacity.
+
+        Args:
+            jobs (list): Pending spool jobs.
+            claim (callable): ``claim(job_id)`` that returns the claimed job, or None
+                if another worker took it.
+
+        Returns:
+            dict: The claimed job, or None. Its type slot must be given back with release.
+        """
+        for job in self.order(jobs):
+            if not self.reserve(job):
+                continue
+            claimed = claim(job['job_id'])
+            if claimed is not None:
+                return claimed
+            self.release(job)
+        return None
+
+    def reserve(self, job):
+        """
+        Takes a type slot for a job if its type has capacity.
+
+        Args:
+            job (dict): The job about to be claimed.
+
+        Returns:
+            bool: True if the slot was taken. It must be given back with release.
+        """
+        file_type = job.get('file_type') or detect_type(job['file_path'])
+        with self.lock:
+            if not self.has_capacity(file_type):
+                return False
+            for key in self.limit_keys(file_type):
+                self.running[key] = self.running.get(key, 0) + 1
+        return True
+
+    def release(self, job, seconds=None):
+        """
+        Gives back a job's type slot and records its latency.
+
+        Args:
+            job (dict): The job that finished.
+            seconds (float): How long it took, or None if it did not run.
+        """
+        file_type = job.get('file_type') or detect_type(job['file_path'])
+        with self.lock:
+            for key in self.limit_keys(file_type):
+                self.running[key] -= 1
+        if seconds is not None:
+            self.history.record(file_type, job.get('size') or 0, seconds)
@@ -0,0 +1,437 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from hs import MyClass, update_method_logic, generate_improved_method, generate_context_info
+from hs import clean_info_dict
+from code_validation import prepare_method_code, CodeValidationError
+from result_store import BlobStore
+from report_cache import get_report_cache
+from report_pipeline import starting_improvements, context_request, finish_extraction, reuse_report
+
+# Executor kinds of a stage
+THREAD = 'thread'
+PROCESS = 'process'
+
+# Stages of a report, in order
+DETECT = 'detect'
+EXTRACT = 'extract'
+IMPROVE = 'improve'
+CONTEXT = 'context'
+RENDER = 'render'
+
+# Executor kind, worker count and input queue size of each stage. Extraction runs
+# on threads because each job's extractor is a module of its own that may ask the
+# model for corrections; rendering is CPU-bound and runs in processes.
+DEFAULT_STAGES = {
+    DETECT: {'kind': THREAD, 'workers': 2, 'queue_size': 64},
+    EXTRACT: {'kind': THREAD, 'workers': os.cpu_count() or 2, 'queue_size': 16},
+    IMPROVE: {'kind': THREAD, 'workers': 8, 'queue_size': 16},
+    CONTEXT: {'kind': THREAD, 'workers': 8, 'queue_size': 16},
+    RENDER: {'kind': PROCESS, 'workers': max(1, (os.cpu_count() or 2) // 2), 'queue_size': 16},
+}
+
+# Seconds a stage worker waits on its queues before checking for shutdown
+POLL_INTERVAL = 0.1
+
+
+class Stage:
+    """
+    One stage of a StagedPipeline: a bounded input queue drained by worker threads.
+
+    Items sent back to a stage by a later stage (for example the next improvement
+    round of an extractor) go through an unbounded feedback queue that workers
+    serve first, so loops between stages cannot deadlock on full queues.
+
+    Attributes:
+        name (str): The stage name.
+        kind (str): 'thread', or 'process' to give handlers a process pool through call.
+        workers (int): Number of worker threads, and processes for 'process' stages.
+        queue_size (int): Capacity of the input queue. Producers block when it is full.
+        limiter (AdaptiveLimiter): Optional limiter on how many workers process items at once.
+    """
+
+    def __init__(self, name, handler, kind=THREAD, workers=1, queue_size=16, limiter=None):
+        """
+        Initializes the stage.
+
+        Args:
+            name (str): The stage name.
+            handler (callable): ``handler(item, stage)`` that processes an item and
+                returns the name of the next stage, or None when the item is done.
+            kind (str): 'thread' or 'process'.
+            workers (int): Number of workers.
+            queue_size (int): Capacity of the input queue.
+            limiter (AdaptiveLimiter): Optional limiter on how many workers process
+                items at once. Give the stage as many workers as its maximum.
+        """
+        self.name = name
+        self.handler = handler
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self.limiter = limiter
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.feedback = queue.Queue()
+        self.process_pool = None
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0
+        self.busy_seconds = 0.0
+
+    def call(self, func, *args):
+        """
+        Runs a function in the stage's process pool for 'process' stages, or inline.
+
+        Functions and arguments sent to processes must be picklable. If they are not,
+        the function runs inline instead. They are pickled here first, since the pool
+        pickles on a background thread and reports failures like errors of the call.
+        """
+        if self.process_pool is None:
+            return func(*args)
+        try:
+            pickle.dumps((func, args), protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logging.warning(f"Running {func.__name__} in the {self.name} stage thread: {e}")
+            return func(*args)
+        return self.process_pool.submit(func, *args).result()
+
+    def get(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                return self.feedback.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                return self.inbox.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    def depth(self):
+        return self.inbox.qsize() + self.feedback.qsize()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'kind': self.kind,
+                'workers': self.workers,
+                'queue_depth': self.depth(),
+                'queue_size': self.queue_size,
+                'busy': self.busy,
+                'processed': self.processed,
+                'failed': self.failed,
+                'utilization': self.busy_seconds / self.workers,
+                'limit': self.limiter.limit if self.limiter is not None else self.workers,
+            }
+
+
+class StagedPipeline:
+    """
+    Runs items through named stages connected by bounded queues, so that stages
+    waiting on the network and stages using the CPU work on different items at
+    the same time.
+
+    Attributes:
+        stages (dict): The stages by name, in order.
+    """
+
+    def __init__(self, stages, on_error=None):
+        """
+        Initializes and starts the pipeline.
+
+        Args:
+            stages (list): Stage objects, in order.
+            on_error (callable): ``on_error(item, error)`` called when a handler raises.
+                The item leaves the pipeline.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.on_error = on_error
+        self.stop_event = threading.Event()
+        self.started = time.monotonic()
+        self.threads = []
+        for stage in stages:
+            if stage.kind == PROCESS:
+                # Forking a process that runs many threads is unsafe, so workers are spawned
+                stage.process_pool = ProcessPoolExecutor(max_workers=stage.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self.work, args=(stage,), name=f'{stage.name}-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def put(self, item, stage_name=None, feedback=False):
+        """
+        Sends an item to a stage, blocking while its input queue is full.
+
+        Args:
+            item (object): The item.
+            stage_name (str): The stage. Defaults to the first one.
+            feedback (bool): True for items sent back to an earlier stage, which
+                are queued without a bound.
+        """
+        stage = self.stages[stage_name] if stage_name else next(iter(self.stages.values()))
+        if feedback:
+            stage.feedback.put(item)
+        else:
+            stage.inbox.put(item)
+
+    def work(self, stage):
+        order = list(self.stages)
+        while True:
+            if stage.limiter is not None and not stage.limiter.acquire(self.stop_event):
+                return
+            item = stage.get(self.stop_event)
+            if item is None:
+                if stage.limiter is not None:
+                    stage.limiter.release()
+                return
+            with stage.lock:
+                stage.busy += 1
+            start = time.monotonic()
+            try:
+                next_stage = stage.handler(item, stage)
+                failed = False
+            except Exception as e:
+                next_stage, failed = None, True
+                if self.on_error is not None:
+                    self.on_error(item, e)
+                else:
+                    logging.error(f"Stage {stage.name} failed: {e}")
+            finally:
+                with stage.lock:
+                    stage.busy -= 1
+                    stage.busy_seconds += time.monotonic() - start
+                if stage.limiter is not None:
+                    stage.limiter.release(time.monotonic() - start)
+            with stage.lock:
+                stage.processed += 1
+                stage.failed += int(failed)
+            if next_stage is not None:
+                # Items moving back to an earlier stage skip its bound
+                self.put(item, next_stage, feedback=order.index(next_stage) <= order.index(stage.name))
+
+    def capacity(self):
+        """
+        Returns the number of items the stages can hold at once: every queue full
+        and every worker busy.
+        """
+        return sum(stage.queue_size + stage.workers for stage in self.stages.values())
+
+    def queue_depths(self):
+        """
+        Returns the number of items waiting in front of each stage.
+        """
+        return {name: stage.depth() for name, stage in self.stages.items()}
+
+    def stats(self):
+        """
+        Returns queue depth, busy workers, item counts and utilization of each stage.
+        Utilization is busy time per worker divided by the pipeline's uptime.
+        """
+        uptime = max(time.monotonic() - self.started, 1e-9)
+        stats = {}
+        for name, stage in self.stages.items():
+            stats[name] = stage.stats()
+            stats[name]['utilization'] = round(stats[name]['utilization'] / uptime, 3)
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once their current items are done. Items still queued
+        are passed to on_error.
+        """
+        self.stop_event.set()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        for stage in self.stages.values():
+            if stage.process_pool is not None:
+                stage.process_pool.shutdown(wait=wait)
+            for pending in (stage.feedback, stage.inbox):
+                while True:
+                    try:
+                        item = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if self.on_error is not None:
+                        self.on_error(item, RuntimeError("The pipeline was shut down"))
+
+
+def render_report(final_result, context_info, output_path):
+    """
+    Lays out and writes a PDF report. Runs in a render process.
+
+    Args:
+        final_result (dict): The cleaned extractor result.
+        context_info (str): The contextual information, or None.
+        output_path (str): Where the report is written.
+
+    Returns:
+        str: The output path.
+    """
+    from file_report import FileReport
+
+    report = FileReport(final_result)
+    report.generate_pdf(output_path)
+    if context_info:
+        report.add_context_info(context_info)
+    report.finalize_pdf(output_path)
+    return output_path
+
+
+class ReportState:
+    """
+    A report job moving through the stages, with what each stage produced.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.future = Future()
+        self.blob_store = None
+        self.instance = None
+        self.improvements = 0
+        self.sample_files = []
+        self.iteration = 0
+        self.last_result = None
+        self.text_content = None
+        self.final_result = None
+        self.context_info = None
+
+
+class StagedReportPipeline:
+    """
+    Report generation split into detect, extract, improve, context and render stages.
+
+    While one file waits on the model in the improve or context stage, others are
+    being extracted or rendered. Each improvement round goes from extract to
+    improve and back, then the file moves on to context and render.
+
+    Attributes:
+        pipeline (StagedPipeline): The underlying pipeline.
+    """
+
+    def __init__(self, stage_config=None):
+        """
+        Initializes and starts the stages.
+
+        Args:
+            stage_config (dict): Per-stage overrides of DEFAULT_STAGES, such as
+                ``{'render': {'workers': 4, 'kind': 'thread'}}``.
+        """
+        config = {name: dict(settings) for name, settings in DEFAULT_STAGES.items()}
+        for name, settings in (stage_config or {}).items():
+            config[name].update(settings)
+        handlers = {DETECT: self.detect, EXTRACT: self.extract, IMPROVE: self.improve,
+                    CONTEXT: self.context, RENDER: self.render}
+        self.pipeline = StagedPipeline(
+            [Stage(name, handlers[name], **config[name]) for name in DEFAULT_STAGES],
+            on_error=self.fail)
+
+    def submit(self, job):
+        """
+        Queues a report job, blocking while the first stage is full.
+
+        Args:
+            job (ReportJob): The job.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the report path, or raises the
+            error that stopped the job (JobCancelled if it was cancelled).
+        """
+        state = ReportState(job)
+        self.pipeline.put(state)
+        return state.future
+
+    def run(self, job):
+        """
+        Runs a job through the pipeline and waits for its report.
+        """
+        return self.submit(job).result()
+
+    def capacity(self):
+        return self.pipeline.capacity()
+
+    def queue_depths(self):
+        return self.pipeline.queue_depths()
+
+    def stats(self):
+        return self.pipeline.stats()
+
+    def shutdown(self, wait=True):
+        self.pipeline.shutdown(wait=wait)
+
+    def detect(self, state, stage):
+        job = state.job
+        job.check_cancelled()
+        job.reset_method_logic()
+        state.blob_store = BlobStore()
+        state.improvements = starting_improvements(job)
+        state.sample_files = job.corpus_samples() if state.improvements else []
+        state.instance = MyClass(job.file_path, module_name=job.module_name, cancel_event=job.cancel_event,
+                                 blob_store=state.blob_store, extractor=job.extractor_version)
+        return EXTRACT
+
+    def extract(self, state, stage):
+        state.job.check_cancelled()
+        if state.iteration < state.improvements:
+            state.last_result = state.instance.dynamic_method()
+            state.text_content = state.last_result.pop('text', None)
+            return IMPROVE
+        state.final_result = finish_extraction(state.job, state.instance)
+        return CONTEXT
+
+    def improve(self, state, stage):
+        job = state.job
+        job.check_cancelled()
+        iteration = state.iteration
+        state.iteration += 1
+        improved_method = generate_improved_method(job.read_method_logic(), state.last_result, iteration,
+                                                   cancel_event=job.cancel_event, profile=state.instance.last_profile)
+        if improved_method is None:
+            logging.warning(f"No improved method returned for iteration {iteration + 1}")
+            return EXTRACT
+        try:
+            sanitized_method = prepare_method_code(improved_method)
+        except CodeValidationError as e:
+            logging.warning(f"Rejected improved method for iteration {iteration + 1}: {e}")
+            return EXTRACT
+        update_method_logic(sanitized_method, job.file_path, module_name=job.module_name,
+                            cancel_event=job.cancel_event, sample_files=state.sample_files)
+        return EXTRACT
+
+    def context(self, state, stage):
+        state.job.check_cancelled()
+        request = context_request(state.job, state.final_result, state.text_content)
+        state.context_info = generate_context_info(cancel_event=state.job.cancel_event, **request)
+        return RENDER
+
+    def render(self, state, stage):
+        job = state.job
+        data = clean_info_dict(state.final_result)
+        data_key = get_report_cache().data_key(data)
+        output_path = reuse_report(job, data_key, state.context_info)
+        if output_path is None:
+            output_path = stage.call(render_report, data, state.context_info, job.output_path)
+            get_report_cache().store(data_key, state.context_info, output_path)
+            logging.info(f"PDF report generated successfully at {output_path}")
+        self.cleanup(state)
+        state.future.set_result(output_path)
+        return None
+
+    def fail(self, state, error):
+        self.cleanup(state)
+        if not state.future.done():
+            state.future.set_exception(error)
+
+    @staticmethod
+    def cleanup(state):
+        state.job.remove_method_logic()
+        if state.blob_store is not None:
+            state.blob_store.cleanup()
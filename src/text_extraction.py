@@ -0,0 +1,332 @@
+import logging
+import multiprocessing
+import os
+import random
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.etree import ElementTree
+
+# Pages of a PDF read by one worker task
+PAGES_PER_CHUNK = 20
+
+# Slides or other parts of an Office document read by one worker task
+PARTS_PER_CHUNK = 10
+
+# Characters read from a document to sample text for context generation
+CONTEXT_TARGET_LENGTH = 50000
+
+# Characters of the sample sent to context generation
+CONTEXT_SAMPLE_LENGTH = 1000
+
+# Characters per sampled segment after the head of the text
+SAMPLE_SEGMENT_LENGTH = 200
+
+PDF = 'pdf'
+OOXML = 'ooxml'
+
+# Parts holding the text of Office documents, in reading order
+OOXML_PART_PATTERNS = {
+    '.docx': [r'word/document\.xml', r'word/(header|footer)\d*\.xml', r'word/(footnotes|endnotes)\.xml'],
+    '.pptx': [r'ppt/slides/slide\d+\.xml', r'ppt/notesSlides/notesSlide\d+\.xml'],
+}
+
+
+def document_kind(file_path):
+    """
+    Returns PDF or OOXML if the file's text can be extracted in parallel, else None.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.pdf':
+        return PDF
+    if extension in OOXML_PART_PATTERNS:
+        return OOXML
+    return None
+
+
+def part_sort_key(name):
+    # slide10.xml sorts after slide9.xml
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def split_document(file_path):
+    """
+    Splits a document into ranges that can be read independently.
+
+    Args:
+        file_path (str): A PDF, DOCX or PPTX file.
+
+    Returns:
+        list: ``(kind, spec)`` tasks in reading order. For PDF files ``spec`` is a
+        ``(first, last)`` page range; for Office documents, a tuple of part names.
+    """
+    kind = document_kind(file_path)
+    if kind == PDF:
+        from PyPDF2 import PdfReader
+
+        page_count = len(PdfReader(file_path).pages)
+        return [(PDF, (start, min(start + PAGES_PER_CHUNK, page_count)))
+                for start in range(0, page_count, PAGES_PER_CHUNK)]
+    if kind == OOXML:
+        with zipfile.ZipFile(file_path) as archive:
+            names = archive.namelist()
+        parts = []
+        for pattern in OOXML_PART_PATTERNS[os.path.splitext(file_path)[1].lower()]:
+            parts.extend(sorted((name for name in names if re.fullmatch(pattern, name)), key=part_sort_key))
+        return [(OOXML, tuple(parts[start:start + PARTS_PER_CHUNK]))
+                for start in range(0, len(parts), PARTS_PER_CHUNK)]
+    raise ValueError(f"Unsupported document type: {file_path}")
+
+
+def ooxml_part_text(archive, name):
+    """
+    Returns the text of one Office document part, one line per paragraph.
+    """
+    lines = []
+    current = []
+    with archive.open(name) as stream:
+        for event, element in ElementTree.iterparse(stream, events=('end',)):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 't' and element.text:
+                current.append(element.text)
+            elif tag == 'p':
+                if current:
+                    lines.append("".join(current))
+                current = []
+                element.clear()
+    if current:
+        lines.append("".join(current))
+    return "\n".join(lines)
+
+
+def extract_range(file_path, kind, spec, reader=None):
+    """
+    Extracts the text of one range of a document. Runs in a worker process.
+
+    Args:
+        file_path (str): The document.
+        kind (str): PDF or OOXML.
+        spec (tuple): The page range or part names from split_document.
+        reader (PdfReader): Optional open reader of the PDF, reused across ranges.
+
+    Returns:
+        str: The text of the range.
+    """
+    if kind == PDF:
+        if reader is None:
+            from PyPDF2 import PdfReader
+
+            reader = PdfReader(file_path)
+        first, last = spec
+        return "\n".join(reader.pages[number].extract_text() or "" for number in range(first, last))
+    with zipfile.ZipFile(file_path) as archive:
+        return "\n".join(ooxml_part_text(archive, name) for name in spec)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_text_pool():
+    """
+    Returns the shared process pool for text extraction, created on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Forking a process that runs many threads is unsafe, so workers are spawned
+                _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def reset_text_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_inline(file_path, tasks):
+    """
+    Yields the text of each range in this process, reusing one PDF reader.
+    """
+    reader = None
+    if tasks and tasks[0][0] == PDF:
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(file_path)
+    for kind, spec in tasks:
+        yield extract_range(file_path, kind, spec, reader)
+
+
+def iter_parallel(file_path, tasks):
+    """
+    Yields the text of each range in order, keeping a few more ranges in flight
+    than there are workers. Ranges not yet collected are cancelled when the
+    generator is closed.
+    """
+    pool = get_text_pool()
+    window = 2 * (os.cpu_count() or 1)
+    pending = []
+    next_task = 0
+    try:
+        while pending or next_task < len(tasks):
+            while next_task < len(tasks) and len(pending) < window:
+                kind, spec = tasks[next_task]
+                pending.append(pool.submit(extract_range, file_path, kind, spec))
+                next_task += 1
+            yield pending.pop(0).result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def extract_text(file_path, target_length=None, on_text=None, cancel_event=None):
+    """
+    Extracts the text of a PDF, DOCX or PPTX file, reading its page or part
+    ranges in parallel worker processes when there are several CPU cores.
+
+    Ranges are collected in reading order. Once target_length characters are
+    collected, the remaining ranges are cancelled.
+
+    Args:
+        file_path (str): The document.
+        target_length (int): Optional number of characters after which extraction stops.
+        on_text (callable): Optional ``on_text(text)`` called with each range's text, in order.
+        cancel_event (threading.Event): Optional event that stops the extraction.
+
+    Returns:
+        str: The text read, possibly cut short by target_length.
+    """
+    tasks = split_document(file_path)
+    parts = []
+    length = 0
+
+    def consume(texts):
+        nonlocal length
+        for text in texts:
+            parts.append(text)
+            length += len(text)
+            if on_text is not None:
+                on_text(text)
+            if target_length is not None and length >= target_length:
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                break
+        texts.close()
+
+    if len(tasks) > 1 and (os.cpu_count() or 1) > 1:
+        try:
+            consume(iter_parallel(file_path, tasks))
+        except BrokenProcessPool as e:
+            logging.warning(f"Text extraction workers failed, reading {file_path} in this process: {e}")
+            reset_text_pool()
+            consume(iter_inline(file_path, tasks[len(parts):]))
+    else:
+        consume(iter_inline(file_path, tasks))
+
+    if len(parts) < len(tasks):
+        logging.info(f"Stopped text extraction of {file_path} after {length} characters")
+    return "\n".join(parts)
+
+
+class TextSampler:
+    """
+    Builds a bounded sample of a text that arrives in pieces: its head, then
+    segments drawn evenly at random from the rest.
+
+    The random draw is seeded, so the same text always gives the same sample and
+    cache keys built from samples stay stable.
+
+    Attributes:
+        limit (int): Maximum length of the sample.
+        segment_length (int): Characters per sampled segment.
+    """
+
+    def __init__(self, limit=CONTEXT_SAMPLE_LENGTH, segment_length=SAMPLE_SEGMENT_LENGTH):
+        """
+        Initializes the sampler.
+
+        Args:
+            limit (int): Maximum length of the sample. Half of it goes to the head of the text.
+            segment_length (int): Characters per sampled segment.
+        """
+        self.limit = limit
+        self.segment_length = segment_length
+        self.head_length = limit // 2
+        self.slots = max((limit - self.head_length) // segment_length, 1)
+        self.head = ""
+        self.pending = ""
+        self.segments = []
+        self.seen = 0
+        self.length = 0
+        self.random = random.Random(0)
+
+    def feed(self, text):
+        """
+        Adds the next piece of the text.
+        """
+        self.length += len(text)
+        if len(self.head) < self.head_length:
+            taken = text[:self.head_length - len(self.head)]
+            self.head += taken
+            text = text[len(taken):]
+        self.pending += text
+        while len(self.pending) >= self.segment_length:
+            self.add_segment(self.pending[:self.segment_length])
+            self.pending = self.pending[self.segment_length:]
+
+    def add_segment(self, segment):
+        # Reservoir sampling keeps each segment with equal probability
+        if len(self.segments) < self.slots:
+            self.segments.append((self.seen, segment))
+        else:
+            index = self.random.randint(0, self.seen)
+            if index < self.slots:
+                self.segments[index] = (self.seen, segment)
+        self.seen += 1
+
+    def sample(self):
+        """
+        Returns the sample, with the head first and the segments in text order.
+        """
+        if self.length <= self.limit:
+            # Every segment was kept
+            return self.head + "".join(segment for _, segment in self.segments) + self.pending
+        segments = [segment for _, segment in sorted(self.segments)]
+        return (self.head + " [...] " + " [...] ".join(segments))[:self.limit]
+
+
+def sample_text(text=None, file_path=None, limit=CONTEXT_SAMPLE_LENGTH, target_length=CONTEXT_TARGET_LENGTH,
+                cancel_event=None):
+    """
+    Samples a text value, or the text of a document, for context generation.
+
+    Args:
+        text (str): A text value, or a BlobHandle of a spilled one.
+        file_path (str): A PDF, DOCX or PPTX file, read when text is None.
+        limit (int): Maximum length of the sample.
+        target_length (int): Characters of the document read before sampling stops.
+        cancel_event (threading.Event): Optional event that stops the extraction.
+
+    Returns:
+        str: The sample, or None if there is no text.
+    """
+    from result_store import BlobHandle
+
+    sampler = TextSampler(limit)
+    if isinstance(text, BlobHandle):
+        for chunk in text.iter_chunks():
+            sampler.feed(chunk.decode('utf-8', errors='ignore') if isinstance(chunk, bytes) else chunk)
+    elif text:
+        sampler.feed(str(text))
+    elif file_path and document_kind(file_path):
+        try:
+            extract_text(file_path, target_length=target_length, on_text=sampler.feed, cancel_event=cancel_event)
+        except Exception as e:
+            logging.warning(f"Could not extract text from {file_path}: {e}")
+    return sampler.sample() or None
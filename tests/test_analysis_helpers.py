@@ -0,0 +1,31 @@
+import csv
+import io
+
+import numpy as np
+import pytest
+
+from analysis_helpers import column_profiles, histogram
+
+
+def test_column_profiles_parses_numeric_strings():
+    rows = csv.reader(io.StringIO("name,size,ratio\na,10,0.5\nb,20,n/a\nc,,1e1\nd,x,inf\n"))
+    columns = {column['name']: column for column in column_profiles(rows)['columns']}
+    assert columns['name']['numeric'] == 0
+    assert columns['size']['numeric'] == 2
+    assert columns['size']['empty'] == 1
+    assert columns['size']['numeric_stats']['mean'] == 15.0
+    assert columns['ratio']['numeric'] == 2
+    assert columns['ratio']['numeric_stats']['max'] == 10.0
+
+
+def test_histogram_of_in_memory_values():
+    assert histogram([1, 2, 3, 4], bins=2) == {'edges': [1.0, 2.5, 4.0], 'counts': [2, 2]}
+    chunks = [np.array([0.0, 1.0]), np.array([2.0, 3.0])]
+    assert histogram(chunks, bins=3)['counts'] == [1, 1, 2]
+    assert histogram(np.arange(10), bins=5)['counts'] == [2] * 5
+
+
+def test_histogram_of_an_iterator_needs_a_range():
+    with pytest.raises(ValueError):
+        histogram(iter([np.arange(4)]))
+    assert histogram((np.arange(4) for _ in range(2)), bins=2, value_range=(0, 4))['counts'] == [4, 4]
@@ -0,0 +1,106 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import archive_traversal
+from archive_traversal import ArchiveTraversal, archive_info
+
+
+def zip_bytes(members, compression=zipfile.ZIP_STORED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def write_zip(path, members, compression=zipfile.ZIP_STORED):
+    path.write_bytes(zip_bytes(members, compression))
+    return str(path)
+
+
+def nested_zip(levels):
+    data = zip_bytes({'inner.txt': b'deepest text'})
+    for level in range(levels - 1, 0, -1):
+        data = zip_bytes({f'level{level}.zip': data})
+    return data
+
+
+def reasons(traversal):
+    return [reason for _, reason in traversal.skipped]
+
+
+def test_zip_bomb_member_is_skipped_by_ratio(tmp_path):
+    path = write_zip(tmp_path / 'bomb.zip', {'zeros.bin': b'\0' * (4 * 2 ** 20), 'note.txt': b'hello'},
+                     compression=zipfile.ZIP_DEFLATED)
+    traversal = ArchiveTraversal(max_workers=2)
+    members = traversal.run(path)
+    assert [member['name'] for member in members] == ['note.txt']
+    assert reasons(traversal)[0].startswith('compression ratio')
+
+
+def test_tar_bomb_is_stopped_by_ratio(tmp_path):
+    path = tmp_path / 'bomb.tar.gz'
+    with tarfile.open(path, 'w:gz') as archive:
+        for n in range(3):
+            info = tarfile.TarInfo(f'zeros{n}.bin')
+            info.size = 4 * 2 ** 20
+            archive.addfile(info, io.BytesIO(b'\0' * info.size))
+    traversal = ArchiveTraversal()
+    members = traversal.run(str(path))
+    assert len(members) < 3
+    assert any('compression ratio' in reason for reason in reasons(traversal))
+
+
+def test_nesting_stops_at_the_depth_limit(tmp_path):
+    path = tmp_path / 'nested.zip'
+    path.write_bytes(nested_zip(5))
+    traversal = ArchiveTraversal(max_depth=3)
+    names = [member['name'] for member in traversal.run(str(path))]
+    assert names == ['level1.zip', 'level1.zip/level2.zip', 'level1.zip/level2.zip/level3.zip']
+    assert reasons(traversal) == ['depth limit']
+
+    names = [member['name'] for member in ArchiveTraversal(max_depth=5).run(str(path))]
+    assert names[-1].endswith('level4.zip/inner.txt')
+
+
+def test_nested_zip_is_copied_to_a_temporary_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_traversal, 'NESTED_ZIP_MEMORY_BYTES', 16)
+    path = write_zip(tmp_path / 'outer.zip', {'inner.zip': zip_bytes({'a.txt': b'alpha', 'b.txt': b'beta'})})
+    members = ArchiveTraversal().run(path)
+    assert members[0]['members'] == 2
+    assert [member.get('text') for member in members[1:]] == ['alpha', 'beta']
+
+
+def test_nested_zip_over_the_size_limit_is_not_opened(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_traversal, 'MAX_NESTED_ZIP_BYTES', 100)
+    inner = zip_bytes({'a.txt': os.urandom(1000)})
+    members = ArchiveTraversal().run(write_zip(tmp_path / 'outer.zip', {'inner.zip': inner}))
+    assert len(members) == 1 and 'members' not in members[0]
+    assert members[0]['size'] == len(inner)
+
+
+def test_member_limit(tmp_path):
+    path = write_zip(tmp_path / 'many.zip', {f'{n}.txt': b'x' for n in range(10)})
+    traversal = ArchiveTraversal(max_members=4)
+    assert len(traversal.run(path)) == 4
+    assert reasons(traversal) == ['member limit']
+
+
+def test_total_bytes_limit(tmp_path):
+    path = write_zip(tmp_path / 'large.zip', {f'{n}.bin': os.urandom(100 * 1024) for n in range(4)})
+    traversal = ArchiveTraversal(max_total_bytes=250 * 1024, max_workers=1)
+    members = traversal.run(path)
+    assert 'total size limit' in reasons(traversal)
+    assert any(member['sha256'] is None for member in members)
+
+
+def test_archive_info_summarizes_members(tmp_path):
+    path = write_zip(tmp_path / 'docs.zip', {'a.txt': b'first text', 'b.csv': b'x,y\n1,2\n', 'c.bin': b'\x00\x01'})
+    info = archive_info(path)
+    assert info['archive_member_count'] == 3
+    assert info['archive_uncompressed_size'] == 10 + 8 + 2
+    assert '[a.txt] first text' in info['archive_text_sample']
+    assert 'archive_skipped' not in info
+
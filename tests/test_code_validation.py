@@ -0,0 +1,146 @@
+import pytest
+
+from code_validation import CodeStreamParser, StreamAborted, CodeValidationError, prepare_method_code
+
+
+def stream(text, chunk_size=7):
+    parser = CodeStreamParser()
+    for start in range(0, len(text), chunk_size):
+        if parser.feed(text[start:start + chunk_size]):
+            break
+    return parser
+
+
+def test_fenced_decorated_function():
+    answer = ("Here is the code:\n"
+              "```python\n"
+              "import functools\n"
+              "\n"
+              "@functools.lru_cache(maxsize=None)\n"
+              "def helper(path):\n"
+              "    return path\n"
+              "\n"
+              "@staticmethod\n"
+              "@functools.wraps(helper)\n"
+              "def read_file_info(instance):\n"
+              "    return {'path': helper(instance.file_path)}\n"
+              "```\n"
+              "It caches the helper.\n")
+    parser = stream(answer)
+    assert parser.complete
+    assert any(line.startswith('def read_file_info') for line in parser.code_lines)
+
+
+def test_multiline_decorator():
+    answer = ("```\n"
+              "@decorate(\n"
+              "    option=True,\n"
+              ")\n"
+              "def read_file_info(instance):\n"
+              "    return {}\n"
+              "```\n")
+    assert stream(answer).complete
+
+
+def test_unfenced_top_level_statements_are_code():
+    answer = ("import os\n"
+              "try:\n"
+              "    import magic\n"
+              "except ImportError:\n"
+              "    magic = None\n"
+              "MAX = 10\n"
+              "if magic is None:\n"
+              "    MAX = 5\n"
+              "with open(os.devnull) as handle:\n"
+              "    pass\n"
+              "\n"
+              "def read_file_info(instance):\n"
+              "    return {'path': instance.file_path}\n"
+              "\n"
+              "This reads the file type when python-magic is installed.\n")
+    parser = stream(answer)
+    assert parser.complete
+    code = "\n".join(parser.code_lines)
+    assert 'except ImportError:' in code
+    assert 'MAX = 10' in code
+    assert 'def read_file_info' in code
+    assert 'This reads' not in code
+
+
+def test_unfenced_answer_without_prose_is_not_complete():
+    parser = stream("import os\nMAX = 10\ndef read_file_info(instance):\n    return {}\n")
+    assert not parser.complete
+
+
+def test_broken_block_aborts():
+    with pytest.raises(StreamAborted):
+        stream("```\ndef helper(:\n    pass\ndef read_file_info(instance):\n    return {}\n```\n")
+
+
+def test_prose_without_code_aborts():
+    with pytest.raises(StreamAborted):
+        stream("".join(f"Sentence number {i} of the explanation.\n" for i in range(10)))
+
+
+METHOD = '''def read_file_info(instance):
+    return {'path': instance.file_path}'''
+
+
+def test_fenced_answer_with_prose():
+    answer = f"Here is the improved method:\n\n```python\n{METHOD}\n```\n\nIt returns the path."
+    assert prepare_method_code(answer) == METHOD + "\n"
+
+
+def test_fenced_answer_picks_the_block_with_the_method():
+    answer = f"```\npip install magic\n```\nThen:\n```python\nimport os\n\n{METHOD}\n```\n"
+    assert prepare_method_code(answer) == f"import os\n\n{METHOD}\n"
+
+
+def test_unfenced_answer_with_prose():
+    answer = f"Sure! This version returns the path.\nimport os\n{METHOD}\nThis keeps the method short."
+    assert prepare_method_code(answer) == f"import os\n{METHOD}\n"
+
+
+def test_example_calls_are_removed():
+    answer = (f"{METHOD}\n\nprint(read_file_info(None))\n"
+              "if __name__ == '__main__':\n    read_file_info(None)\n")
+    assert prepare_method_code(answer) == METHOD + "\n"
+
+
+def test_guarded_imports_and_constants_are_kept():
+    code = ("try:\n    import no_such_module_here\nexcept ImportError:\n    no_such_module_here = None\n"
+            f"LIMIT: int = 10\nNAMES = ['a']\n{METHOD}\n")
+    assert prepare_method_code(code) == code
+
+
+@pytest.mark.parametrize('body, message', [
+    ("    os.system('rm -rf /')", "Forbidden call to os.system()"),
+    ("    eval('1 + 1')", "Forbidden call to eval()"),
+    ("    import subprocess", "Forbidden import of subprocess"),
+    ("    from socket import socket", "Forbidden import from socket"),
+    ("    import no_such_module_here", "Module no_such_module_here on line 3 is not installed"),
+    ("    while True:\n        pass", "Unbounded 'while' loop without break"),
+])
+def test_rejected_code(body, message):
+    code = f"import os\ndef read_file_info(instance):\n{body}\n    return {{}}\n"
+    with pytest.raises(CodeValidationError) as raised:
+        prepare_method_code(code)
+    assert any(message in problem for problem in raised.value.problems)
+
+
+def test_loops_that_can_end_are_accepted():
+    code = ("def read_file_info(instance):\n    while True:\n        if instance:\n            break\n"
+            "    while 1:\n        return {}\n")
+    assert prepare_method_code(code) == code
+
+
+@pytest.mark.parametrize('answer', [
+    "",
+    "I cannot help with that.",
+    "def helper(instance):\n    return {}\n",
+    "def read_file_info():\n    return {}\n",
+    "def read_file_info(instance:\n    return {}\n",
+])
+def test_unusable_answers(answer):
+    with pytest.raises(CodeValidationError):
+        prepare_method_code(answer)
@@ -0,0 +1,16 @@
+import concurrency
+from concurrency import get_limiter, MODEL_CALLS, QUOTA
+
+
+def test_model_call_limit_ignores_latency(monkeypatch):
+    monkeypatch.setattr(concurrency, '_limiters', {})
+    limiter = get_limiter(MODEL_CALLS, initial=8, interval=0, memory_probe=None)
+    # Fast classification calls followed by slow context summaries
+    for latency in [0.2] * 5 + [6.0] * 5:
+        limiter.acquire()
+        limiter.release(latency)
+    assert limiter.limit == 8
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(1.0, QUOTA)
+    assert limiter.limit == 4
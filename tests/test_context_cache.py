@@ -0,0 +1,23 @@
+from context_cache import ContextCache, context_key
+
+
+def test_names_are_not_shared_between_files():
+    info = '{"path": "/data/invoice_001.pdf", "pages": 2}'
+    first = context_key(None, 'invoice_001.pdf', '.pdf', info)
+    second = context_key(None, 'invoice_002.pdf', '.pdf', info.replace('001', '002'))
+    assert first != second
+    assert first == context_key(None, 'invoice_001.pdf', '.pdf', '{"pages": 2, "path": "/elsewhere/invoice_001.pdf"}')
+
+
+def test_text_keys_ignore_the_name():
+    assert context_key('Quarterly  report', 'a.txt') == context_key('quarterly report\n', 'b.txt')
+
+
+def test_cache_round_trip(tmp_path):
+    cache = ContextCache(str(tmp_path), max_memory_entries=1)
+    key = context_key(None, 'invoice_001.pdf', '.pdf', '{}')
+    assert cache.get(key) is None
+    cache.put(key, "An invoice.")
+    cache.put(context_key('other', ''), "Other.")
+    assert cache.get(key) == "An invoice."
+    assert cache.stats()['hits'] == 1
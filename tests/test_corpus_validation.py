@@ -0,0 +1,60 @@
+import os
+
+from corpus_validation import ExtractorStats, CorpusReport, VALIDATED_MIN_RUNS, find_sample_files
+
+
+def report(*paths, ok=True):
+    return CorpusReport({path: {'ok': ok, 'runtime': 0.1, 'keys': 3, 'error': None} for path in paths})
+
+
+def test_own_runs_do_not_validate(tmp_path):
+    stats = ExtractorStats(str(tmp_path / 'stats.json'))
+    for _ in range(VALIDATED_MIN_RUNS + 2):
+        stats.record('abc', report('/data/own.csv'), '.csv', corpus=False)
+    assert stats.get('abc')['runs'] == VALIDATED_MIN_RUNS + 2
+    assert not stats.is_validated('abc')
+
+
+def test_repeated_corpus_files_count_once(tmp_path):
+    stats = ExtractorStats(str(tmp_path / 'stats.json'))
+    for _ in range(3):
+        stats.record('abc', report('/data/a.csv', '/data/b.csv'), '.csv')
+    assert stats.get('abc')['corpus_runs'] == 2
+    assert not stats.is_validated('abc')
+
+    stats.record('abc', report('/data/c.csv'), '.csv')
+    assert stats.is_validated('abc')
+    assert ExtractorStats(str(tmp_path / 'stats.json')).is_validated('abc')
+
+
+def test_corpus_failures_block_validation(tmp_path):
+    stats = ExtractorStats(str(tmp_path / 'stats.json'))
+    stats.record('abc', report('/data/a.csv', '/data/b.csv', '/data/c.csv'), '.csv')
+    stats.record('abc', report('/data/d.csv', ok=False), '.csv')
+    assert stats.get('abc')['corpus_success_rate'] == 0.75
+    assert not stats.is_validated('abc')
+
+
+def make_files(directory, names):
+    for name in names:
+        (directory / name).write_bytes(b'data')
+
+
+def test_sample_files_skip_reports_and_other_types(tmp_path):
+    make_files(tmp_path, ['own.pdf', 'a.pdf', 'a_report.pdf', 'own_report.pdf', 'B.PDF', 'c.txt'])
+    (tmp_path / 'folder.pdf').mkdir()
+    samples = find_sample_files(str(tmp_path / 'own.pdf'), limit=10)
+    assert [os.path.basename(path) for path in samples] == ['B.PDF', 'a.pdf']
+
+
+def test_sample_files_are_spread_over_the_directory(tmp_path):
+    make_files(tmp_path, [f'{n:02d}.csv' for n in range(20)])
+    samples = find_sample_files(str(tmp_path / 'own.csv'), limit=4)
+    assert [os.path.basename(path) for path in samples] == ['02.csv', '07.csv', '12.csv', '17.csv']
+
+
+def test_sample_files_with_few_candidates(tmp_path):
+    make_files(tmp_path, ['own.csv', 'a.csv', 'b.csv'])
+    assert len(find_sample_files(str(tmp_path / 'own.csv'), limit=4)) == 2
+    assert find_sample_files(str(tmp_path / 'own.csv'), limit=0) == []
+    assert find_sample_files(str(tmp_path / 'README'), limit=4) == []
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+import extractor_index
+from extractor_index import ExtractorIndex, FEATURE_DIM
+
+
+def vector(seed):
+    values = np.random.default_rng(seed).random(FEATURE_DIM).astype(np.float32)
+    return values / np.linalg.norm(values)
+
+
+def test_saves_append_shards(tmp_path):
+    index = ExtractorIndex(str(tmp_path))
+    index.add(vector(0), 'def read_file_info(instance):\n    return {}\n', 'a.txt')
+    index.save()
+    index.add(vector(1), 'def read_file_info(instance):\n    return {"x": 1}\n', 'b.txt')
+    index.save()
+    index.save()
+    assert len(index.shard_names()) == 2
+
+    loaded = ExtractorIndex(str(tmp_path))
+    assert len(loaded) == 2
+    assert loaded.query(vector(1))[0][1]['path'] == 'b.txt'
+
+
+def test_processes_do_not_overwrite_each_other(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractor_index, 'MAX_SHARDS', 3)
+    first, second = ExtractorIndex(str(tmp_path)), ExtractorIndex(str(tmp_path))
+    for i in range(4):
+        index = first if i % 2 else second
+        index.add(vector(i), f'def read_file_info(instance):\n    return {{"n": {i}}}\n', f'{i}.txt')
+        index.save()
+    assert os.path.exists(tmp_path / 'index.npz')
+    assert not os.path.exists(tmp_path / 'merge.lock')
+
+    loaded = ExtractorIndex(str(tmp_path))
+    assert sorted(entry['path'] for entry in loaded.entries) == ['0.txt', '1.txt', '2.txt', '3.txt']
+    for i in range(4):
+        entry = loaded.query(vector(i))[0][1]
+        assert f'"n": {i}' in loaded.extractors[entry['extractor_id']]
+
+
+def test_merge_waits_for_another_process(tmp_path):
+    index = ExtractorIndex(str(tmp_path))
+    index.add(vector(0), 'def read_file_info(instance):\n    return {}\n', 'a.txt')
+    index.save()
+    (tmp_path / 'merge.lock').write_text('')
+    index.merge()
+    assert not os.path.exists(tmp_path / 'index.npz')
+    assert len(index.shard_names()) == 1
+
+
+def test_rows_added_during_a_merge_are_kept(tmp_path, monkeypatch):
+    index = ExtractorIndex(str(tmp_path))
+    index.add(vector(0), 'def read_file_info(instance):\n    return {}\n', 'a.txt')
+    index.save()
+
+    read_saved = index.read_saved
+
+    def read_saved_while_adding(*args, **kwargs):
+        # Another job adds its row after save released the lock and before the merge reloads
+        index.add(vector(1), 'def read_file_info(instance):\n    return {"b": 1}\n', 'b.txt')
+        return read_saved(*args, **kwargs)
+
+    monkeypatch.setattr(index, 'read_saved', read_saved_while_adding)
+    index.merge()
+    monkeypatch.undo()
+    assert [entry['path'] for entry in index.entries] == ['a.txt', 'b.txt']
+    assert index.query(vector(1))[0][1]['path'] == 'b.txt'
+
+    index.save()
+    loaded = ExtractorIndex(str(tmp_path))
+    assert sorted(entry['path'] for entry in loaded.entries) == ['a.txt', 'b.txt']
+    assert '"b": 1' in loaded.extractors[loaded.query(vector(1))[0][1]['extractor_id']]
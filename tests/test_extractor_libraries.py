@@ -0,0 +1,50 @@
+import extractor_libraries
+from code_validation import is_installed
+
+
+def test_validation_never_starts_the_probe(tmp_path, monkeypatch):
+    monkeypatch.setenv('HS_FILEINFO_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(extractor_libraries, '_available', None)
+
+    def probe():
+        raise AssertionError("the probe was started")
+
+    monkeypatch.setattr(extractor_libraries, 'probe_libraries', probe)
+    assert is_installed('json')
+    assert is_installed('os.path')
+    assert not is_installed('no_such_module_here')
+    assert is_installed('numpy') == (extractor_libraries.importlib.util.find_spec('numpy') is not None)
+
+
+def test_validation_uses_an_earlier_probe(tmp_path, monkeypatch):
+    monkeypatch.setenv('HS_FILEINFO_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(extractor_libraries, '_available', None)
+    monkeypatch.setattr(extractor_libraries, 'probe_libraries', lambda: {'PIL': '1.0'})
+    extractor_libraries.available_libraries()
+    monkeypatch.setattr(extractor_libraries, '_available', None)
+    assert is_installed('PIL.Image')
+    assert not is_installed('numpy')
+
+
+def test_prompt_libraries_do_not_wait_for_the_probe(tmp_path, monkeypatch):
+    monkeypatch.setenv('HS_FILEINFO_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(extractor_libraries, '_available', None)
+    started = []
+    monkeypatch.setattr(extractor_libraries, 'start_warm_up', lambda: started.append(True))
+
+    def probe():
+        raise AssertionError("the probe ran on the calling thread")
+
+    monkeypatch.setattr(extractor_libraries, 'probe_libraries', probe)
+    known = extractor_libraries.known_libraries()
+    assert started
+    assert ('numpy' in known) == (extractor_libraries.importlib.util.find_spec('numpy') is not None)
+    assert 'no_such_module_here' not in known
+    assert set(extractor_libraries.missing_libraries(known)).isdisjoint(known)
+
+
+def test_prompt_libraries_use_a_finished_probe(tmp_path, monkeypatch):
+    monkeypatch.setenv('HS_FILEINFO_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(extractor_libraries, '_available', {'PIL': '10.0'})
+    monkeypatch.setattr(extractor_libraries, 'start_warm_up', lambda: None)
+    assert extractor_libraries.known_libraries() == {'PIL': '10.0'}
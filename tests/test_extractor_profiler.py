@@ -0,0 +1,59 @@
+import importlib
+import sys
+
+from extractor_profiler import ProfileStore, format_profile, is_slow, profile_call
+
+
+def busy_work(n):
+    return sum(i * i for i in range(n))
+
+
+def test_profile_call_returns_the_result_and_a_profile():
+    result, profile = profile_call(busy_work, 20000)
+    assert result == busy_work(20000)
+    assert profile['wall_time'] >= profile['cpu_time'] * 0.5 > 0
+    assert any('busy_work' in entry['function'] for entry in profile['hot_spots'])
+    assert not any(entry['function'].startswith('src/extractor_profiler.py') for entry in profile['hot_spots'])
+
+
+def test_allocations_of_the_extractor_come_first(tmp_path, monkeypatch):
+    (tmp_path / 'profiled_extractor.py').write_text(
+        "def read_file_info(instance):\n"
+        "    return {'path': instance, 'data': bytearray(512 * 1024)}\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module('profiled_extractor')
+    try:
+        result, profile = profile_call(module.read_file_info, 'a.bin', source_file=module.__file__)
+    finally:
+        sys.modules.pop('profiled_extractor', None)
+    assert len(result['data']) == 512 * 1024
+    first = profile['allocations'][0]
+    assert first['extractor'] and first['line'].endswith('profiled_extractor.py:2')
+    assert first['size'] >= 512 * 1024
+    assert profile['peak_memory'] >= 512 * 1024
+
+
+def test_format_profile():
+    profile = {
+        'wall_time': 1.5, 'cpu_time': 1.25, 'peak_memory': 3 * 2 ** 20,
+        'hot_spots': [{'function': 'x/ext.py:3(read_file_info)', 'calls': 1, 'self_time': 0.1,
+                       'cumulative_time': 1.4}],
+        'allocations': [{'line': 'x/ext.py:4', 'size': 2048, 'count': 2, 'extractor': True}],
+    }
+    text = format_profile(profile)
+    assert "Wall time: 1.500 s, CPU time: 1.250 s" in text
+    assert "about 3.0 MB" in text
+    assert "- x/ext.py:3(read_file_info): 1.400 s cumulative, 0.100 s own, 1 calls" in text
+    assert "- x/ext.py:4 (in read_file_info): 2.0 KB in 2 blocks" in text
+    assert is_slow(profile) and not is_slow(dict(profile, wall_time=0.1)) and not is_slow(None)
+
+
+def test_profile_store_round_trip(tmp_path):
+    _, profile = profile_call(busy_work, 100)
+    ProfileStore(str(tmp_path)).put('abc', profile, '/data/a.bin')
+
+    loaded = ProfileStore(str(tmp_path)).get('abc')
+    assert loaded['extractor_id'] == 'abc' and loaded['file_path'] == '/data/a.bin'
+    assert loaded['wall_time'] == profile['wall_time']
+    assert loaded['hot_spots'] == profile['hot_spots']
+    assert ProfileStore(str(tmp_path)).get('missing') is None
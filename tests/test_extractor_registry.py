@@ -0,0 +1,102 @@
+import extractor_registry
+from extractor_registry import ExtractorRegistry, MIN_TRIALS
+
+ACTIVE_CODE = "def read_file_info(instance):\n    return {'path': instance, 'a': 1, 'b': 2, 'c': 3}\n"
+CANDIDATE_CODE = "def read_file_info(instance):\n    return {'path': instance, 'a': 1}\n"
+
+
+def registry(tmp_path, share=0.0):
+    return ExtractorRegistry(str(tmp_path / 'registry.json'), share=share)
+
+
+def test_select_without_versions(tmp_path):
+    assert registry(tmp_path).select('.pdf', 'a.pdf') is None
+
+
+def test_publish_activates_then_adds_a_candidate(tmp_path):
+    chosen = registry(tmp_path)
+    active = chosen.publish('.pdf', ACTIVE_CODE)
+    assert chosen.select('.pdf', 'a.pdf') is active
+    assert active.method('a.pdf')['a'] == 1
+
+    candidate = chosen.publish('.pdf', CANDIDATE_CODE)
+    assert candidate is not None
+    assert chosen.slots['.pdf'].candidate is candidate
+    assert chosen.publish('.pdf', ACTIVE_CODE) is None
+
+
+def test_publish_skips_code_that_does_not_load(tmp_path):
+    chosen = registry(tmp_path)
+    assert chosen.publish('.pdf', "def read_file_info(instance):\n    return {\n") is None
+    assert chosen.publish('.pdf', "x = 1\n") is None
+    assert chosen.select('.pdf', 'a.pdf') is None
+
+
+def test_select_routes_the_candidate_share(tmp_path):
+    chosen = registry(tmp_path, share=1.0)
+    chosen.publish('.pdf', ACTIVE_CODE)
+    candidate = chosen.publish('.pdf', CANDIDATE_CODE)
+    assert chosen.select('.pdf', 'a.pdf') is candidate
+
+    chosen.share = 0.0
+    assert chosen.select('.pdf', 'a.pdf') is chosen.slots['.pdf'].active
+
+
+def test_versions_survive_a_reload(tmp_path):
+    chosen = registry(tmp_path)
+    chosen.publish('.pdf', ACTIVE_CODE)
+    chosen.publish('.pdf', CANDIDATE_CODE)
+
+    loaded = registry(tmp_path)
+    assert loaded.slots['.pdf'].active.code == ACTIVE_CODE
+    assert loaded.slots['.pdf'].candidate.code == CANDIDATE_CODE
+
+
+def test_record_counts_runs_and_failures(tmp_path):
+    chosen = registry(tmp_path)
+    version = chosen.publish('.pdf', ACTIVE_CODE)
+    chosen.record(version, 0.1, {'path': 'a.pdf', 'a': 1, 'b': ''})
+    chosen.record(version, 0.3, {'error': 'failed'})
+    chosen.record(version, 0.2, None)
+    stats = version.stats()
+    assert stats['runs'] == 3
+    assert stats['failure_rate'] == 2 / 3
+    assert stats['completeness'] == 1.0
+    assert stats['median_latency'] == 0.2
+
+
+def test_candidate_is_promoted_after_its_trials(tmp_path):
+    chosen = registry(tmp_path)
+    active = chosen.publish('.pdf', ACTIVE_CODE)
+    candidate = chosen.publish('.pdf', CANDIDATE_CODE)
+    for _ in range(MIN_TRIALS):
+        chosen.record(active, 0.1, {'a': 1})
+    for _ in range(MIN_TRIALS - 1):
+        chosen.record(candidate, 0.1, {'a': 1, 'b': 2})
+    assert chosen.slots['.pdf'].candidate is candidate
+
+    chosen.record(candidate, 0.1, {'a': 1, 'b': 2})
+    assert chosen.slots['.pdf'] == (candidate, None)
+    assert chosen.decisions[-1]['promoted']
+    assert registry(tmp_path).slots['.pdf'].active.code == CANDIDATE_CODE
+
+
+def test_worse_candidate_is_rolled_back(tmp_path):
+    chosen = registry(tmp_path)
+    active = chosen.publish('.pdf', ACTIVE_CODE)
+    candidate = chosen.publish('.pdf', CANDIDATE_CODE)
+    for _ in range(MIN_TRIALS):
+        chosen.record(active, 0.1, {'a': 1, 'b': 2, 'c': 3})
+        chosen.record(candidate, 0.1, {'a': 1})
+    assert chosen.slots['.pdf'] == (active, None)
+    assert not chosen.decisions[-1]['promoted']
+
+
+def test_slow_candidate_is_rolled_back(tmp_path):
+    chosen = registry(tmp_path)
+    active = chosen.publish('.pdf', ACTIVE_CODE)
+    candidate = chosen.publish('.pdf', CANDIDATE_CODE)
+    for _ in range(MIN_TRIALS):
+        chosen.record(active, 0.1, {'a': 1})
+        chosen.record(candidate, 0.1 * extractor_registry.LATENCY_TOLERANCE + 0.05, {'a': 1})
+    assert chosen.slots['.pdf'] == (active, None)
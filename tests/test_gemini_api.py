@@ -0,0 +1,161 @@
+import sys
+import threading
+import types
+
+import pytest
+
+import gemini_api
+import hs
+from gemini_api import GeminiAPI, ModelPool
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self, model_id, genai):
+        self.model_id = model_id
+        self.genai = genai
+
+    def generate_content(self, text, stream=False):
+        self.genai.calls.append((self.model_id, text))
+        if text == 'fail':
+            raise RuntimeError("quota exceeded")
+        if stream:
+            return iter([FakeChunk("Hello "), FakeChunk("**world**")])
+        return FakeChunk(f"{self.model_id}: {text}")
+
+
+def fake_genai():
+    """Builds a stand-in for the google.generativeai module."""
+    genai = types.ModuleType('google.generativeai')
+    genai.calls = []
+    genai.models = []
+    genai.configure = lambda api_key=None: setattr(genai, 'api_key', api_key)
+
+    def create_model(model_id):
+        model = FakeModel(model_id, genai)
+        genai.models.append(model)
+        return model
+
+    genai.GenerativeModel = create_model
+    return genai
+
+
+@pytest.fixture
+def genai(monkeypatch):
+    genai = fake_genai()
+    google = types.ModuleType('google')
+    google.generativeai = genai
+    monkeypatch.setitem(sys.modules, 'google', google)
+    monkeypatch.setitem(sys.modules, 'google.generativeai', genai)
+    return genai
+
+
+def test_load_genai_imports_the_sdk_lazily(genai):
+    assert gemini_api.load_genai() is genai
+
+
+def test_pool_reuses_one_handle_per_model():
+    created = []
+    pool = ModelPool(lambda model_id: created.append(model_id) or object())
+    first = pool.get('gemini-pro')
+    assert pool.get('gemini-pro') is first
+    assert pool.get('gemini-flash') is not first
+    pool.warm(['gemini-pro', 'gemini-ultra'])
+    assert created == ['gemini-pro', 'gemini-flash', 'gemini-ultra']
+
+    stats = pool.stats()
+    assert stats['models'] == ['gemini-flash', 'gemini-pro', 'gemini-ultra']
+    assert (stats['hits'], stats['misses']) == (2, 3)
+    assert stats['reuse_rate'] == pytest.approx(0.4)
+
+
+def test_pool_shares_handles_between_threads():
+    created = []
+    pool = ModelPool(lambda model_id: created.append(model_id) or object())
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(pool.get('gemini-pro'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert created == ['gemini-pro']
+    assert len({id(handle) for handle in handles}) == 1
+    assert pool.stats()['hits'] == 7
+
+
+def test_pool_counts_requests_errors_and_concurrency():
+    pool = ModelPool(lambda model_id: object())
+    assert pool.stats()['reuse_rate'] == 0.0
+    pool.request_started('gemini-pro')
+    pool.request_started('gemini-pro')
+    pool.request_started('gemini-flash')
+    assert pool.stats()['in_flight'] == 3
+    pool.request_finished('gemini-pro')
+    pool.request_finished('gemini-pro', failed=True)
+    pool.request_finished('gemini-flash')
+    pool.request_started('gemini-flash')
+
+    stats = pool.stats()
+    assert stats['requests'] == {'gemini-pro': 2, 'gemini-flash': 2}
+    assert stats['errors'] == {'gemini-pro': 1}
+    assert (stats['in_flight'], stats['max_in_flight']) == (1, 3)
+
+
+def test_generate_content_uses_pooled_handles(genai):
+    api = GeminiAPI(api_key='key', project_id='project')
+    assert genai.api_key == 'key'
+    assert api.generate_content("first") == "gemini-pro: first"
+    assert api.generate_content("second") == "gemini-pro: second"
+    assert api.generate_content("fail") is None
+    with pytest.raises(RuntimeError):
+        api.generate_content("fail", raise_errors=True)
+
+    stats = api.pool_stats()
+    assert len(genai.models) == 1
+    assert (stats['hits'], stats['misses']) == (3, 1)
+    assert stats['requests'] == {'gemini-pro': 4}
+    assert stats['errors'] == {'gemini-pro': 2}
+    assert stats['in_flight'] == 0
+
+
+def test_closing_a_stream_early_is_not_an_error(genai):
+    api = GeminiAPI(api_key='key', project_id='project')
+    assert api.generate_content("text", stream=True) == "Hello world"
+    stream = api.stream_content("text")
+    assert next(stream) == "Hello "
+    assert api.pool_stats()['in_flight'] == 1
+    stream.close()
+
+    stats = api.pool_stats()
+    assert stats['in_flight'] == 0
+    assert stats['errors'] == {}
+    assert stats['requests'] == {'gemini-pro': 2}
+
+
+def test_each_worker_thread_keeps_its_own_generators(genai, monkeypatch):
+    monkeypatch.setattr(hs, '_gemini', GeminiAPI(api_key='key', project_id='project'))
+    monkeypatch.setattr(hs, '_worker_state', threading.local())
+    cancel_event = threading.Event()
+
+    first = hs.get_generator('gemini-pro')
+    assert hs.get_generator('gemini-pro', cancel_event=cancel_event) is first
+    assert first.cancel_event is cancel_event
+    assert hs.get_generator('gemini-flash') is not first
+
+    others = []
+    thread = threading.Thread(target=lambda: others.append(hs.get_generator('gemini-pro')))
+    thread.start()
+    thread.join()
+    assert others[0] is not first
+    assert others[0].gemini is first.gemini
+
+    # Every generator shares the one pooled handle of its model
+    assert first.get_response("question") == "gemini-pro: question"
+    assert others[0].get_response("question") == "gemini-pro: question"
+    stats = hs.get_client_stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
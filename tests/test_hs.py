@@ -0,0 +1,72 @@
+import json
+import threading
+
+import pytest
+
+import hs
+from hs import JobCancelled, generate_context_info_batch, parse_batch_answer
+
+
+def test_parse_batch_answer_maps_ids_in_any_order():
+    answer = '```json\n{"3": "third", "1": "first", "2": "second"}\n```'
+    assert parse_batch_answer(answer, ['1', '2', '3']) == {'1': 'first', '2': 'second', '3': 'third'}
+
+
+def test_parse_batch_answer_skips_missing_empty_and_unknown_ids():
+    answer = 'Here you go: {"1": "  first  ", "2": "", "7": "stray"}'
+    assert parse_batch_answer(answer, ['1', '2', '3']) == {'1': 'first'}
+
+
+def test_parse_batch_answer_keeps_the_first_answer_of_a_duplicated_id():
+    assert parse_batch_answer('{"1": "first", "1": "again", "2": "second"}', ['1', '2']) == {
+        '1': 'first', '2': 'second'}
+    assert parse_batch_answer('{"1": "", "1": "late", "2": "second"}', ['1', '2'])['1'] == 'late'
+
+
+@pytest.mark.parametrize('answer', [None, '', 'no JSON here', '{"1": "unterminated', '["1", "2"]'])
+def test_parse_batch_answer_rejects_unusable_answers(answer):
+    assert parse_batch_answer(answer, ['1', '2']) == {}
+
+
+class FakeRouter:
+    def __init__(self, answers):
+        self.answers = list(answers)
+
+    def run(self, task, call, validate=None):
+        return self.answers.pop(0)
+
+
+def batch_requests(count):
+    return [{'text_content': f"Text of file {n}"} for n in range(count)]
+
+
+def test_missing_batch_items_fall_back_to_single_requests(monkeypatch):
+    monkeypatch.setattr(hs, 'get_router', lambda: FakeRouter([json.dumps({'2': 'second', '1': 'first'})]))
+    single = []
+    monkeypatch.setattr(hs, 'generate_context_info',
+                        lambda **request: single.append(request['text_content']) or f"single {len(single)}")
+    summaries = generate_context_info_batch(batch_requests(3), use_cache=False)
+    assert summaries == ['first', 'second', 'single 1']
+    assert single == ["Text of file 2"]
+
+
+def test_unparsable_batch_answer_falls_back_for_every_item(monkeypatch):
+    monkeypatch.setattr(hs, 'get_router', lambda: FakeRouter(['not JSON']))
+    single = []
+    monkeypatch.setattr(hs, 'generate_context_info', lambda **request: single.append(request) or "single")
+    assert generate_context_info_batch(batch_requests(2), use_cache=False) == ["single", "single"]
+    assert len(single) == 2
+
+
+def test_identical_items_share_one_answer(monkeypatch):
+    monkeypatch.setattr(hs, 'get_router', lambda: FakeRouter([json.dumps({'1': 'shared'})]))
+    requests = [{'text_content': "Same text"}, {'text_content': "Same text"}]
+    assert generate_context_info_batch(requests, use_cache=False) == ['shared', 'shared']
+
+
+def test_batches_stop_when_cancelled(monkeypatch):
+    cancel_event = threading.Event()
+    cancel_event.set()
+    monkeypatch.setattr(hs, 'get_router', lambda: FakeRouter([]))
+    with pytest.raises(JobCancelled):
+        generate_context_info_batch(batch_requests(2), cancel_event=cancel_event, use_cache=False)
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from job_spool import JobSpool, SpoolWorker, LeaseLost, DONE, FAILED, read_json
+
+
+def submit_jobs(spool, tmp_path, count):
+    job_ids = []
+    for i in range(count):
+        file_path = tmp_path / f'file_{i}.txt'
+        file_path.write_text('data')
+        job_ids.append(spool.submit(str(file_path), str(tmp_path / f'file_{i}_report.pdf'), 0))
+    return job_ids
+
+
+def test_submitter_overlaps_jobs(tmp_path):
+    spool = JobSpool(str(tmp_path / 'spool'))
+    submit_jobs(spool, tmp_path, 4)
+    running = []
+    peak = [0]
+
+    def submitter(report_job):
+        future = Future()
+        running.append(future)
+        peak[0] = max(peak[0], sum(not f.done() for f in running))
+
+        def finish():
+            time.sleep(0.05)
+            if report_job.file_path.endswith('file_3.txt'):
+                future.set_exception(RuntimeError("broken"))
+            else:
+                future.set_result(report_job.output_path)
+
+        threading.Thread(target=finish).start()
+        return future
+
+    worker = SpoolWorker(spool, poll_interval=0.01, submitter=submitter, max_in_flight=3)
+    assert worker.run(drain=True) == 4
+    assert peak[0] == 3
+    assert spool.status() == {'pending': 0, 'claimed': 0, 'done': 3, 'failed': 1}
+
+
+def test_submitter_rejects_batches(tmp_path):
+    with pytest.raises(ValueError):
+        SpoolWorker(JobSpool(str(tmp_path)), submitter=lambda job: Future(), batch_size=2)
+
+
+def test_losing_finisher_keeps_the_winners_result(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    winner, loser = JobSpool(spool_dir), JobSpool(spool_dir)
+    job_id = submit_jobs(winner, tmp_path, 1)[0]
+    winner.claim('worker-a')
+    assert winner.finish_job(job_id, FAILED, {'status': 'failed', 'by': 'a'})
+    assert not loser.finish_job(job_id, FAILED, {'status': 'failed', 'by': 'b'})
+    assert read_json(winner.result_path(FAILED, job_id))['by'] == 'a'
+    assert sorted(os.listdir(os.path.join(spool_dir, FAILED))) == [f'{job_id}.json', f'{job_id}.result.json']
+
+
+def test_claim_renew_and_complete(tmp_path):
+    spool = JobSpool(str(tmp_path / 'spool'))
+    first, second = submit_jobs(spool, tmp_path, 2)
+    first, second = sorted([first, second])
+    job = spool.claim('worker-a')
+    assert job['job_id'] == first
+    assert job['attempts'] == 1
+    assert spool.lease_holder(first) == 'worker-a'
+    spool.renew(first, 'worker-a')
+    with pytest.raises(LeaseLost):
+        spool.renew(first, 'worker-b')
+
+    spool.complete(first, 'worker-a', {'status': 'done', 'output_path': 'report.pdf'})
+    assert spool.status() == {'pending': 1, 'claimed': 0, 'done': 1, 'failed': 0}
+    assert read_json(spool.result_path(DONE, first))['output_path'] == 'report.pdf'
+    assert spool.claim('worker-a')['job_id'] == second
+    assert spool.claim('worker-a') is None
+
+
+def test_racing_claimers_get_the_job_once(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    job_ids = submit_jobs(JobSpool(spool_dir), tmp_path, 20)
+    claimed = {}
+    start = threading.Barrier(4)
+
+    def claimer(worker_id):
+        spool = JobSpool(spool_dir)
+        start.wait()
+        while True:
+            job = spool.claim(worker_id)
+            if job is None:
+                return
+            claimed.setdefault(job['job_id'], []).append(worker_id)
+
+    threads = [threading.Thread(target=claimer, args=(f'worker-{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+    assert all(len(workers) == 1 for workers in claimed.values())
+
+
+def test_expired_lease_is_requeued_and_the_old_holder_loses_it(tmp_path):
+    spool = JobSpool(str(tmp_path / 'spool'), lease_seconds=0.05)
+    job_id = submit_jobs(spool, tmp_path, 1)[0]
+    spool.claim('worker-a')
+    assert spool.requeue_expired() == []
+    time.sleep(0.1)
+    assert spool.requeue_expired() == [job_id]
+    assert spool.status()['pending'] == 1
+
+    assert spool.claim('worker-b')['attempts'] == 2
+    with pytest.raises(LeaseLost):
+        spool.complete(job_id, 'worker-a', {'status': 'done'})
+    assert spool.lease_holder(job_id) == 'worker-b'
+    assert os.listdir(tmp_path / 'spool' / DONE) == []
+
+
+def test_max_attempts_moves_the_job_to_failed(tmp_path):
+    spool = JobSpool(str(tmp_path / 'spool'), lease_seconds=0.01, max_attempts=2)
+    job_id = submit_jobs(spool, tmp_path, 1)[0]
+    for attempt in range(2):
+        spool.claim(f'worker-{attempt}')
+        time.sleep(0.02)
+        assert spool.requeue_expired() == [job_id]
+    assert spool.status() == {'pending': 0, 'claimed': 0, 'done': 0, 'failed': 1}
+    result = read_json(spool.result_path(FAILED, job_id))
+    assert result['error'] == "Worker lost 2 times"
+
+
+def test_racing_requeuers_fail_the_job_once(tmp_path):
+    spool_dir = str(tmp_path / 'spool')
+    spool = JobSpool(spool_dir, lease_seconds=0.01, max_attempts=1)
+    job_id = submit_jobs(spool, tmp_path, 1)[0]
+    spool.claim('worker-a')
+    time.sleep(0.02)
+    moved = []
+    start = threading.Barrier(4)
+
+    def requeuer():
+        other = JobSpool(spool_dir, lease_seconds=0.01, max_attempts=1)
+        start.wait()
+        moved.extend(other.requeue_expired())
+
+    threads = [threading.Thread(target=requeuer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert moved == [job_id]
+    assert sorted(os.listdir(os.path.join(spool_dir, FAILED))) == [f'{job_id}.json', f'{job_id}.result.json']
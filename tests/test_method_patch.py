@@ -0,0 +1,71 @@
+import pytest
+
+from method_patch import apply_patch, parse_patch, strip_rewrite_instructions, PatchError
+
+METHOD = """def read_file_info(instance):
+    info = {'path': instance.file_path}
+    try:
+        info['size'] = len(open(instance.file_path, 'rb').read())
+    except Exception as e:
+        info['size_error'] = str(e)
+    try:
+        info['name'] = instance.file_path.split('/')[-1]
+    except Exception as e:
+        info['name_error'] = str(e)
+    return info
+"""
+
+
+def patch(search, replace):
+    return f"<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE\n"
+
+
+def test_exact_match():
+    edits = parse_patch("Here you go:\n```\n" + patch(
+        "        info['size'] = len(open(instance.file_path, 'rb').read())\n",
+        "        import os\n        info['size'] = os.path.getsize(instance.file_path)\n") + "```\n")
+    patched = apply_patch(METHOD, edits)
+    assert "        info['size'] = os.path.getsize(instance.file_path)\n" in patched
+    assert "read()" not in patched
+
+
+def test_whitespace_tolerant_match():
+    edits = parse_patch(patch("info['name'] = instance.file_path.split('/')[-1]   \n",
+                              "import os\ninfo['name'] = os.path.basename(instance.file_path)\n"))
+    patched = apply_patch(METHOD, edits)
+    assert "        import os\n        info['name'] = os.path.basename(instance.file_path)\n" in patched
+
+
+def test_empty_search_inserts_before_the_final_return():
+    edits = parse_patch(patch("", "try:\n    info['kind'] = 'text'\nexcept Exception as e:\n    info['kind_error'] = str(e)\n"))
+    patched = apply_patch(METHOD, edits)
+    assert patched.endswith("    try:\n        info['kind'] = 'text'\n    except Exception as e:\n"
+                            "        info['kind_error'] = str(e)\n    return info\n")
+
+
+def test_missing_search_block():
+    edits = parse_patch(patch("    info['pages'] = 3\n", "    info['pages'] = 4\n"))
+    with pytest.raises(PatchError, match="not found"):
+        apply_patch(METHOD, edits)
+
+
+def test_ambiguous_search_block():
+    edits = parse_patch(patch("    except Exception as e:\n", "    except OSError as e:\n"))
+    with pytest.raises(PatchError, match="occurs 2 times"):
+        apply_patch(METHOD, edits)
+
+
+def test_answer_without_edits():
+    with pytest.raises(PatchError):
+        parse_patch(METHOD)
+
+
+def test_patch_prompt_drops_the_request_for_the_whole_method():
+    prompt = ("Current Method:\nExamples:\n" + METHOD + "=== SEPARATOR ===\n\nThe improved method must:\n\n"
+              "1. Keep the path.\n\n2. Code Execution:\n    - Return only the executable code for the new method.\n\n"
+              "Some Installed Packages you may use:\n- numpy\n\nExamples:\n\ndef read_file_info(instance):\n    pass\n")
+    stripped = strip_rewrite_instructions(prompt)
+    assert "Return only the executable code" not in stripped
+    assert "    pass" not in stripped
+    assert "1. Keep the path." in stripped and "- numpy" in stripped
+    assert stripped.startswith("Current Method:\nExamples:\n" + METHOD)
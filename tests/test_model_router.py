@@ -0,0 +1,109 @@
+from model_router import CONTEXT, CORRECTION, ModelRouter
+
+
+def make_router(**kwargs):
+    return ModelRouter(tiers=['fast', 'medium', 'strong'], **kwargs)
+
+
+def test_run_returns_the_first_valid_answer():
+    router = make_router()
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        return f"answer from {model}"
+
+    assert router.run(CONTEXT, call) == "answer from fast"
+    assert calls == ['fast']
+
+
+def test_run_escalates_when_validation_fails():
+    router = make_router()
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        return f"answer from {model}"
+
+    answer = router.run(CORRECTION, call, validate=lambda answer: answer.endswith('medium'))
+    assert answer == "answer from medium"
+    assert calls == ['fast', 'medium']
+    stats = router.get_stats()[CORRECTION]
+    assert stats['fast']['success_rate'] == 0.0
+    assert stats['medium']['success_rate'] == 1.0
+    assert 'strong' not in stats
+
+
+def test_run_escalates_on_an_empty_answer():
+    router = make_router()
+    answers = {'fast': None, 'medium': "", 'strong': "done"}
+    assert router.run(CONTEXT, answers.get) == "done"
+
+
+def test_run_returns_the_strongest_answer_when_none_is_valid():
+    router = make_router()
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        return f"answer from {model}"
+
+    assert router.run(CONTEXT, call, validate=lambda answer: False) == "answer from strong"
+    assert calls == ['fast', 'medium', 'strong']
+
+
+def test_route_by_index_sets_the_starting_tier():
+    router = make_router(routes={CORRECTION: 1})
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        return "ok"
+
+    router.run(CORRECTION, call)
+    router.run(CONTEXT, call)
+    assert calls == ['medium', 'fast']
+
+
+def test_route_by_model_id_sets_the_starting_tier():
+    router = make_router(routes={CONTEXT: 'strong'})
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        return "ok"
+
+    router.run(CONTEXT, call)
+    assert calls == ['strong']
+
+
+def test_route_beyond_the_last_tier_uses_the_strongest():
+    router = make_router(routes={CONTEXT: 5})
+    assert router.starting_tier(CONTEXT) == 2
+
+
+def test_failing_tier_is_skipped_and_probed_again():
+    router = make_router(min_calls=3, probe_interval=5)
+    started = []
+
+    def call(model):
+        started.append(model)
+        return model
+
+    def validate(answer):
+        return answer != 'fast'
+
+    # Calls 0 and 5 probe the fast tier; once it has failed three times the other calls skip it
+    starts = []
+    for _ in range(10):
+        del started[:]
+        router.run(CORRECTION, call, validate=validate)
+        starts.append(started[0])
+    assert starts == ['fast', 'fast', 'fast', 'medium', 'medium', 'fast', 'medium', 'medium', 'medium', 'medium']
+
+
+def test_failing_tier_is_not_skipped_before_min_calls():
+    router = make_router(min_calls=5)
+    for _ in range(4):
+        router.run(CORRECTION, lambda model: model, validate=lambda answer: answer != 'fast')
+    assert router.starting_tier(CORRECTION) == 0
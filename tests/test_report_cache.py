@@ -0,0 +1,73 @@
+import os
+
+import report_cache
+from report_cache import ReportCache
+
+
+def write_pdf(path, size=100):
+    path.write_bytes(b'%PDF' + b'x' * (size - 4))
+    return str(path)
+
+
+def test_data_key_depends_on_values_not_order(tmp_path):
+    cache = ReportCache(str(tmp_path / 'reports'))
+    key = cache.data_key({'path': '/a.txt', 'size': 10})
+    assert key == cache.data_key({'size': 10, 'path': '/a.txt', 'empty': ''})
+    assert key != cache.data_key({'path': '/a.txt', 'size': 11})
+
+
+def test_hit_needs_the_same_data_and_context(tmp_path):
+    cache = ReportCache(str(tmp_path / 'reports'))
+    key = cache.data_key({'path': '/a.txt', 'size': 10})
+    cache.store(key, "Context", write_pdf(tmp_path / 'rendered.pdf'))
+    assert cache.has_data(key)
+    assert not cache.has_data(cache.data_key({'path': '/b.txt'}))
+
+    output = tmp_path / 'out.pdf'
+    assert not cache.fetch(key, "Other context", str(output))
+    assert not output.exists()
+    assert cache.fetch(key, "Context", str(output))
+    assert output.read_bytes() == (tmp_path / 'rendered.pdf').read_bytes()
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_layout_version_change_misses(tmp_path, monkeypatch):
+    cache = ReportCache(str(tmp_path / 'reports'))
+    data = {'path': '/a.txt', 'size': 10}
+    key = cache.data_key(data)
+    cache.store(key, None, write_pdf(tmp_path / 'rendered.pdf'))
+
+    monkeypatch.setattr(report_cache, 'LAYOUT_VERSION', report_cache.LAYOUT_VERSION + 1)
+    new_key = cache.data_key(data)
+    assert new_key != key
+    assert not cache.has_data(new_key)
+    assert not cache.fetch(new_key, None, str(tmp_path / 'out.pdf'))
+
+
+def test_least_recently_used_reports_are_evicted(tmp_path):
+    cache = ReportCache(str(tmp_path / 'reports'), max_bytes=250)
+    keys = [cache.data_key({'path': f'/{n}.txt'}) for n in range(3)]
+    rendered = write_pdf(tmp_path / 'rendered.pdf')
+    cache.store(keys[0], None, rendered)
+    cache.store(keys[1], None, rendered)
+    assert cache.fetch(keys[0], None, str(tmp_path / 'out.pdf'))
+
+    cache.store(keys[2], None, rendered)
+    assert cache.has_data(keys[0]) and cache.has_data(keys[2])
+    assert not cache.has_data(keys[1])
+    assert cache.stats()['bytes'] == 200
+
+
+def test_size_is_read_from_disk_after_a_restart(tmp_path):
+    rendered = write_pdf(tmp_path / 'rendered.pdf')
+    first = ReportCache(str(tmp_path / 'reports'))
+    keys = [first.data_key({'path': f'/{n}.txt'}) for n in range(3)]
+    first.store(keys[0], None, rendered)
+    first.store(keys[1], None, rendered)
+    old = first.path_for(keys[0], None)
+    os.utime(old, (1, 1))
+
+    restarted = ReportCache(str(tmp_path / 'reports'), max_bytes=250)
+    restarted.store(keys[2], None, rendered)
+    assert not os.path.exists(old)
+    assert restarted.has_data(keys[1]) and restarted.has_data(keys[2])
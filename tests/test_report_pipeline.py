@@ -0,0 +1,44 @@
+import report_pipeline
+from corpus_validation import ExtractorStats
+from report_pipeline import ReportJob, batch_cancel_event, starting_improvements
+
+
+def test_index_is_asked_before_the_registry(tmp_path, monkeypatch):
+    asked = []
+    monkeypatch.setattr(report_pipeline, 'seed_from_index', lambda job: asked.append('index') or True)
+    monkeypatch.setattr(report_pipeline, 'seed_from_registry', lambda job: asked.append('registry') or True)
+    monkeypatch.setattr(ReportJob, 'read_method_logic', lambda job: "def read_file_info(instance):\n    pass\n")
+    monkeypatch.setattr(report_pipeline, 'get_extractor_stats', lambda: ExtractorStats(str(tmp_path / 'stats.json')))
+    job = ReportJob('a.pdf', 'a_report.pdf', 2)
+    assert starting_improvements(job) == 2
+    assert asked == ['index']
+
+
+def test_registry_is_the_fallback_without_an_index_match(monkeypatch):
+    asked = []
+    monkeypatch.setattr(report_pipeline, 'seed_from_index', lambda job: asked.append('index') and False)
+    monkeypatch.setattr(report_pipeline, 'seed_from_registry', lambda job: asked.append('registry') and False)
+    job = ReportJob('a.pdf', 'a_report.pdf', 2)
+    assert starting_improvements(job) == 2
+    assert asked == ['index', 'registry']
+
+
+def test_batch_is_cancelled_once_every_job_is():
+    jobs = [ReportJob(f'{n}.pdf', f'{n}_report.pdf', 1) for n in range(3)]
+    active = list(jobs)
+    event, check = batch_cancel_event(active)
+    jobs[0].cancel()
+    jobs[1].cancel()
+    assert not event.is_set()
+
+    # A job that failed no longer holds the batch back
+    active.remove(jobs[2])
+    check()
+    assert event.is_set()
+
+
+def test_batch_of_cancelled_jobs_starts_cancelled():
+    jobs = [ReportJob('a.pdf', 'a_report.pdf', 1)]
+    jobs[0].cancel()
+    event, _ = batch_cancel_event(jobs)
+    assert event.is_set()
@@ -0,0 +1,104 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from hs import MyClass
+from result_store import BlobHandle, BlobStore, BlobWriter, ResultRecord, estimate_size
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / 'blobs'))
+
+
+def test_estimate_size():
+    assert estimate_size(b'x' * 1000) == 1000
+    assert estimate_size('x' * 1000) == 1000
+    assert estimate_size(np.zeros(100, dtype=np.float64)) == 800
+    nested = {'a': ['x' * 500, b'y' * 500], 'b': 'z' * 100}
+    assert 1100 < estimate_size(nested) < 1100 + 1000
+    assert estimate_size(7) == sys.getsizeof(7)
+
+
+def test_estimate_size_stops_at_the_limit():
+    values = ['x' * 1000] * 1000
+    assert estimate_size(values) > 1000 * 1000
+    assert estimate_size(values, limit=5000) < 10000
+
+
+def test_record_spills_values_over_the_value_cap(store):
+    result = {'path': 'p' * 1000, 'small': 'abc', 'large': 'x' * 2000}
+    record = ResultRecord.from_dict(result, store, max_value_bytes=1000, max_record_bytes=10 ** 6)
+    assert isinstance(record['large'], BlobHandle)
+    assert record['small'] == 'abc'
+    assert record['path'] == 'p' * 1000
+
+
+def test_record_spills_the_largest_values_over_the_record_cap(store):
+    result = {'path': 'f', 'a': 'a' * 600, 'b': 'b' * 900, 'c': 'c' * 300}
+    record = ResultRecord.from_dict(result, store, max_value_bytes=1000, max_record_bytes=1000)
+    assert isinstance(record['b'], BlobHandle)
+    assert record['a'] == 'a' * 600 and record['c'] == 'c' * 300
+
+
+def test_handles_round_trip(store):
+    for value in (b'\x00\x01' * 300, 'text ' * 300, {'rows': [[1, 2], [3, 4]]}, np.arange(5)):
+        handle = store.spill(value)
+        expected = value.tolist() if hasattr(value, 'tolist') else value
+        assert handle.load() == expected
+        if handle.kind == 'bytes':
+            assert b''.join(handle.iter_chunks(chunk_size=7)) == value
+        else:
+            assert ''.join(handle.iter_chunks(chunk_size=7)) == handle.read_text()
+        assert len(handle) == handle.size
+        assert 'stored on disk' in str(handle)
+
+
+def test_identical_values_are_stored_once(store):
+    assert store.spill('same' * 100).path == store.spill('same' * 100).path
+    assert len(os.listdir(store.directory)) == 1
+
+
+def test_cleanup_removes_the_values(store):
+    handle = store.spill(b'x' * 100)
+    store.cleanup()
+    assert not os.path.exists(handle.path)
+    assert not os.path.exists(store.directory)
+
+
+def test_writer_streams_to_the_store(store):
+    with store.writer('text') as writer:
+        for n in range(100):
+            writer.write(f"line {n}\n")
+    handle = writer.result
+    assert isinstance(handle, BlobHandle)
+    assert handle.load() == "".join(f"line {n}\n" for n in range(100))
+    assert handle.path == store.spill(handle.load()).path
+    assert os.listdir(store.directory) == [os.path.basename(handle.path)]
+
+
+def test_writer_removes_its_file_on_error(store):
+    with pytest.raises(RuntimeError):
+        with store.writer() as writer:
+            writer.write(b'partial')
+            raise RuntimeError("extractor failed")
+    assert os.listdir(store.directory) == []
+
+
+def test_writer_without_a_store_keeps_the_value():
+    with BlobWriter(None, 'bytes') as writer:
+        writer.write(b'ab')
+        writer.write(b'cd')
+    assert writer.result == b'abcd'
+
+
+def test_instance_spills_only_large_values(store, monkeypatch):
+    import result_store
+
+    monkeypatch.setattr(result_store, 'DEFAULT_MAX_VALUE_BYTES', 100)
+    instance = MyClass('data.bin', blob_store=store, profile=False)
+    assert instance.spill('small') == 'small'
+    assert isinstance(instance.spill('x' * 1000), BlobHandle)
+    assert MyClass('data.bin', profile=False).spill('x' * 1000) == 'x' * 1000
@@ -0,0 +1,138 @@
+import errno
+import random
+import sys
+
+import pytest
+
+import retry_policy
+from hs import MyClass
+from retry_policy import (classify_error, RetryPolicy, ValidationError, DeadlineExceeded, remaining_time,
+                          TRANSIENT_IO, QUOTA, EXTRACTOR_BUG, VALIDATION_FAILURE)
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+@pytest.mark.parametrize('error, error_class', [
+    (ValidationError("missing key 'path'"), VALIDATION_FAILURE),
+    (ResourceExhausted("slow down"), QUOTA),
+    (RuntimeError("HTTP 429 from the API"), QUOTA),
+    (RuntimeError("Quota exceeded for requests"), QUOTA),
+    (ServiceUnavailable("try again"), TRANSIENT_IO),
+    (TimeoutError(), TRANSIENT_IO),
+    (ConnectionResetError(), TRANSIENT_IO),
+    (BlockingIOError(), TRANSIENT_IO),
+    (OSError(errno.EBUSY, "Device or resource busy"), TRANSIENT_IO),
+    (PermissionError(errno.EACCES, "Permission denied"), EXTRACTOR_BUG),
+    (FileNotFoundError(errno.ENOENT, "No such file"), EXTRACTOR_BUG),
+    (KeyError('size'), EXTRACTOR_BUG),
+    (ZeroDivisionError(), EXTRACTOR_BUG),
+])
+def test_classify_error(error, error_class):
+    assert classify_error(error) == error_class
+
+
+def test_windows_sharing_violation_is_transient():
+    error = OSError(errno.EACCES, "The process cannot access the file")
+    error.winerror = 32
+    assert classify_error(error) == TRANSIENT_IO
+
+
+def test_backoff_bounds_with_seeded_jitter():
+    policy = RetryPolicy(max_delay=5.0, rng=random.Random(42))
+    for attempt in range(8):
+        ceiling = min(5.0, 0.25 * 2 ** attempt)
+        for _ in range(50):
+            assert ceiling / 2 <= policy.backoff_delay(TRANSIENT_IO, attempt) <= ceiling
+    for attempt in range(3, 8):
+        assert 2.5 <= policy.backoff_delay(QUOTA, attempt) <= 5.0
+    assert policy.backoff_delay(EXTRACTOR_BUG, 0) == 0.0
+
+
+def test_seeded_jitter_is_reproducible():
+    first = RetryPolicy(rng=random.Random(7))
+    second = RetryPolicy(rng=random.Random(7))
+    assert [first.backoff_delay(QUOTA, n) for n in range(5)] == [second.backoff_delay(QUOTA, n) for n in range(5)]
+
+
+def test_retry_limits():
+    policy = RetryPolicy(max_retries={QUOTA: 2})
+    assert [policy.should_backoff(QUOTA, n) for n in range(3)] == [True, True, False]
+    assert policy.should_backoff(TRANSIENT_IO, 3)
+    assert not policy.should_backoff(TRANSIENT_IO, 4)
+    assert not policy.should_backoff(EXTRACTOR_BUG, 0)
+    assert not policy.should_backoff(VALIDATION_FAILURE, 0)
+
+
+def test_deadline():
+    policy = RetryPolicy(file_deadline=10.0)
+    assert 9.0 < remaining_time(policy.deadline()) <= 10.0
+    assert remaining_time(None) == float('inf')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+FIXED_CODE = "def read_file_info(instance):\n    return {'path': instance.file_path}\n"
+
+
+def slow_failing_instance(tmp_path, monkeypatch, module_name, policy):
+    clock = FakeClock()
+    monkeypatch.setattr(retry_policy, 'time', clock)
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / f'{module_name}.py').write_text(
+        "def read_file_info(instance):\n    instance.clock.advance(1000)\n    raise KeyError('size')\n")
+
+    instance = MyClass(str(tmp_path / 'data.bin'), module_name=module_name, retry_policy=policy,
+                       profile=False, traverse_archives=False)
+    instance.clock = clock
+    instance.corrections = []
+
+    def correct_method_code(method_name, method, error):
+        instance.corrections.append(str(error))
+        return FIXED_CODE
+
+    monkeypatch.setattr(instance, 'correct_method_code', correct_method_code)
+    monkeypatch.setattr(instance, 'apply_corrected_method',
+                        lambda name, code: (tmp_path / f'{name}.py').write_text(code))
+    monkeypatch.delitem(sys.modules, module_name, raising=False)
+    return instance
+
+
+def test_late_error_in_a_long_job_is_corrected(tmp_path, monkeypatch):
+    instance = slow_failing_instance(tmp_path, monkeypatch, 'late_error_logic', RetryPolicy(file_deadline=300.0))
+    # The job has already run well past the file deadline before its first error
+    instance.clock.advance(5000)
+    assert instance.dynamic_method()['path'] == instance.file_path
+    assert instance.corrections == ["'size'"]
+
+
+def test_deadline_restarts_on_each_call(tmp_path, monkeypatch):
+    instance = slow_failing_instance(tmp_path, monkeypatch, 'restarted_deadline_logic',
+                                     RetryPolicy(file_deadline=300.0))
+    instance.dynamic_method()
+    (tmp_path / 'restarted_deadline_logic.py').write_text(
+        "def read_file_info(instance):\n    instance.clock.advance(1000)\n    raise KeyError('size')\n")
+    assert instance.dynamic_method()['path'] == instance.file_path
+    assert len(instance.corrections) == 2
+
+
+def test_deadline_still_stops_retries(tmp_path, monkeypatch):
+    instance = slow_failing_instance(tmp_path, monkeypatch, 'expired_deadline_logic', RetryPolicy(file_deadline=0.0))
+    with pytest.raises(DeadlineExceeded):
+        instance.dynamic_method()
+    assert instance.corrections == []
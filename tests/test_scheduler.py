@@ -0,0 +1,80 @@
+import time
+
+from job_spool import JobSpool, SpoolWorker
+from scheduler import JobScheduler, LatencyHistory, LONGEST_FIRST, SHORTEST_FIRST, FIFO
+
+
+def job(job_id, file_type, size, submitted=None):
+    return {'job_id': job_id, 'file_path': f'/data/{job_id}{file_type}', 'file_type': file_type,
+            'size': size, 'submitted': submitted or time.time()}
+
+
+def scheduler(tmp_path, policy, **kwargs):
+    return JobScheduler(policy=policy, history=LatencyHistory(str(tmp_path / 'latency.json')), **kwargs)
+
+
+def test_longest_first(tmp_path):
+    jobs = [job('small', '.txt', 1000), job('large', '.txt', 500 * 2 ** 20), job('medium', '.txt', 20 * 2 ** 20)]
+    order = scheduler(tmp_path, LONGEST_FIRST).order(jobs)
+    assert [item['job_id'] for item in order] == ['large', 'medium', 'small']
+
+
+def test_history_changes_the_order(tmp_path):
+    chosen = scheduler(tmp_path, LONGEST_FIRST)
+    for _ in range(3):
+        chosen.history.record('.wav', 2 ** 20, 300.0)
+        chosen.history.record('.txt', 2 ** 20, 1.0)
+    order = chosen.order([job('text', '.txt', 2 ** 20), job('audio', '.wav', 2 ** 20)])
+    assert [item['job_id'] for item in order] == ['audio', 'text']
+
+
+def test_shortest_first_with_aging(tmp_path):
+    now = time.time()
+    jobs = [job('large', '.txt', 500 * 2 ** 20, now - 10), job('small', '.txt', 1000, now - 5),
+            job('old_large', '.txt', 400 * 2 ** 20, now - 7200), job('medium', '.txt', 20 * 2 ** 20, now)]
+    order = scheduler(tmp_path, SHORTEST_FIRST, max_wait=3600).order(jobs, now=now)
+    assert [item['job_id'] for item in order] == ['old_large', 'small', 'medium', 'large']
+
+
+def test_fifo(tmp_path):
+    jobs = [job('second', '.txt', 1000, 2.0), job('first', '.txt', 10 ** 9, 1.0)]
+    assert [item['job_id'] for item in scheduler(tmp_path, FIFO).order(jobs)] == ['first', 'second']
+
+
+def test_type_limits(tmp_path):
+    chosen = scheduler(tmp_path, LONGEST_FIRST, type_limits={'video': 1, '.pdf': 2})
+    jobs = [job('movie', '.mp4', 10 ** 9), job('clip', '.mov', 10 ** 8), job('doc', '.pdf', 10 ** 7)]
+    claim = {item['job_id']: item for item in jobs}.get
+
+    first = chosen.acquire(jobs, claim)
+    assert first['job_id'] == 'movie'
+    # Another video waits for the family's slot
+    assert chosen.acquire(jobs[1:], claim)['job_id'] == 'doc'
+    assert chosen.acquire(jobs[1:2], claim) is None
+    chosen.release(first, 12.0)
+    assert chosen.acquire(jobs[1:2], claim)['job_id'] == 'clip'
+
+
+def test_lost_claim_gives_the_slot_back(tmp_path):
+    chosen = scheduler(tmp_path, LONGEST_FIRST, type_limits={'.pdf': 1})
+    jobs = [job('taken', '.pdf', 10 ** 7), job('free', '.pdf', 10 ** 6)]
+    claimed = chosen.acquire(jobs, lambda job_id: None if job_id == 'taken' else {'job_id': job_id})
+    assert claimed == {'job_id': 'free'}
+
+
+def test_batches_respect_type_limits(tmp_path):
+    spool = JobSpool(str(tmp_path / 'spool'))
+    for i in range(4):
+        path = tmp_path / f'doc_{i}.pdf'
+        path.write_bytes(b'%PDF-1.4')
+        spool.submit(str(path), str(tmp_path / f'doc_{i}_report.pdf'), 1)
+    chosen = scheduler(tmp_path, FIFO, type_limits={'.pdf': 2})
+    worker = SpoolWorker(spool, scheduler=chosen, batch_size=4)
+
+    batch = worker.claim_batch(worker.claim_next())
+    assert len(batch) == 2
+    assert chosen.running == {'.pdf': 2}
+    assert spool.status()['pending'] == 2
+    for claimed in batch:
+        chosen.release(claimed)
+    assert chosen.running == {'.pdf': 0}
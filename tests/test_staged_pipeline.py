@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import staged_pipeline
+from report_cache import ReportCache
+from report_pipeline import ReportJob
+from staged_pipeline import Stage, StagedPipeline, StagedReportPipeline
+
+# Calls of failing_render made in this process
+inline_calls = []
+
+
+def child_pid():
+    return os.getpid()
+
+
+def failing_render(value):
+    inline_calls.append(value)
+    raise TypeError("cannot pickle the layout, said the render code")
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_items_keep_their_order_through_single_worker_stages():
+    done = []
+    first = Stage('first', lambda item, stage: 'second', queue_size=2)
+    second = Stage('second', lambda item, stage: done.append(item), queue_size=2)
+    pipeline = StagedPipeline([first, second])
+    try:
+        for item in range(20):
+            pipeline.put(item)
+        wait_for(lambda: len(done) == 20)
+    finally:
+        pipeline.shutdown()
+    assert done == list(range(20))
+    assert pipeline.stats()['first']['processed'] == 20
+
+
+def test_feedback_loops_do_not_deadlock_on_full_queues():
+    rounds = {}
+    done = []
+
+    def extract(item, stage):
+        if rounds.get(item, 0) < 3:
+            return 'improve'
+        return 'finish'
+
+    def improve(item, stage):
+        rounds[item] = rounds.get(item, 0) + 1
+        return 'extract'
+
+    pipeline = StagedPipeline([Stage('extract', extract, queue_size=1), Stage('improve', improve, queue_size=1),
+                               Stage('finish', lambda item, stage: done.append(item), queue_size=1)])
+    try:
+        for item in range(10):
+            pipeline.put(item)
+        wait_for(lambda: len(done) == 10)
+    finally:
+        pipeline.shutdown()
+    assert sorted(done) == list(range(10))
+    assert set(rounds.values()) == {3}
+    assert pipeline.stats()['extract']['processed'] == 40
+
+
+def test_capacity_counts_queues_and_workers():
+    pipeline = StagedPipeline([Stage('a', lambda item, stage: None, workers=2, queue_size=3),
+                               Stage('b', lambda item, stage: None, workers=1, queue_size=4)])
+    pipeline.shutdown()
+    assert pipeline.capacity() == 10
+
+
+def test_handler_errors_go_to_on_error():
+    errors = []
+
+    def handler(item, stage):
+        if item % 2:
+            raise ValueError(item)
+
+    pipeline = StagedPipeline([Stage('only', handler)], on_error=lambda item, error: errors.append((item, error)))
+    try:
+        for item in range(4):
+            pipeline.put(item)
+        wait_for(lambda: pipeline.stats()['only']['processed'] == 4)
+    finally:
+        pipeline.shutdown()
+    assert [item for item, _ in errors] == [1, 3]
+    assert pipeline.stats()['only']['failed'] == 2
+
+
+def test_shutdown_passes_queued_items_to_on_error():
+    gate = threading.Event()
+    finished = []
+    errors = []
+
+    def handler(item, stage):
+        gate.wait()
+        finished.append(item)
+
+    pipeline = StagedPipeline([Stage('only', handler, queue_size=4)], on_error=lambda item, error: errors.append(item))
+    for item in range(3):
+        pipeline.put(item)
+    wait_for(lambda: pipeline.stats()['only']['busy'] == 1)
+    pipeline.stop_event.set()
+    gate.set()
+    pipeline.shutdown()
+    assert finished == [0]
+    assert sorted(errors) == [1, 2]
+
+
+@pytest.fixture(scope='module')
+def process_stage():
+    stage = Stage('render', None, kind=staged_pipeline.PROCESS)
+    stage.process_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    yield stage
+    stage.process_pool.shutdown()
+
+
+def test_stage_call_runs_in_a_process(process_stage):
+    assert process_stage.call(child_pid) != os.getpid()
+
+
+def test_stage_call_runs_unpicklable_work_inline(process_stage):
+    parent = os.getpid()
+    assert process_stage.call(lambda: os.getpid()) == parent
+    assert process_stage.call(lambda lock: os.getpid(), threading.Lock()) == parent
+
+
+def test_stage_call_does_not_rerun_errors_of_the_call(process_stage):
+    del inline_calls[:]
+    with pytest.raises(TypeError):
+        process_stage.call(failing_render, 'data')
+    assert inline_calls == []
+
+
+IMPROVED_CODE = "def read_file_info(instance):\n    return {'path': instance.file_path, 'improved': True}\n"
+
+
+def test_report_pipeline_runs_a_job_through_every_stage(tmp_path, monkeypatch):
+    improvements = []
+    contexts = []
+    monkeypatch.setattr(staged_pipeline, 'get_report_cache', lambda: ReportCache(str(tmp_path / 'reports')))
+    monkeypatch.setattr('report_cache.get_report_cache', lambda: ReportCache(str(tmp_path / 'reports')))
+
+    def generate_improved_method(current_method, last_result, iteration, **kwargs):
+        improvements.append(last_result)
+        return IMPROVED_CODE
+
+    def generate_context_info(**request):
+        contexts.append(request)
+        return "Some context"
+
+    monkeypatch.setattr(staged_pipeline, 'generate_improved_method', generate_improved_method)
+    monkeypatch.setattr(staged_pipeline, 'generate_context_info', generate_context_info)
+
+    (tmp_path / 'notes.txt').write_text("hello")
+    job = ReportJob(str(tmp_path / 'notes.txt'), str(tmp_path / 'notes_report.pdf'), 1,
+                    reuse_extractors=False, validation_samples=0)
+    pipeline = StagedReportPipeline({staged_pipeline.RENDER: {'kind': staged_pipeline.THREAD, 'workers': 1}})
+    try:
+        output_path = pipeline.submit(job).result(timeout=60)
+    finally:
+        pipeline.shutdown()
+    assert output_path == job.output_path and os.path.getsize(output_path) > 0
+    assert len(improvements) == 1 and 'improved' not in improvements[0]
+    assert len(contexts) == 1
+    assert not os.path.exists(job.method_logic_path)
+    assert pipeline.stats()[staged_pipeline.EXTRACT]['processed'] == 2
+
+
+def test_report_pipeline_fails_cancelled_jobs(tmp_path):
+    from hs import JobCancelled
+
+    job = ReportJob(str(tmp_path / 'notes.txt'), str(tmp_path / 'notes_report.pdf'), 1, reuse_extractors=False)
+    job.cancel()
+    pipeline = StagedReportPipeline({staged_pipeline.RENDER: {'kind': staged_pipeline.THREAD, 'workers': 1}})
+    try:
+        with pytest.raises(JobCancelled):
+            pipeline.submit(job).result(timeout=10)
+    finally:
+        pipeline.shutdown()
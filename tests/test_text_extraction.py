@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PyPDF2 import PdfWriter
+
+import text_extraction
+from text_extraction import OOXML, PDF, TextSampler, extract_text, sample_text, split_document
+
+SLIDE = ('<p:sld xmlns:p="p" xmlns:a="a"><p:txBody><a:p><a:r><a:t>{}</a:t></a:r></a:p>'
+         '<a:p><a:r><a:t>second line</a:t></a:r></a:p></p:txBody></p:sld>')
+
+
+def write_pdf(path, pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(100, 100)
+    with open(path, 'wb') as file:
+        writer.write(file)
+    return str(path)
+
+
+def write_pptx(path, slides):
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        for number in range(slides, 0, -1):
+            archive.writestr(f'ppt/slides/slide{number}.xml', SLIDE.format(f'Slide {number}'))
+        archive.writestr('ppt/notesSlides/notesSlide1.xml', SLIDE.format('Notes 1'))
+    return str(path)
+
+
+def test_pdf_is_split_into_page_ranges(tmp_path):
+    path = write_pdf(tmp_path / 'doc.pdf', 45)
+    assert split_document(path) == [(PDF, (0, 20)), (PDF, (20, 40)), (PDF, (40, 45))]
+
+
+def test_office_parts_are_split_in_reading_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_extraction, 'PARTS_PER_CHUNK', 5)
+    tasks = split_document(write_pptx(tmp_path / 'deck.pptx', 11))
+    parts = [name for _, spec in tasks for name in spec]
+    assert [len(spec) for _, spec in tasks] == [5, 5, 2]
+    assert all(kind == OOXML for kind, _ in tasks)
+    assert parts == [f'ppt/slides/slide{n}.xml' for n in range(1, 12)] + ['ppt/notesSlides/notesSlide1.xml']
+
+
+def test_unsupported_documents_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        split_document(str(tmp_path / 'notes.txt'))
+
+
+def test_parallel_ranges_are_reassembled_in_order(tmp_path, monkeypatch):
+    tasks = [(OOXML, (str(n),)) for n in range(8)]
+    monkeypatch.setattr(text_extraction, 'split_document', lambda file_path: tasks)
+    monkeypatch.setattr(text_extraction.os, 'cpu_count', lambda: 4)
+    pool = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(text_extraction, 'get_text_pool', lambda: pool)
+
+    def extract_range(file_path, kind, spec, reader=None):
+        # Later ranges finish first
+        time.sleep(0.005 * (8 - int(spec[0])))
+        return f"range {spec[0]}"
+
+    monkeypatch.setattr(text_extraction, 'extract_range', extract_range)
+    seen = []
+    try:
+        text = extract_text('doc.pptx', on_text=seen.append)
+    finally:
+        pool.shutdown()
+    assert text == "\n".join(f"range {n}" for n in range(8))
+    assert seen == [f"range {n}" for n in range(8)]
+
+
+def test_extraction_stops_at_the_target_length(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_extraction, 'PARTS_PER_CHUNK', 2)
+    monkeypatch.setattr(text_extraction.os, 'cpu_count', lambda: 1)
+    read = []
+    extract_range = text_extraction.extract_range
+    monkeypatch.setattr(text_extraction, 'extract_range',
+                        lambda *args: read.append(args[2]) or extract_range(*args))
+    path = write_pptx(tmp_path / 'deck.pptx', 10)
+    text = extract_text(path, target_length=50)
+    assert len(read) == 2
+    assert text.splitlines()[0] == 'Slide 1'
+    assert 'Slide 4' in text and 'Slide 5' not in text
+
+
+def test_extraction_stops_when_cancelled(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_extraction, 'PARTS_PER_CHUNK', 1)
+    monkeypatch.setattr(text_extraction.os, 'cpu_count', lambda: 1)
+    cancel_event = threading.Event()
+    text = extract_text(write_pptx(tmp_path / 'deck.pptx', 5), on_text=lambda text: cancel_event.set(),
+                        cancel_event=cancel_event)
+    assert text == "Slide 1\nsecond line"
+
+
+def test_broken_pool_falls_back_to_this_process(tmp_path, monkeypatch):
+    class BrokenPool:
+        def submit(self, *args):
+            future = Future()
+            future.set_exception(BrokenProcessPool("worker died"))
+            return future
+
+    monkeypatch.setattr(text_extraction, 'PARTS_PER_CHUNK', 1)
+    monkeypatch.setattr(text_extraction.os, 'cpu_count', lambda: 2)
+    monkeypatch.setattr(text_extraction, 'get_text_pool', lambda: BrokenPool())
+    monkeypatch.setattr(text_extraction, 'reset_text_pool', lambda: None)
+    text = extract_text(write_pptx(tmp_path / 'deck.pptx', 3))
+    assert text.count('Slide') == 3
+
+
+def long_text(length, seed=1):
+    rng = random.Random(seed)
+    return "".join(rng.choice("abcdefgh ") for _ in range(length))
+
+
+def test_sampler_output_is_bounded():
+    sampler = TextSampler(limit=1000, segment_length=100)
+    text = long_text(200000)
+    for start in range(0, len(text), 777):
+        sampler.feed(text[start:start + 777])
+    sample = sampler.sample()
+    assert len(sample) <= 1000
+    assert sample.startswith(text[:500])
+    assert len(sampler.segments) == 5
+
+
+def test_sampler_is_deterministic_and_independent_of_chunking():
+    text = long_text(50000)
+    whole = TextSampler(limit=1000, segment_length=100)
+    whole.feed(text)
+    pieces = TextSampler(limit=1000, segment_length=100)
+    for start in range(0, len(text), 333):
+        pieces.feed(text[start:start + 333])
+    assert whole.sample() == pieces.sample()
+
+    positions = [position for position, _ in sorted(whole.segments)]
+    segments = whole.sample()[500:].split(" [...] ")[1:]
+    assert [text.index(segment, 500) for segment in segments[:-1]] == [
+        500 + 100 * position for position in positions[:len(segments) - 1]]
+
+
+def test_short_text_is_kept_whole():
+    assert sample_text("A short text.") == "A short text."
+    assert sample_text("") is None